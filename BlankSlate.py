@@ -1,8 +1,8 @@
 # Import necessary libraries
-import requests
 import json
 import time
 import socket
+from sdrangel_client import get_client
 
 
 # USER-INPUT
@@ -26,42 +26,48 @@ class BlankSlate:
         self.rotator_host = rotator_host
         self.rotator_port = rotator_port
         self.base_url = f"http://{host}:{port}"
+        self.client = get_client(host, port)
     
     def get_urls(self):
         '''
         Method to define necessary URL's to connect to SDRangel REST API information. 
         '''
-        radio_astronomy_index, rotator_index = self.get_device_settings()
+        deviceset_index, radio_astronomy_index, rotator_index = self.get_device_settings()
 
         # accessing and editing rotator settings, such as position and offset
         rotator_settings_url = f"{self.base_url}/sdrangel/featureset/feature/{rotator_index}/settings"
         # accessing radio astronomy feature plugin, for calculating integration time
-        astronomy_settings_url = f"{self.base_url}/sdrangel/deviceset/0/channel/{radio_astronomy_index}/settings"
+        astronomy_settings_url = f"{self.base_url}/sdrangel/deviceset/{deviceset_index}/channel/{radio_astronomy_index}/settings"
         # action on radio astronomy plugin, for starting a scan
-        astronomy_action_url = f"{self.base_url}/sdrangel/deviceset/0/channel/{radio_astronomy_index}/actions"
+        astronomy_action_url = f"{self.base_url}/sdrangel/deviceset/{deviceset_index}/channel/{radio_astronomy_index}/actions"
 
         return rotator_settings_url, astronomy_settings_url, astronomy_action_url
+
+    def get_device_settings(self):
+        '''
+        Method to look up where the Radio Astronomy channel and Rotator Controller feature ended up, using the topology
+        cached on the shared client.
+        '''
+        topology = self.client.topology
+        deviceset_index, radio_astronomy_index = topology.find_channel("Radio Astronomy", "RadioAstronomy")
+        rotator_index = topology.find_feature("Rotator Controller", "GS232Controller")
+        return deviceset_index, radio_astronomy_index, rotator_index
     
     def add_device(self, display_name, index):
-        url = f"{self.base_url}/sdrangel/devices?direction=0"
-        response = requests.get(url)
-        #print(response.status_code)
-        data = response.json()
-        result = next((device for device in data["devices"] if device["displayedName"] == display_name), None)
+        devices = self.client.get_devices(direction = 0)
+        result = next((device for device in devices if device["displayedName"] == display_name), None)
 
         url_1 = f"{self.base_url}/sdrangel/deviceset?direction=0"
-        yay = requests.post(url_1)
+        yay = self.client.post(url_1)
         #print(yay.status_code)
         url_2 = f"{self.base_url}/sdrangel/deviceset/{index}/device"
-        too = requests.put(url_2, json = result)
+        too = self.client.put(url_2, json = result)
+        self.client.topology.invalidate()
         #print(too.status_code)
 
     def return_names(self):
-        url = f"{self.base_url}/sdrangel/devices?direction=0"
-        response = requests.get(url)
-        #print(response.status_code)
-        data = response.json()
-        names = [item["displayedName"] for item in data.get("devices", [])]
+        devices = self.client.get_devices(direction = 0)
+        names = [item["displayedName"] for item in devices]
         return names
     
     def add_radio_astronomy(self):
@@ -124,7 +130,8 @@ class BlankSlate:
                 }
             }
         
-        requests.post(url, json = payload)
+        self.client.post(url, json = payload)
+        self.client.topology.invalidate()
 
         
 
@@ -183,8 +190,9 @@ class BlankSlate:
             }
         
         #requests.post(url_1, json = payload)
-        requests.post(url_1, json = payload_2)
-        requests.put(url_2, json= payload_2)
+        self.client.post(url_1, json = payload_2)
+        self.client.put(url_2, json= payload_2)
+        self.client.topology.invalidate()
         
 
 
@@ -243,8 +251,9 @@ class BlankSlate:
             "featureType": "GS232Controller"
         }
 
-        requests.post(set_url, json = payload)
-        requests.put(put_url, json = payload)
+        self.client.post(set_url, json = payload)
+        self.client.put(put_url, json = payload)
+        self.client.topology.invalidate()
         
         # Does not correctly set up the feature
 
@@ -10,7 +10,6 @@ given coordinates of the Star Tracker feature.
 '''
 
 # Import necessary libraries
-import requests
 import json
 import time
 import socket
@@ -24,6 +23,12 @@ from datetime import datetime, timezone
 import math
 import numpy as np
 from excomctld import altaz2hadec
+from sdrangel_client import get_client, GS232SettingsMirror
+from scan_planner import OffsetPlan, DwellOffsetTable, SIDEREAL_RATE
+from path_optimizer import order_points
+from on_the_fly import OTFRecorder, otf_rows, otf_rose
+from drift_scan import drift_park_position, fit_drift_scan
+import pandas as pd
 '''
 Local variables defined but also overwritten by GUI user input
 '''
@@ -37,15 +42,41 @@ tolerance = 0.1
 spacing = 0.1
 scan = 1
 selected = 'HA-DEC'
+refresh_cadence = 5
+reverse_api_port = 8888
+
+def start_receiver(port = reverse_api_port, address = "0.0.0.0"):
+    '''
+    Starts a reverse_api.ReverseAPIReceiver on port to pass to RotatorController(receiver = ...). Returns None if it
+    cannot be started (Flask missing or the port in use), in which case the scan polls the rotator as before.
+    '''
+    try:
+        from reverse_api import ReverseAPIReceiver
+        receiver = ReverseAPIReceiver(address, port)
+        receiver.start()
+        return receiver
+    # werkzeug exits instead of raising when the port is taken
+    except (Exception, SystemExit) as e:
+        print(f"Reverse API receiver not started, polling the rotator instead: {e}")
+        return None
 
 class RotatorController:
 
     # Intitialize the host, port, and necessary URL's for API interaction
-    def __init__(self, host, port, data_queue, grid_queue, center_queue):
+    def __init__(self, host, port, data_queue, grid_queue, center_queue, receiver = None, refresh_cadence = refresh_cadence,
+                 dwell_controller = None):
         '''
         Method to initialize an instance of the RotatorController class with pre-requisite info to connect to the 
         machine running SDRangel and access the REST API information.
 
+        An optional reverse_api.ReverseAPIReceiver (already started) lets the scan wake up as soon as SDRangel pushes a
+        report showing the rotator on target, instead of sleeping a full integration period between checks.
+
+        refresh_cadence (seconds) is how often the Az/El offsets of an HA-DEC or X-Y point are re-patched while the dish
+        integrates on it, so the offset keeps following the source. None turns this off.
+
+        An optional dwell_controller.SNRDwellController ends each dwell once the channel power is measured well enough,
+        between its minimum and maximum dwell, instead of always waiting integration_time*scan.
         '''
         self.data_queue = data_queue
         self.grid_queue = grid_queue
@@ -54,19 +85,30 @@ class RotatorController:
         self.host = host
         self.port = port
         self.base_url = f"http://{host}:{port}"
+        # Pooled keep-alive connection shared with every other controller talking to this SDRangel instance
+        self.client = get_client(host, port)
+        self.deviceset_index = 0
+        self.receiver = receiver
+        self.mirror = None
+        self.plan = None
+        self.refresh_cadence = refresh_cadence
+        self.dwell_controller = dwell_controller
     
     def get_urls(self):
         '''
-        Method to define necessary URL's to connect to SDRangel REST API information. 
+        Method to define necessary URL's to connect to SDRangel REST API information. The channel and feature indices
+        come from the topology cached on the shared client, so only the first scan against an instance (or the first
+        after the cache is invalidated) pays for the /sdrangel discovery request.
         '''
         radio_astronomy_index, rotator_index = self.get_device_settings()
+        deviceset_index = self.deviceset_index
 
         # accessing and editing rotator settings, such as position and offset
         rotator_settings_url = f"{self.base_url}/sdrangel/featureset/feature/{rotator_index}/settings"
         # accessing radio astronomy feature plugin, for calculating integration time
-        astronomy_settings_url = f"{self.base_url}/sdrangel/deviceset/0/channel/{radio_astronomy_index}/settings"
+        astronomy_settings_url = f"{self.base_url}/sdrangel/deviceset/{deviceset_index}/channel/{radio_astronomy_index}/settings"
         # action on radio astronomy plugin, for starting a scan
-        astronomy_action_url = f"{self.base_url}/sdrangel/deviceset/0/channel/{radio_astronomy_index}/actions"
+        astronomy_action_url = f"{self.base_url}/sdrangel/deviceset/{deviceset_index}/channel/{radio_astronomy_index}/actions"
 
         #star_tracker_url = f"{self.base_url}/sdrangel/featureset/feature/{star_tracker_index}/settings"
 
@@ -77,40 +119,26 @@ class RotatorController:
 
     def get_device_settings(self):
         '''
-        Method to obtain current device settings (after full setup including Rotator Controller and Radio Astronomy plugins)
-        which allows us to obtain the indices of the features or channels to complete the URL's for further REST_API access.
+        Method to obtain the indices of the Radio Astronomy channel and the Rotator Controller feature (after full setup
+        including both plugins) to complete the URL's for further REST_API access. Lookups go through the client's
+        topology cache, which fetches /sdrangel only when it is empty or has been invalidated by a 404/409.
 
         # FIXME: Create automatic setup which includes necessary devices, features, and channels from blank slate. 
-        # FIXME: Optimize code using next()
         '''
-        radio_astronomy_index = None
-        rotator_index = None
-        #star_tracker_index = None
-        device_settings_url = f"http://{self.host}:{self.port}/sdrangel"
-
+        topology = self.client.topology
         try:
-            response = requests.get(device_settings_url)
-            if response.status_code == 200:
-                data = response.json()
-                devices = data.get("devicesetlist", {}).get("deviceSets", [])
-                for device in devices:
-                    channels = device.get("channels", [])
-                    for channel in channels:
-                        if channel.get("title") == "Radio Astronomy":
-                            radio_astronomy_index = channel.get("index")
-                features = data.get("featureset", {}).get("features", [])
-                for feature in features:
-                    if feature.get("title") == "Rotator Controller":
-                        rotator_index = feature.get("index")
-                    #if feature.get("title") == "Star Tracker":
-                        #star_tracker_index = feature.get("index")
-                return radio_astronomy_index, rotator_index#, star_tracker_index
-            else:
-                print(f"Error opening device settings: {response.status_code}")
-                return None, None
+            deviceset_index, radio_astronomy_index = topology.find_channel("Radio Astronomy", "RadioAstronomy")
+            rotator_index = topology.find_feature("Rotator Controller", "GS232Controller")
         except Exception as e:
             print(f"Error opening device settings: {e}")
             return None, None
+
+        if radio_astronomy_index is None or rotator_index is None:
+            print("Error opening device settings: Radio Astronomy channel or Rotator Controller feature not found")
+            # Force a fresh discovery next time in case they are added later
+            topology.invalidate()
+        self.deviceset_index = deviceset_index if deviceset_index is not None else 0
+        return radio_astronomy_index, rotator_index#, star_tracker_index
     
     def generate_daisy_grid(self, precision, radius, num_petals, spaces):
         '''
@@ -193,7 +221,7 @@ class RotatorController:
 
     def get_coordinates(self, url):
         try:
-            response = requests.get(url)
+            response = self.client.get(url, kind = "report")
             if response.status_code == 200:
                 data = response.json()
                 currentAz = data["GS232ControllerReport"]['currentAzimuth']
@@ -217,19 +245,54 @@ class RotatorController:
         In addition, the settings and data must be returned in order to allow for augmentation of the json payload to change the
         offsets through REST API
         '''
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            azTarget = data['GS232ControllerSettings']['azimuth']
-            elTarget = data['GS232ControllerSettings']['elevation']
-            azOff = data['GS232ControllerSettings']['azimuthOffset']
-            elOff = data['GS232ControllerSettings']['elevationOffset']
-            settings = data['GS232ControllerSettings']
+        try:
+            response = self.client.get(url)
+            if response.status_code == 200:
+                data = response.json()
+                self.get_mirror(url).load(data)
+                azTarget = data['GS232ControllerSettings']['azimuth']
+                elTarget = data['GS232ControllerSettings']['elevation']
+                azOff = data['GS232ControllerSettings']['azimuthOffset']
+                elOff = data['GS232ControllerSettings']['elevationOffset']
+                settings = data['GS232ControllerSettings']
+
+                return settings, data, azTarget, elTarget, azOff, elOff
+            else:
+                print(f"Error fetching settings: {response.status_code}")
+                return None, None, None, None, None, None
 
-            return settings, data, azTarget, elTarget, azOff, elOff
-        else:
-            print(f"Error fetching settings: {response.status_code}")
-            return None
+        except Exception as e:
+            print(f"Error in fetching settings: {e}")
+            return None, None, None, None, None, None
+
+    def get_mirror(self, url):
+        '''
+        Method to return the local mirror of the Rotator Controller settings at url, creating it on first use. When a
+        reverse API receiver is attached the mirror follows its settings pushes and never needs to be read back.
+        '''
+        if self.mirror is None or self.mirror.url != url:
+            self.mirror = GS232SettingsMirror(self.client, url)
+            if self.receiver is not None:
+                self.mirror.follow(self.receiver.state)
+        return self.mirror
+
+    def read_rotator_settings(self, url, retry = 1):
+        '''
+        Method returning the same values as get_rotator_settings(), but from the local mirror when the reverse API keeps
+        it in sync. Without a receiver the Star Tracker position can only be learned with a GET, so one is made, and
+        tried again every retry seconds until it succeeds; all the values are None if the scan is cancelled first.
+        '''
+        mirror = self.get_mirror(url)
+        if not (mirror.synced and mirror.loaded):
+            result = self.get_rotator_settings(url)
+            while result[0] is None and not self.cancel_scan:
+                self.data_queue.put("Could not read the rotator settings, trying again...")
+                time.sleep(retry)
+                result = self.get_rotator_settings(url)
+            return result
+        settings = mirror.snapshot()
+        return (settings, mirror.data, settings['azimuth'], settings['elevation'],
+                settings['azimuthOffset'], settings['elevationOffset'])
         
     def calculate_integration_time(self, url):
         '''
@@ -241,7 +304,7 @@ class RotatorController:
         on target. It checks in between each scan and continues until it is on target, completing one more scan. 
         '''
         try:
-            response = requests.get(url)
+            response = self.client.get(url)
             if response.status_code == 200:
                 data = response.json()
 
@@ -351,10 +414,6 @@ class RotatorController:
         lat = 35.19909314527451
         ha_target, dec_target = altaz2hadec(targetEl_raw, targetAz_raw, lat)
 
-        print(type(dec_target))
-        print(type(ha_target))
-        print(type(DECOff))
-        print(type(HAOff))
         ha_new = ha_target + HAOff
         dec_new = dec_target + DECOff
         alt_new, az_new = self.hadec2altaz(ha_new, dec_new, lat)
@@ -368,50 +427,174 @@ class RotatorController:
         return round(az_offset, 3), round(el_offset, 3)
 
 
-    def update_offsets(self, azOff_new, elOff_new, settings, data, url):
+    def planned_offsets(self, index, coordinates, selected, targetAz_raw, targetEl_raw, seconds_per_point, read_at = None):
+        '''
+        Method to return the Az/El offsets for point index from a whole-scan plan (see scan_planner.py) instead of
+        converting one point at a time. The remaining points are replanned in one batch whenever the target is no
+        longer where the plan predicted it. seconds_per_point only covers the dwell, so a replan uses the time per point
+        measured since the last plan (from read_at, when the target was read) if that is longer, slewing included.
         '''
-        Method to update the offsets by completing a patch request to the Rotator Controller through REST API. All settings remain
-        the same, other than th elevation offset and azimuth offset. 
+        if read_at is None:
+            read_at = time.monotonic()
+        if self.plan is None or not self.plan.covers(index, targetAz_raw, targetEl_raw):
+            if self.plan is not None:
+                seconds_per_point = max(seconds_per_point, self.plan.pace(index, read_at) or 0)
+            self.plan = OffsetPlan(coordinates, selected, targetAz_raw, targetEl_raw, seconds_per_point, start = index,
+                                   read_at = read_at)
+        return self.plan[index]
+
+    def dwell(self, coord, selected, precision, targetAz_raw, targetEl_raw, target_read_at, seconds, url, power_url = None):
         '''
-        settings["azimuthOffset"] = azOff_new
-        settings["elevationOffset"] = elOff_new
+        Method to integrate on one point for the given time. For HA-DEC and X-Y points the offsets are looked up in a
+        DwellOffsetTable every refresh_cadence seconds and patched again whenever they change at the rotator precision,
+        since the Az/El offset that holds a fixed HA-DEC or X-Y offset drifts as the source moves. target_read_at is the
+        time.monotonic() value when targetAz_raw/targetEl_raw were read.
+
+        With a dwell_controller and the Radio Astronomy report URL (power_url), the channel power is read once per
+        integration and the dwell lasts as long as the controller asks for rather than the given time.
+        '''
+        start = time.monotonic()
+        deadline = start + seconds
+        controller = self.dwell_controller if power_url is not None else None
+        if controller is not None:
+            controller.reset()
+            deadline = start + controller.max_dwell
+            next_sample = start
+
+        table = None
+        if selected in ('HA-DEC', 'X-Y') and self.refresh_cadence:
+            table = DwellOffsetTable(coord, selected, targetAz_raw, targetEl_raw, start - target_read_at, deadline - start,
+                                     self.refresh_cadence)
+            mirror = self.get_mirror(url)
+            next_refresh = start + self.refresh_cadence
+
+        while not self.cancel_scan:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if table is not None and now >= next_refresh:
+                azOff, elOff = table.offset_at(now - target_read_at)
+                try:
+                    # Only keys that changed at the rotator precision are sent
+                    response = mirror.patch({"azimuthOffset": round(azOff, precision),
+                                             "elevationOffset": round(elOff, precision)})
+                    if response is not None and response.status_code != 200:
+                        print(f"Error refreshing offsets: {response.status_code}")
+                except Exception as e:
+                    print(f"Exception while refreshing offsets: {e}")
+                next_refresh += self.refresh_cadence
+            if controller is not None and now >= next_sample:
+                controller.add(self.read_channel_power(power_url))
+                if controller.done(time.monotonic() - start):
+                    break
+                next_sample += controller.sample_interval
+            time.sleep(min(0.1, max(deadline - now, 0)))
 
-        payload = {
-            "featureType": "GS232Controller",
-            "originatorFeatureSetIndex": data.get("originatorFeatureSetIndex", 0),
-            "originatorFeatureIndex": data.get("originatorFeatureIndex", 0),
-            "GS232ControllerSettings": settings
-        }
+        if controller is not None:
+            result = controller.finish(time.monotonic() - start)
+            self.data_queue.put(f"Dwell of {round(result['elapsed'], 1)} s: {result['samples']} samples, "
+                                f"SNR {round(result['snr'], 1) if np.isfinite(result['snr']) else 'n/a'}")
 
+    def recheck_rotator_settings(self, azOff, elOff, settings, data, url):
+        '''
+        Method to read the settings again when the rotator has not reached the target in time, in case the offsets or
+        the Star Tracker target were changed outside this program, and to patch the offsets back if they differ.
+        '''
         try:
-            response = requests.patch(url, json=payload)
-            if response.status_code != 200:
+            self.get_mirror(url).refresh()
+        except Exception as e:
+            print(f"Exception while refreshing settings: {e}")
+            return
+        self.update_offsets(azOff, elOff, settings, data, url)
+
+    def update_offsets(self, azOff_new, elOff_new, settings, data, url, force = False):
+        '''
+        Method to update the offsets by completing a patch request to the Rotator Controller through REST API. Only the
+        azimuthOffset and elevationOffset keys that differ from the local settings mirror are sent, and nothing is sent
+        when the rotator already has these offsets, unless force is set: the scan loops force the patch for every new
+        point, so the rotator gets its offsets even if they were changed outside this program since the last read.
+        '''
+        if settings is not None:
+            settings["azimuthOffset"] = azOff_new
+            settings["elevationOffset"] = elOff_new
+
+        mirror = self.get_mirror(url)
+        try:
+            if not mirror.loaded:
+                mirror.refresh()
+            response = mirror.patch({"azimuthOffset": azOff_new, "elevationOffset": elOff_new}, force = force)
+            if response is not None and response.status_code != 200:
                 print(f"Error updating offsets: {response.status_code}")
         except Exception as e:
             print(f"Exception while updating offsets: {e}")
 
     def set_precision(self, precision, url):
         '''
-        Method to patch the user-defined precision value to the Rotator Controller through REST API. 
+        Method to patch the user-defined precision value to the Rotator Controller through REST API. It is called when
+        every scan starts, so the settings are read here to bring the local mirror up to date with anything changed
+        outside this program; after that only the precision key is sent.
         '''
-        settings, data, _, _, _, _ = self.get_rotator_settings(url)
-        settings["precision"] = precision
-
-        payload = {
-            "featureType": "GS232Controller",
-            "originatorFeatureSetIndex": data.get("originatorFeatureSetIndex", 0),
-            "originatorFeatureIndex": data.get("originatorFeatureIndex", 0),
-            "GS232ControllerSettings": settings
-        }
-
+        mirror = self.get_mirror(url)
         try:
-            response = requests.patch(url, json=payload)
-            if response.status_code != 200:
+            mirror.refresh()
+            response = mirror.patch({"precision": precision})
+            if response is not None and response.status_code != 200:
                 print(f"Error setting precision: {response.status_code}")
         except Exception as e:
             print(f"Exception while setting precision: {e}")
 
-    def continue_raster(self, coordinates, precision, tolerance, scan, selected):
+    def enable_reverse_api(self, url):
+        '''
+        Method to point the reverse API of the Rotator Controller at the attached receiver, using the address this
+        machine reaches SDRangel from. Without a receiver nothing is sent and the scan polls the rotator instead.
+        '''
+        if self.receiver is None:
+            return
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.connect((self.host, int(self.port)))
+                address = probe.getsockname()[0]
+            rotator_index = int(url.rstrip('/').split('/')[-2])
+            mirror = self.get_mirror(url)
+            if not mirror.loaded:
+                mirror.refresh()
+            response = mirror.patch({"useReverseAPI": 1, "reverseAPIAddress": address,
+                                     "reverseAPIPort": self.receiver.port, "reverseAPIFeatureSetIndex": 0,
+                                     "reverseAPIFeatureIndex": rotator_index})
+            if response is not None and response.status_code != 200:
+                print(f"Error enabling the reverse API: {response.status_code}")
+        except Exception as e:
+            print(f"Exception while enabling the reverse API: {e}")
+
+    def start_radio_astronomy(self, url):
+        '''
+        Method to start a scan in the Radio Astronomy plugin through its actions URL.
+        '''
+        payload = {"channelType": "RadioAstronomy",  "direction": 0, "RadioAstronomyActions": { "start": {"sampleRate": 2000000} }}
+        try: 
+            response = self.client.post(url, kind = "actions", json = payload)
+            if response.status_code != 202:
+                print(f"Error starting Radio Astronomy scan: {response.status_code}")
+        except Exception as e:
+            print(f"Exception while starting Radio Astronomy scan: {e}")
+
+    def read_channel_power(self, url):
+        '''
+        Method to read the latest channel power (dB) from the Radio Astronomy report, or None.
+        '''
+        try:
+            data = self.client.get_json(url, kind = "report")
+            return data["RadioAstronomyReport"]["channelPowerDB"]
+        except Exception as e:
+            print(f"Error reading channel power: {e}")
+            return None
+
+    def continue_raster(self, coordinates, precision, tolerance, scan, selected, on_dwell = None):
+        '''
+        Method to visit every offset in coordinates (in the selected frame) and integrate on it. on_dwell, if given, is the
+        online analysis hook: after every dwell it is called as on_dwell(index, coord, power) with the channel power (dB)
+        read from the Radio Astronomy report, and the scan stops early when it returns True.
+        '''
         coord0 = 0
         coord1 = 0
         center_checked = False
@@ -419,45 +602,48 @@ class RotatorController:
         rotator_settings_url, astronomy_settings_url, astronomy_action_url, rotator_report_url = self.get_urls()
 
         self.set_precision(precision, rotator_settings_url)
+        self.enable_reverse_api(rotator_settings_url)
         integration_time = self.calculate_integration_time(astronomy_settings_url)
-        payload = {"channelType": "RadioAstronomy",  "direction": 0, "RadioAstronomyActions": { "start": {"sampleRate": 2000000} }}
-        try: 
-            response = requests.post(astronomy_action_url, json = payload)
-            if response.status_code != 202:
-                print(f"Error starting Radio Astronomy scan: {response.status_code}")
-        except Exception as e:
-            print(f"Exception while starting Radio Astronomy scan: {e}")
+        self.start_radio_astronomy(astronomy_action_url)
+        astronomy_report_url = astronomy_settings_url.rsplit("/", 1)[0] + "/report"
+        if self.dwell_controller is not None:
+            self.dwell_controller.set_integration_time(integration_time)
         
+        self.plan = None
+
         # Looping through all the coordinates in the grid
-        for coord in coordinates:
+        for index, coord in enumerate(coordinates):
             #xy = False
 
             if self.cancel_scan:
                 print("Scan Cancelled")
                 break
 
-            settings, data, targetAz_raw, targetEl_raw, azOff_raw, elOff_raw = self.get_rotator_settings(rotator_settings_url)
+            settings, data, targetAz_raw, targetEl_raw, azOff_raw, elOff_raw = self.read_rotator_settings(rotator_settings_url)
+            if settings is None:
+                print("Scan Cancelled")
+                break
+            # Where the target was, and when, for the offset refresh during the dwell
+            read_target = (targetAz_raw, targetEl_raw, time.monotonic())
             
             if not center_checked:
                 self.center_queue.put(targetAz_raw)
                 self.center_queue.put(targetEl_raw)
                 center_checked = True
 
-            if selected == 'HA-DEC':
-                coord0, coord1 = self.HA_DEC_offsets(targetAz_raw, targetEl_raw, coord[0], coord[1])
-                self.update_offsets(coord0, coord1, settings, data, rotator_settings_url)
-            elif selected == 'X-Y':
-                coord0, coord1 = self.XY_offset(targetAz_raw, targetEl_raw, coord[0], coord[1])
-                self.update_offsets(coord0, coord1, settings, data, rotator_settings_url)
-            else:
-                self.update_offsets(coord[0], coord[1], settings, data, rotator_settings_url)
+            coord0, coord1 = self.planned_offsets(index, coordinates, selected, targetAz_raw, targetEl_raw, integration_time*scan,
+                                                  read_target[2])
+            self.update_offsets(coord0, coord1, settings, data, rotator_settings_url, force = True)
         
+            mirror = self.get_mirror(rotator_settings_url)
             correct_coordinates = False
             while not correct_coordinates:
 
-                settings, data, targetAz_raw, targetEl_raw, azOff_raw, elOff_raw = self.get_rotator_settings(rotator_settings_url)
-                
-                    
+                # The offsets just patched are already in the mirror, so there is nothing to read back here
+                targetAz_raw = mirror.get('azimuth', targetAz_raw)
+                targetEl_raw = mirror.get('elevation', targetEl_raw)
+                azOff_raw = mirror.get('azimuthOffset')
+                elOff_raw = mirror.get('elevationOffset')
                 
                 if self.cancel_scan:
                     self.update_offsets(0, 0, settings, data, rotator_settings_url)
@@ -467,6 +653,7 @@ class RotatorController:
                 azOff = round(azOff_raw, precision)
                 elOff = round(elOff_raw, precision)
 
+                checked_at = time.monotonic()
                 currentAz_raw, currentEl_raw, targetAz_raw_1, targetEl_raw_1 = self.get_coordinates(rotator_report_url)
                 
                 currentAz = round(currentAz_raw,precision)
@@ -498,18 +685,245 @@ class RotatorController:
                     data_4 = "Waiting for the rotator to reach the target coordinates..."
                     self.data_queue.put(data_4)
                     
-                    time.sleep(integration_time)
+                    if self.receiver is not None:
+                        # Wake the moment a report pushed after this check shows the rotator on target
+                        on_target = self.receiver.state.wait_on_target(tolerance, integration_time, since = checked_at,
+                                                                       cancel = lambda: self.cancel_scan)
+                    else:
+                        time.sleep(integration_time)
+                        on_target = False
+                    if not on_target and not self.cancel_scan:
+                        self.recheck_rotator_settings(coord0, coord1, settings, data, rotator_settings_url)
 
             self.data_queue.put("Rotator on target, performing specified number of scans")
-            time.sleep(integration_time*scan)
+            self.dwell(coord, selected, precision, *read_target, integration_time*scan, rotator_settings_url,
+                       astronomy_report_url)
             self.grid_queue.put(coord)
+
+            if on_dwell is not None and not self.cancel_scan:
+                if on_dwell(index, coord, self.read_channel_power(astronomy_report_url)):
+                    self.data_queue.put("Stopping the scan early")
+                    break
             
 
         print("Scan is complete")
         self.update_offsets(0, 0, settings, data, rotator_settings_url)
 
 
-    def start_raster(self, grid_size, precision, tolerance, spacing, scan, selected):
+    def continue_otf(self, sweeps, precision, tolerance, lead = None, save = True):
+        '''
+        Method to run an on-the-fly scan. Each sweep is a list of Az/El offsets: the rotator is sent to the first one and
+        allowed to settle, then sent through the rest without stopping, moving on to the next offset as soon as it is
+        within lead degrees of the current one. The rotator and Radio Astronomy reports are recorded throughout by an
+        OTFRecorder and the power samples taken during sweeps are tagged with their interpolated position.
+
+        Returns the tagged samples as a DataFrame (also saved to OTF_Data_<timestamp>.csv when save is set), or None.
+        '''
+        self.cancel_scan = False
+        if lead is None:
+            lead = 3*tolerance
+        rotator_settings_url, astronomy_settings_url, astronomy_action_url, rotator_report_url = self.get_urls()
+        astronomy_report_url = astronomy_settings_url.rsplit("/", 1)[0] + "/report"
+
+        self.set_precision(precision, rotator_settings_url)
+        self.enable_reverse_api(rotator_settings_url)
+        integration_time = self.calculate_integration_time(astronomy_settings_url) or 0
+        self.start_radio_astronomy(astronomy_action_url)
+
+        settings, data, targetAz_raw, targetEl_raw, _, _ = self.read_rotator_settings(rotator_settings_url)
+        if settings is None:
+            print("Scan Cancelled")
+            return None
+        target_time = time.time()
+        self.center_queue.put(targetAz_raw)
+        self.center_queue.put(targetEl_raw)
+
+        power_rate = min(1/integration_time, 20) if integration_time else 5
+        recorder = OTFRecorder(self.client, rotator_report_url, astronomy_report_url, power_rate = power_rate)
+        cancelled = lambda: self.cancel_scan
+        recorder.start()
+        try:
+            for number, sweep in enumerate(sweeps):
+                if self.cancel_scan:
+                    print("Scan Cancelled")
+                    break
+
+                # Turnaround: samples are not kept until the rotator has settled on the start of the sweep
+                recorder.sweep = -1
+                self.data_queue.put(f"Moving to the start of sweep {number + 1} of {len(sweeps)}")
+                self.update_offsets(sweep[0][0], sweep[0][1], settings, data, rotator_settings_url)
+                commanded_at = time.time()
+                if not recorder.wait_for(commanded_at, tolerance, cancelled):
+                    continue
+
+                recorder.sweep = number
+                self.data_queue.put(f"Sweeping {sweep[0]} to {sweep[-1]}")
+                for i, waypoint in enumerate(sweep[1:]):
+                    self.update_offsets(waypoint[0], waypoint[1], settings, data, rotator_settings_url)
+                    commanded_at = time.time()
+                    last = i == len(sweep) - 2
+                    if not recorder.wait_for(commanded_at, tolerance if last else lead, cancelled):
+                        break
+                recorder.sweep = -1
+                self.grid_queue.put(sweep[-1])
+        finally:
+            recorder.stop()
+
+        print("Scan is complete")
+        self.update_offsets(0, 0, settings, data, rotator_settings_url)
+
+        df = recorder.tagged(targetAz_raw, targetEl_raw, target_time, integration_time)
+        if df is None:
+            self.data_queue.put("No power samples were recorded during the sweeps")
+            return None
+        self.data_queue.put(f"Recorded {len(df)} power samples on {len(recorder.track)} rotator positions")
+        if save:
+            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            df.to_csv(f"OTF_Data_{timestamp}.csv", index = False)
+        return df
+
+    def start_otf(self, grid_size, precision, tolerance, spacing, lead = None):
+        '''
+        Method to map the same area as start_raster with grid_size serpentine azimuth sweeps instead of grid_size**2
+        stop-and-stare points.
+        '''
+        return self.continue_otf(otf_rows(grid_size, spacing, precision), precision, tolerance, lead)
+
+    def start_otf_rose(self, precision, tolerance, lead = None):
+        '''
+        Method to run the rose curve of start_rose as one continuous sweep.
+        '''
+        return self.continue_otf(otf_rose(self.generate_daisy_grid(precision, 1, 5, 0.01)), precision, tolerance, lead)
+
+    def start_drift(self, precision, tolerance, cross_offsets, window, settle = 30, save = True):
+        '''
+        Method to run a drift scan. For each declination offset in cross_offsets the Rotator Controller stops tracking
+        and the dish is parked where the source will be settle + window/2 seconds later (see drift_scan.py); the power is
+        recorded for window seconds around the moment the source crosses. Tracking is turned back on at the end.
+
+        The Star Tracker target is read once at the start and predicted along its sidereal track after that, since it
+        stops updating the Rotator Controller while tracking is off. Returns (DataFrame of samples, fit_drift_scan
+        result), with the samples also saved to Drift_Data_<timestamp>.csv when save is set, or (None, None).
+        '''
+        self.cancel_scan = False
+        rotator_settings_url, astronomy_settings_url, astronomy_action_url, rotator_report_url = self.get_urls()
+        astronomy_report_url = astronomy_settings_url.rsplit("/", 1)[0] + "/report"
+
+        self.set_precision(precision, rotator_settings_url)
+        self.enable_reverse_api(rotator_settings_url)
+        integration_time = self.calculate_integration_time(astronomy_settings_url) or 0
+        self.start_radio_astronomy(astronomy_action_url)
+
+        settings, data, targetAz_raw, targetEl_raw, _, _ = self.read_rotator_settings(rotator_settings_url)
+        if settings is None:
+            print("Scan Cancelled")
+            return None, None
+        target_time = time.monotonic()
+        self.center_queue.put(targetAz_raw)
+        self.center_queue.put(targetEl_raw)
+        _, dec = drift_park_position(targetAz_raw, targetEl_raw, 0, 0)[2:]
+
+        mirror = self.get_mirror(rotator_settings_url)
+        track = mirror.get("track", 1)
+        power_rate = min(1/integration_time, 20) if integration_time else 5
+        recorder = OTFRecorder(self.client, rotator_report_url, astronomy_report_url, power_rate = power_rate)
+        cancelled = lambda: self.cancel_scan
+        crossings = []
+        recorder.start()
+        try:
+            for number, cross_offset in enumerate(cross_offsets):
+                if self.cancel_scan:
+                    print("Scan Cancelled")
+                    break
+
+                recorder.sweep = -1
+                cross_at = time.monotonic() + settle + window/2
+                az, el, _, _ = drift_park_position(targetAz_raw, targetEl_raw, cross_offset, cross_at - target_time)
+                self.data_queue.put(f"Drift pass {number + 1} of {len(cross_offsets)}: parking at Azimuth: {round(az, precision)}, "
+                                    f"Elevation: {round(el, precision)} (Dec offset {cross_offset})")
+                try:
+                    response = mirror.patch({"track": 0, "azimuth": az, "elevation": el,
+                                             "azimuthOffset": 0, "elevationOffset": 0})
+                    if response is not None and response.status_code != 200:
+                        print(f"Error parking the rotator: {response.status_code}")
+                except Exception as e:
+                    print(f"Exception while parking the rotator: {e}")
+                if not recorder.wait_for(time.time(), tolerance, cancelled):
+                    break
+
+                start = cross_at - window/2
+                if time.monotonic() > start:
+                    self.data_queue.put("The rotator reached the park position late, the start of the pass is lost")
+                # The recorder timestamps with time.time(), so the crossing is kept in that clock as well
+                crossings.append((number, cross_offset, time.time() + (cross_at - time.monotonic())))
+                while not self.cancel_scan and time.monotonic() < start:
+                    time.sleep(0.1)
+                recorder.sweep = number
+                while not self.cancel_scan and time.monotonic() < cross_at + window/2:
+                    time.sleep(0.1)
+                recorder.sweep = -1
+                self.grid_queue.put([0, cross_offset])
+        finally:
+            recorder.stop()
+            try:
+                mirror.patch({"track": track})
+            except Exception as e:
+                print(f"Exception while turning tracking back on: {e}")
+
+        print("Scan is complete")
+        samples = np.array(recorder.samples, float).reshape(-1, 3)
+        samples = samples[samples[:, 2] >= 0]
+        if len(samples) == 0 or not crossings:
+            self.data_queue.put("No power samples were recorded during the passes")
+            return None, None
+
+        crossing = {number: (cross_offset, t) for number, cross_offset, t in crossings}
+        sample_time = samples[:, 0] - integration_time/2
+        passes = samples[:, 2].astype(int)
+        df = pd.DataFrame({
+            'UTC': [datetime.fromtimestamp(t, timezone.utc).isoformat() for t in sample_time],
+            'Pass': passes,
+            'Cross Offset': [crossing[n][0] for n in passes],
+            'HA Off': SIDEREAL_RATE*(sample_time - np.array([crossing[n][1] for n in passes])),
+            'Power (dB)': samples[:, 1]
+        })
+        if save:
+            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            df.to_csv(f"Drift_Data_{timestamp}.csv", index = False)
+
+        result = fit_drift_scan(df, dec)
+        if result["ha_error"] is not None:
+            self.data_queue.put(f"HA error: {round(result['ha_error'], 4)} deg ({round(result['ha_error_sky'], 4)} deg on sky)")
+        if result["dec_error"] is not None:
+            self.data_queue.put(f"Dec error: {round(result['dec_error'], 4)} deg")
+        return df, result
+
+    def start_otf_thread(self, grid_size, precision, tolerance, spacing, on_complete = None, lead = None):
+        self.cancel_scan = False
+        def run_scan():
+            self.start_otf(grid_size, precision, tolerance, spacing, lead)
+            if on_complete:
+                on_complete()
+        thread = threading.Thread(target = run_scan)
+        thread.start()
+
+    def optimize_order(self, coordinates, scan, mount = None):
+        '''
+        Method to reorder the scan coordinates for the least slewing with path_optimizer.order_points, using the given
+        path_optimizer.MountModel (or the default one). The predicted scan duration before and after reordering is put
+        on the data queue.
+
+        The points are no longer in spiral order afterwards, so a reordered scan can only be mapped by the offsets it
+        was measured at: raster_analysis_class.raster_grid and the GUI grids do this, anything indexing the data by its
+        position in the spiral does not.
+        '''
+        _, astronomy_settings_url, _, _ = self.get_urls()
+        integration_time = self.calculate_integration_time(astronomy_settings_url) or 0
+        coordinates, before, after = order_points(coordinates, mount, integration_time*scan)
+        self.data_queue.put(f"Predicted scan duration: {round(before)} s in generated order, {round(after)} s reordered")
+        return coordinates
+
+    def start_raster(self, grid_size, precision, tolerance, spacing, scan, selected, optimize = False, mount = None):
         '''
         Method to begin the raster scan and call all of the other methods. Beigns by generating the necessary URL's to connect to 
         REST API, generating the offset scanning coordinates, patching the precision to SDRAngel, and calculating the integration time. 
@@ -519,33 +933,78 @@ class RotatorController:
         at or below the tolerace given. Once it has reached target, the code waits the total integration time for the final scan of that position, and
         proceeds to the next commanded offset. 
 
+        With optimize set, the spiral is reordered to minimize slew time for the mount model first (see optimize_order);
+        the data is then out of spiral order and must be gridded by its measured offsets (raster_analysis_class.raster_grid).
         '''
         coordinates = self.generate_offsets_grid(grid_size, precision, spacing)
+        if optimize:
+            coordinates = self.optimize_order(coordinates, scan, mount)
         self.continue_raster(coordinates, precision, tolerance, scan, selected)
         
 
-    def start_rose(self, precision, tolerance, scan):
+    def start_rose(self, precision, tolerance, scan, optimize = False, mount = None):
         '''
-        
+        Method to scan along a rose curve (see generate_daisy_grid) in Az/El offsets, optionally reordered to minimize
+        slew time for the mount model.
         '''
         coordinates = self.generate_daisy_grid(precision,1, 5, 0.01)
+        if optimize:
+            coordinates = self.optimize_order(coordinates, scan, mount)
         selected = 'EL-AZ'
         self.continue_raster(coordinates, precision, tolerance, scan, selected)
 
 
-    def start_scan_thread(self, grid_size, precision, tolerance, spacing, scan, selected, on_complete = None):
+    def generate_five_point(self, beam, precision, baseline_offset = None):
+        '''
+        Method to generate the offsets of a five-point cross: the center, then +/-beam on the first and second axis of the
+        selected frame. With baseline_offset set, a sixth point that far out on the first axis measures the off-source
+        power that the closed-form solution subtracts (see beam_fit.five_point_solution).
+        '''
+        beam = round(beam, precision)
+        coordinates = [[0, 0], [beam, 0], [-beam, 0], [0, beam], [0, -beam]]
+        if baseline_offset is not None:
+            coordinates.append([round(baseline_offset, precision), 0])
+        return coordinates
+
+    def start_five_point(self, precision, tolerance, beam, scan, selected, baseline_offset = None):
+        '''
+        Method to point on a source with five dwells instead of a full grid. The offsets are taken in the selected frame
+        ('EL-AZ', 'X-Y' or 'HA-DEC') like start_raster, and FinalData.five_point_fit solves the recorded data.
+        '''
+        coordinates = self.generate_five_point(beam, precision, baseline_offset)
+        self.continue_raster(coordinates, precision, tolerance, scan, selected)
+
+    def start_drift_thread(self, precision, tolerance, cross_offsets, window, settle = 30, on_complete = None):
+        self.cancel_scan = False
+        def run_scan():
+            self.start_drift(precision, tolerance, cross_offsets, window, settle)
+            if on_complete:
+                on_complete()
+        thread = threading.Thread(target = run_scan)
+        thread.start()
+
+    def start_five_point_thread(self, precision, tolerance, beam, scan, selected, on_complete = None, baseline_offset = None):
+        self.cancel_scan = False
+        def run_scan():
+            self.start_five_point(precision, tolerance, beam, scan, selected, baseline_offset)
+            if on_complete:
+                on_complete()
+        thread = threading.Thread(target = run_scan)
+        thread.start()
+
+    def start_scan_thread(self, grid_size, precision, tolerance, spacing, scan, selected, on_complete = None, optimize = False, mount = None):
         self.cancel_scan = False
         def run_scan():
-            self.start_raster(grid_size, precision, tolerance, spacing, scan, selected)
+            self.start_raster(grid_size, precision, tolerance, spacing, scan, selected, optimize, mount)
             if on_complete:
                 on_complete()
         thread = threading.Thread(target = run_scan)
         thread.start()
 
-    def start_rose_thread(self,precision, tolerance, scans, on_complete):
+    def start_rose_thread(self,precision, tolerance, scans, on_complete, optimize = False, mount = None):
         self.cancel_scan = False
         def run_scan():
-            self.start_rose(precision, tolerance, scans)
+            self.start_rose(precision, tolerance, scans, optimize, mount)
             if on_complete:
                 on_complete()
         thread = threading.Thread(target = run_scan)
@@ -553,6 +1012,8 @@ class RotatorController:
 
     def cancel_scan_request(self):
         self.cancel_scan = True
+        if self.receiver is not None:
+            self.receiver.state.notify()
 
 
 if __name__ == "__main__":
@@ -561,7 +1022,8 @@ if __name__ == "__main__":
     grid_queue = queue.Queue()
     center_queue = queue.Queue()
 
-    rotator = RotatorController(host, port, data_queue, grid_queue, center_queue)
+    # The reverse API receiver wakes the scan as soon as the rotator is on target; without it the rotator is polled
+    rotator = RotatorController(host, port, data_queue, grid_queue, center_queue, receiver = start_receiver())
 
     #rotator.start_raster(grid_size, precision, tolerance, spacing, scan, selected)
     rotator.start_rose(precision, tolerance, scan)
@@ -4,7 +4,10 @@
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
-from RasterScanner import RotatorController
+from RasterScanner import RotatorController, start_receiver
+from async_scanner import AsyncRotatorController
+from adaptive_raster import AdaptiveRaster
+from dwell_controller import SNRDwellController
 from tkinter import messagebox
 import queue
 import numpy as np
@@ -32,6 +35,8 @@ class RotatorGUI:
         #self.root.configure(bg=self.color)
         self.lat = 35.19909314527451
         self.long = -82.87202924351159
+        # Reverse API receiver kept between scans, see make_controller
+        self.receiver = None
 
         self.build_header()
         self.build_title()
@@ -84,7 +89,7 @@ class RotatorGUI:
         self.combo = ttk.Combobox(
             self.selector_frame, textvariable=self.selection, state="readonly"
         )
-        self.combo['values'] = ["Square", "Spiral", "Rose"]
+        self.combo['values'] = ["Square", "Spiral", "Rose", "Adaptive", "Five Point", "OTF", "Drift"]
         self.combo.pack(pady=5)
 
         continue_button = tk.Button(
@@ -113,9 +118,17 @@ class RotatorGUI:
         #self.build_header()
         #self.build_title()
 
+        # Options shared by the point-by-point scans: the reverse API port (empty to poll the rotator), the scan engine
+        # and, with a target SNR, dwells that end once the power is measured well enough (up to Max Dwell seconds)
+        options = ["Reverse API Port", "Engine", "Target SNR", "Max Dwell"]
         required_fields = {
-            "Standard": ["Grid Size", "Host", "Port", "Precision", "Spacing", "Tolerance", "Frame", "Scans"],
-            "Rose": ["Radius","Number Petals", "Target Spacing", "Host", "Port", "Precision", "Tolerance", "Frame", "Scans"]
+            "Standard": ["Grid Size", "Host", "Port", "Precision", "Spacing", "Tolerance", "Frame", "Scans"] + options,
+            "Rose": ["Radius","Number Petals", "Target Spacing", "Host", "Port", "Precision", "Tolerance", "Frame", "Scans"] + options,
+            "Adaptive": ["Host", "Port", "Precision", "Tolerance", "Frame", "Scans", "Coarse Spacing",
+                         "Target Uncertainty"] + options,
+            "Five Point": ["Host", "Port", "Precision", "Tolerance", "Frame", "Scans", "Beam"] + options,
+            "OTF": ["Grid Size", "Host", "Port", "Precision", "Spacing", "Tolerance", "Reverse API Port"],
+            "Drift": ["Host", "Port", "Precision", "Tolerance", "Cross Offsets", "Window", "Reverse API Port"]
         }
 
         # Conditional logic for different entry builder
@@ -125,6 +138,8 @@ class RotatorGUI:
         elif choice == "Square":
             self.build_entries_standard(self.left_frame, required_fields["Standard"])
             self.build_empty_grid(self.right_frame)
+        elif choice in required_fields:
+            self.build_entries_standard(self.left_frame, required_fields[choice])
         else: 
             self.build_entries_rose(self.main_frame, required_fields["Rose"])
             #self.build_empty_grid(self.right_frame)
@@ -150,6 +165,36 @@ class RotatorGUI:
         self.update_gui()
 
 
+    def make_controller(self):
+        """
+        Build the controller for the entered host and port: the asyncio engine or the standard one, with a reverse API
+        receiver when a port is given (falling back to polling if it cannot start) and an SNR dwell controller when a
+        target SNR is given.
+        """
+        host = self.entries["Host"].get()
+        port = int(self.entries["Port"].get())
+
+        reverse_port = self.entries["Reverse API Port"].get().strip() if "Reverse API Port" in self.entries else ""
+        if not reverse_port:
+            if self.receiver is not None:
+                self.receiver.stop()
+            self.receiver = None
+        elif self.receiver is None or self.receiver.port != int(reverse_port):
+            if self.receiver is not None:
+                self.receiver.stop()
+            self.receiver = start_receiver(int(reverse_port))
+
+        dwell_controller = None
+        target_snr = self.entries["Target SNR"].get().strip() if "Target SNR" in self.entries else ""
+        if target_snr:
+            dwell_controller = SNRDwellController(0, float(self.entries["Max Dwell"].get()), target_snr = float(target_snr))
+
+        engine = self.entries["Engine"].get() if "Engine" in self.entries else "Standard"
+        controller_class = AsyncRotatorController if engine == "Async" else RotatorController
+        return controller_class(host, port, data_queue=self.data_queue, grid_queue = self.grid_queue,
+                                center_queue = self.center_queue, receiver = self.receiver,
+                                dwell_controller = dwell_controller)
+
     def start_scan(self):
         """
         Start the scan process from RasterScanner.py when the button is clicked.
@@ -166,7 +211,7 @@ class RotatorGUI:
 
     
 
-        selected = self.entries["Frame"].get()
+        selected = self.entries["Frame"].get() if "Frame" in self.entries else 'EL-AZ'
         self.type = self.combo.get()
 
         
@@ -182,7 +227,7 @@ class RotatorGUI:
             tolerance = float(self.entries["Tolerance"].get())
             scans = float(self.entries["Scans"].get())
 
-            self.controller = RotatorController(host, port, data_queue=self.data_queue, grid_queue = self.grid_queue, center_queue = self.center_queue) 
+            self.controller = self.make_controller()
             self.start_button.pack_forget() # Hide the start button and replace with cancel button
             self.cancel_button.pack()
             self.status_label.config(text="Status: Scanning...")
@@ -210,13 +255,38 @@ class RotatorGUI:
             #print(self.grid_size)
             #self.build_grid(self.grid_size+1)
 
-            self.controller = RotatorController(host, port, data_queue=self.data_queue, grid_queue = self.grid_queue, center_queue = self.center_queue) 
+            self.controller = self.make_controller()
             self.start_button.pack_forget() # Hide the start button and replace with cancel button
             self.cancel_button.pack()
             self.status_label.config(text="Status: Scanning...")
             
             self.controller.start_rose_thread(precision, tolerance, scans, self.on_scan_complete)
             self.build_rose_graph(self.right_frame, precision, petals, self.spacing)
+        elif self.type in ('Adaptive', 'Five Point', 'OTF', 'Drift'):
+
+            precision = int(self.entries["Precision"].get())
+            tolerance = float(self.entries["Tolerance"].get())
+            self.controller = self.make_controller()
+            self.start_button.pack_forget() # Hide the start button and replace with cancel button
+            self.cancel_button.pack()
+            self.status_label.config(text="Status: Scanning...")
+
+            if self.type == 'Adaptive':
+                search = AdaptiveRaster(self.controller, precision, tolerance, float(self.entries["Scans"].get()), selected,
+                                        float(self.entries["Coarse Spacing"].get()),
+                                        float(self.entries["Target Uncertainty"].get()))
+                search.start_thread(on_complete = self.on_scan_complete)
+            elif self.type == 'Five Point':
+                self.controller.start_five_point_thread(precision, tolerance, float(self.entries["Beam"].get()),
+                                                        float(self.entries["Scans"].get()), selected,
+                                                        on_complete = self.on_scan_complete)
+            elif self.type == 'OTF':
+                self.controller.start_otf_thread(int(self.entries["Grid Size"].get()), precision, tolerance,
+                                                 float(self.entries["Spacing"].get()), on_complete = self.on_scan_complete)
+            else:
+                cross_offsets = [float(value) for value in self.entries["Cross Offsets"].get().split(",")]
+                self.controller.start_drift_thread(precision, tolerance, cross_offsets,
+                                                   float(self.entries["Window"].get()), on_complete = self.on_scan_complete)
         else:
             print("No raster type specified")
   
@@ -231,7 +301,7 @@ class RotatorGUI:
         if self.running:
             while not self.grid_queue.empty():
                 next_coord = self.grid_queue.get()
-                if self.type != "Rose":
+                if self.type in ("Square", "Spiral"):
                     self.fill_grid_space(next_coord)
         
         self.root.after(1, self.update_gui)
@@ -486,7 +556,8 @@ class RotatorGUI:
         self.entries = {}
 
         combo_fields = {
-            "Frame": ["EL-AZ", "X-Y", "HA-DEC"]
+            "Frame": ["EL-AZ", "X-Y", "HA-DEC"],
+            "Engine": ["Standard", "Async"]
         }
 
         # "10.1.119.129"
@@ -498,7 +569,15 @@ class RotatorGUI:
             "Spacing": "0.1",
             "Tolerance": "0.01",
             "Frame": "EL-AZ",
-            "Scans": "5"
+            "Scans": "5",
+            "Coarse Spacing": "0.2",
+            "Target Uncertainty": "0.01",
+            "Beam": "0.2",
+            "Cross Offsets": "-0.1, 0, 0.1",
+            "Window": "120",
+            "Reverse API Port": "8888",
+            "Engine": "Standard",
+            "Max Dwell": "30"
         }
 
         for field in fields:
@@ -523,7 +602,8 @@ class RotatorGUI:
         self.entries = {}
 
         combo_fields = {
-            "Frame": ["EL-AZ", "X-Y", "HA-DEC"]
+            "Frame": ["EL-AZ", "X-Y", "HA-DEC"],
+            "Engine": ["Standard", "Async"]
         }
 
         default_values = {
@@ -535,7 +615,10 @@ class RotatorGUI:
             "Precision": "2",
             "Tolerance": "0.01",
             "Frame": "EL-AZ",
-            "Scans": "5"
+            "Scans": "5",
+            "Reverse API Port": "8888",
+            "Engine": "Standard",
+            "Max Dwell": "30"
         }
 
         for field in fields:
@@ -0,0 +1,97 @@
+# adaptive_raster.py
+
+'''
+adaptive_raster.py drives RotatorController.continue_raster as a coarse-to-fine search instead of one fixed grid. Most
+dwells of a large fixed grid are spent off the beam; here a small coarse grid is taken first, and the beam peak is
+re-estimated after every dwell through the on_dwell hook of continue_raster (beam_fit.fit_beam on everything measured so
+far). The scan stops as soon as the Gaussian fit puts the peak within the requested uncertainty. Otherwise the next
+round is a finer grid centered on the current estimate, skipping any offset that has already been measured.
+'''
+
+# Import necessary libraries
+import threading
+import numpy as np
+from beam_fit import fit_beam
+
+class AdaptiveRaster:
+
+    def __init__(self, controller, precision, tolerance, scan, selected, coarse_spacing, target_uncertainty,
+                 grid_size = 3, min_spacing = None, max_rounds = 4, beam_fwhm = None):
+        '''
+        Method to set up the search for a RotatorController (or AsyncRotatorController). Offsets are in the selected frame
+        and target_uncertainty is the 1-sigma error (same units) on both peak coordinates at which the scan stops.
+        Each round is a grid_size x grid_size spiral, half as widely spaced as the one before but never below min_spacing.
+        '''
+        self.controller = controller
+        self.precision = precision
+        self.tolerance = tolerance
+        self.scan = scan
+        self.selected = selected
+        self.coarse_spacing = coarse_spacing
+        self.target_uncertainty = target_uncertainty
+        self.grid_size = grid_size
+        self.min_spacing = min_spacing if min_spacing is not None else 10**(-precision)
+        self.max_rounds = max_rounds
+        self.beam_fwhm = beam_fwhm
+
+        self.samples = []
+        self.estimate = None
+        self.localized = False
+
+    def on_dwell(self, index, coord, power):
+        '''
+        Online analysis hook passed to continue_raster: adds the dwell, refits the peak once there are enough points and
+        returns True (stop the scan) once it is localized.
+        '''
+        if power is None:
+            return False
+        self.samples.append((coord[0], coord[1], power))
+        if len(self.samples) < 8:
+            return False
+
+        x, y, p = np.array(self.samples, float).T
+        self.estimate = fit_beam(x, y, p, self.beam_fwhm)
+        fit = self.estimate
+        if fit["method"] == "gaussian":
+            self.controller.data_queue.put(f"Peak estimate: {round(fit['x0'], 4)} +/- {round(fit['x0_err'], 4)}, "
+                                           f"{round(fit['y0'], 4)} +/- {round(fit['y0_err'], 4)}")
+            self.localized = max(fit["x0_err"], fit["y0_err"]) <= self.target_uncertainty
+        else:
+            self.controller.data_queue.put(f"Peak estimate ({fit['method']}): {round(fit['x0'], 4)}, {round(fit['y0'], 4)}")
+        return self.localized
+
+    def measured(self, coord, spacing):
+        return any(abs(x - coord[0]) < spacing/4 and abs(y - coord[1]) < spacing/4 for x, y, _ in self.samples)
+
+    def run(self):
+        '''
+        Method to run rounds until the peak is localized, the scan is cancelled or max_rounds is reached. Returns the
+        last peak estimate (a beam_fit.fit_beam dict) or None.
+        '''
+        center = (0.0, 0.0)
+        spacing = self.coarse_spacing
+        for number in range(self.max_rounds):
+            grid = self.controller.generate_offsets_grid(self.grid_size, self.precision, spacing)
+            coordinates = [[round(center[0] + x, self.precision), round(center[1] + y, self.precision)] for x, y in grid]
+            coordinates = [coord for coord in coordinates if not self.measured(coord, spacing)]
+            self.controller.data_queue.put(f"Adaptive round {number + 1}: {len(coordinates)} points at spacing {spacing} "
+                                           f"around ({round(center[0], self.precision)}, {round(center[1], self.precision)})")
+            if coordinates:
+                self.controller.continue_raster(coordinates, self.precision, self.tolerance, self.scan, self.selected,
+                                                on_dwell = self.on_dwell)
+            if self.controller.cancel_scan or self.localized:
+                break
+            if self.estimate is not None:
+                center = (self.estimate["x0"], self.estimate["y0"])
+            spacing = max(spacing / 2, self.min_spacing)
+        return self.estimate
+
+    def start_thread(self, on_complete = None):
+        self.controller.cancel_scan = False
+        def run_scan():
+            self.run()
+            if on_complete:
+                on_complete()
+        thread = threading.Thread(target = run_scan)
+        thread.start()
+        return thread
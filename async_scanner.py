@@ -0,0 +1,225 @@
+# async_scanner.py
+
+'''
+async_scanner.py holds AsyncRotatorController, an asyncio version of the RasterScanner.py scan loop. It takes the same
+arguments, uses the same data/grid/center queues and the same cancel_scan_request(), start_scan_thread() and
+start_rose_thread() methods, so the GUIs can use it in place of RotatorController.
+
+The difference is in how the REST calls are ordered. RotatorController.continue_raster makes each request one after
+the other. Here the settings and report reads for a point go out together, and the next point is staged as soon as a
+dwell ends, while the online analysis of that dwell runs. Its target is predicted along the sidereal track to the end
+of the dwell, with no request, and read for real every target_refresh seconds. The time spent per point on the
+controller side is then set by the slowest single request rather than the sum of all of them. The blocking calls still
+go through the pooled SDRangelClient, so they run in worker threads with asyncio.to_thread.
+'''
+
+# Import necessary libraries
+import asyncio
+import time
+import queue
+from RasterScanner import RotatorController
+from scan_planner import predict_trajectory
+
+# Seconds after which the next point is staged from a real read of the Star Tracker target rather than predicted
+target_refresh = 60
+
+class AsyncRotatorController(RotatorController):
+
+    target_refresh = target_refresh
+
+    def continue_raster(self, coordinates, precision, tolerance, scan, selected, on_dwell = None):
+        '''
+        Method to run the asyncio scan engine to completion from the calling (scan) thread.
+        '''
+        asyncio.run(self.continue_raster_async(coordinates, precision, tolerance, scan, selected, on_dwell))
+
+    async def sleep_unless_cancelled(self, seconds, step = 0.1):
+        '''
+        Method to sleep for the given time while still reacting to cancel_scan_request() within one step.
+        '''
+        deadline = time.monotonic() + seconds
+        while not self.cancel_scan:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(step, remaining))
+
+    async def stage_point(self, index, coordinates, selected, seconds_per_point, rotator_settings_url, rotator_report_url):
+        '''
+        Method to read the rotator settings and report at the same time, then look up the Az/El offsets of point index
+        in the whole-scan plan. Returns everything the scan loop needs to patch this point without another request.
+        '''
+        settings_result, report = await asyncio.gather(
+            asyncio.to_thread(self.read_rotator_settings, rotator_settings_url),
+            asyncio.to_thread(self.get_coordinates, rotator_report_url)
+        )
+        read_at = time.monotonic()
+        settings, data, targetAz_raw, targetEl_raw, _, _ = settings_result
+        if settings is None:
+            return None, None, None, None, read_at, None, None, report
+        azOff, elOff = self.planned_offsets(index, coordinates, selected, targetAz_raw, targetEl_raw, seconds_per_point,
+                                            read_at)
+        return settings, data, targetAz_raw, targetEl_raw, read_at, azOff, elOff, report
+
+    def stage_next_point(self, index, coordinates, selected, seconds_per_point, settings, data, targetAz_raw,
+                         targetEl_raw, read_at, apply_at):
+        '''
+        Method to stage point index without any request, once the dwell on the point before it has ended at apply_at.
+        The target read (or predicted) for read_at is moved along its sidereal track to apply_at and the offsets are
+        looked up for that predicted target. Returns the same values as stage_point, with apply_at as the read time and
+        no report. The scan loop reads the real target again with stage_point every target_refresh seconds.
+        '''
+        if selected in ('HA-DEC', 'X-Y'):
+            targetAz, targetEl = predict_trajectory(targetAz_raw, targetEl_raw, apply_at - read_at)
+            targetAz_raw, targetEl_raw = float(targetAz), float(targetEl)
+        azOff, elOff = self.planned_offsets(index, coordinates, selected, targetAz_raw, targetEl_raw, seconds_per_point,
+                                            apply_at)
+        return settings, data, targetAz_raw, targetEl_raw, apply_at, azOff, elOff, None
+
+    def report_status(self, coord, precision, azOff_raw, elOff_raw, report, targetAz_raw, targetEl_raw):
+        '''
+        Method to put the same position messages on the data queue as RotatorController.continue_raster.
+        '''
+        currentAz_raw, currentEl_raw, _, _ = report
+        self.data_queue.put("\n")
+        self.data_queue.put(f"Offsets in desired system: Azimuth: {coord[0]}, Elevation: {coord[1]}")
+        self.data_queue.put(f"SDRAngel Offsets: Azimuth: {round(azOff_raw, precision)}, Elevation: {round(elOff_raw, precision)}")
+        self.data_queue.put(f"Current Rotator Coordinates: Azimuth: {round(currentAz_raw, precision)}, Elevation: {round(currentEl_raw, precision)}")
+        self.data_queue.put(f"Target Coordinates: Azimuth: {round(targetAz_raw, precision)}, Elevation: {round(targetEl_raw, precision)}")
+
+    async def start_astronomy(self, astronomy_action_url):
+        payload = {"channelType": "RadioAstronomy",  "direction": 0, "RadioAstronomyActions": { "start": {"sampleRate": 2000000} }}
+        try:
+            response = await asyncio.to_thread(self.client.post, astronomy_action_url, kind = "actions", json = payload)
+            if response.status_code != 202:
+                print(f"Error starting Radio Astronomy scan: {response.status_code}")
+        except Exception as e:
+            print(f"Exception while starting Radio Astronomy scan: {e}")
+
+    async def continue_raster_async(self, coordinates, precision, tolerance, scan, selected, on_dwell = None):
+        '''
+        Method to visit every offset in coordinates. Setup requests (precision, integration time, starting the Radio
+        Astronomy scan) are issued together; each point is staged as soon as the dwell before it ends, while the
+        on_dwell hook (the same online analysis hook as in RotatorController.continue_raster) runs.
+        '''
+        self.cancel_scan = False
+        center_checked = False
+        settings = data = None
+        rotator_settings_url, astronomy_settings_url, astronomy_action_url, rotator_report_url = \
+            await asyncio.to_thread(self.get_urls)
+
+        _, integration_time, _ = await asyncio.gather(
+            asyncio.to_thread(self.set_precision, precision, rotator_settings_url),
+            asyncio.to_thread(self.calculate_integration_time, astronomy_settings_url),
+            self.start_astronomy(astronomy_action_url)
+        )
+        await asyncio.to_thread(self.enable_reverse_api, rotator_settings_url)
+
+        astronomy_report_url = astronomy_settings_url.rsplit("/", 1)[0] + "/report"
+        if self.dwell_controller is not None:
+            self.dwell_controller.set_integration_time(integration_time)
+
+        self.plan = None
+        staged = None
+        if coordinates:
+            staged = asyncio.create_task(self.stage_point(0, coordinates, selected, integration_time*scan,
+                                                          rotator_settings_url, rotator_report_url))
+        target_read_at = time.monotonic()
+
+        for index, coord in enumerate(coordinates):
+
+            if self.cancel_scan:
+                print("Scan Cancelled")
+                break
+
+            settings, data, targetAz_raw, targetEl_raw, read_at, azOff_new, elOff_new, report = await staged
+            staged = None
+            if settings is None:
+                print("Scan Cancelled")
+                break
+
+            if not center_checked:
+                self.center_queue.put(targetAz_raw)
+                self.center_queue.put(targetEl_raw)
+                center_checked = True
+
+            await asyncio.to_thread(self.update_offsets, azOff_new, elOff_new, settings, data, rotator_settings_url,
+                                    force = True)
+
+            # Wait for the rotator, re-reading only the report
+            while True:
+                checked_at = time.monotonic()
+                report = await asyncio.to_thread(self.get_coordinates, rotator_report_url)
+                currentAz_raw, currentEl_raw, targetAz_raw_1, targetEl_raw_1 = report
+
+                if self.cancel_scan:
+                    break
+                if currentAz_raw is None:
+                    # The report could not be read, try again after one integration
+                    self.data_queue.put("Could not read the rotator position, trying again...")
+                    await self.sleep_unless_cancelled(integration_time or 1)
+                    continue
+
+                self.report_status(coord, precision, azOff_new, elOff_new, report, targetAz_raw, targetEl_raw)
+                if (abs(currentAz_raw - targetAz_raw_1) <= tolerance and
+                    abs(currentEl_raw - targetEl_raw_1) <= tolerance):
+                    break
+
+                self.data_queue.put("Waiting for the rotator to reach the target coordinates...")
+                if self.receiver is not None:
+                    on_target = await asyncio.to_thread(self.receiver.state.wait_on_target, tolerance, integration_time,
+                                                        checked_at, lambda: self.cancel_scan)
+                else:
+                    await self.sleep_unless_cancelled(integration_time)
+                    on_target = False
+                if not on_target and not self.cancel_scan:
+                    await asyncio.to_thread(self.recheck_rotator_settings, azOff_new, elOff_new, settings, data,
+                                            rotator_settings_url)
+
+            if self.cancel_scan:
+                print("Scan Cancelled")
+                break
+
+            self.data_queue.put("Rotator on target, performing specified number of scans")
+            await asyncio.to_thread(self.dwell, coord, selected, precision, targetAz_raw, targetEl_raw, read_at,
+                                    integration_time*scan, rotator_settings_url, astronomy_report_url)
+
+            # Stage the next point for where the target is now that the dwell has ended (a dwell controller can make it
+            # shorter or longer than integration_time*scan). No dwell is running, so the settings can be read again;
+            # that is done every target_refresh seconds, and in between the target is predicted with no request.
+            if index + 1 < len(coordinates):
+                dwell_end = time.monotonic()
+                if dwell_end - target_read_at >= self.target_refresh:
+                    target_read_at = dwell_end
+                    staged = asyncio.create_task(self.stage_point(index + 1, coordinates, selected, integration_time*scan,
+                                                                  rotator_settings_url, rotator_report_url))
+                else:
+                    staged = asyncio.create_task(asyncio.to_thread(
+                        self.stage_next_point, index + 1, coordinates, selected, integration_time*scan, settings, data,
+                        targetAz_raw, targetEl_raw, read_at, dwell_end))
+            self.grid_queue.put(coord)
+
+            if on_dwell is not None and not self.cancel_scan:
+                power = await asyncio.to_thread(self.read_channel_power, astronomy_report_url)
+                if await asyncio.to_thread(on_dwell, index, coord, power):
+                    self.data_queue.put("Stopping the scan early")
+                    break
+
+        if staged is not None:
+            staged.cancel()
+
+        print("Scan is complete")
+        if settings is not None:
+            await asyncio.to_thread(self.update_offsets, 0, 0, settings, data, rotator_settings_url)
+
+
+if __name__ == "__main__":
+
+    from RasterScanner import host, port, grid_size, precision, tolerance, spacing, scan, selected, start_receiver
+
+    data_queue = queue.Queue()
+    grid_queue = queue.Queue()
+    center_queue = queue.Queue()
+
+    rotator = AsyncRotatorController(host, port, data_queue, grid_queue, center_queue, receiver = start_receiver())
+    rotator.start_raster(grid_size, precision, tolerance, spacing, scan, selected)
@@ -0,0 +1,184 @@
+# beam_fit.py
+
+'''
+beam_fit.py finds the peak of a beam map to better than the grid spacing. FinalData.find_peak can only return the grid
+node with the most power; here the map is fitted with a 2-D elliptical Gaussian
+
+    power = baseline + amplitude * exp(-(a*(x - x0)**2 + 2*b*(x - x0)*(y - y0) + c*(y - y0)**2))
+
+(a, b, c set by the two widths and the rotation angle) using Levenberg-Marquardt in NumPy, so the peak position comes
+with uncertainties from the fit covariance. When the fit fails, or there are too few points for it, the peak is taken
+from a quadratic fitted to the points around the brightest one, and as a last resort the brightest point itself.
+
+The fit works on any scattered points, so the dwells of extract_rows, a regridded map or on-the-fly samples all work.
+'''
+
+# Import necessary libraries
+import numpy as np
+
+PARAMETERS = ["amplitude", "x0", "y0", "sigma_x", "sigma_y", "theta", "baseline"]
+
+def gaussian_2d(params, x, y):
+    '''
+    Elliptical 2-D Gaussian on a baseline at the points (x, y). params are in the order of PARAMETERS.
+    '''
+    amplitude, x0, y0, sigma_x, sigma_y, theta, baseline = params
+    cos, sin = np.cos(theta), np.sin(theta)
+    a = cos**2 / (2*sigma_x**2) + sin**2 / (2*sigma_y**2)
+    b = np.sin(2*theta) * (1 / (4*sigma_y**2) - 1 / (4*sigma_x**2))
+    c = sin**2 / (2*sigma_x**2) + cos**2 / (2*sigma_y**2)
+    dx = x - x0
+    dy = y - y0
+    return baseline + amplitude*np.exp(-(a*dx**2 + 2*b*dx*dy + c*dy**2))
+
+def jacobian(params, x, y, step = 1e-6):
+    '''
+    Forward-difference Jacobian of gaussian_2d, one column per parameter, evaluated on all points at once.
+    '''
+    params = np.asarray(params, float)
+    base = gaussian_2d(params, x, y)
+    columns = []
+    for i in range(len(params)):
+        shifted = params.copy()
+        h = step * max(abs(params[i]), 1e-3)
+        shifted[i] += h
+        columns.append((gaussian_2d(shifted, x, y) - base) / h)
+    return np.column_stack(columns)
+
+def fit_gaussian_2d(x, y, z, initial, max_iterations = 200, tolerance = 1e-10, z_err = None):
+    '''
+    Levenberg-Marquardt least squares fit of gaussian_2d to z at (x, y), starting from initial. With z_err every point
+    is weighted by 1/z_err**2. Returns (params, errors, converged); errors are the 1-sigma uncertainties from the
+    covariance scaled by the (weighted) residuals.
+    '''
+    weight = 1 / np.asarray(z_err, float) if z_err is not None else np.ones(len(z))
+    params = np.asarray(initial, float)
+    residual = (z - gaussian_2d(params, x, y))*weight
+    cost = np.sum(residual**2)
+    damping = 1e-3
+    converged = False
+
+    for _ in range(max_iterations):
+        J = jacobian(params, x, y)*weight[:, None]
+        H = J.T @ J
+        g = J.T @ residual
+        try:
+            step = np.linalg.solve(H + damping*np.diag(np.diag(H) + 1e-12), g)
+        except np.linalg.LinAlgError:
+            break
+        trial = params + step
+        trial_residual = (z - gaussian_2d(trial, x, y))*weight
+        trial_cost = np.sum(trial_residual**2)
+        if trial_cost < cost:
+            done = (cost - trial_cost) <= tolerance*max(cost, 1e-300)
+            params, residual, cost = trial, trial_residual, trial_cost
+            damping = max(damping / 10, 1e-12)
+            if done:
+                converged = True
+                break
+        else:
+            damping *= 10
+            if damping > 1e12:
+                # No step lowers the cost any more, so this is the minimum
+                converged = True
+                break
+
+    J = jacobian(params, x, y)*weight[:, None]
+    dof = max(len(z) - len(params), 1)
+    try:
+        # For a circular beam (equal widths) theta has no effect and J.T @ J is singular; the pseudo-inverse leaves theta
+        # out of the covariance instead of failing, so the errors of the other parameters are still found
+        covariance = np.linalg.pinv(J.T @ J, rcond = 1e-10, hermitian = True) * cost / dof
+        errors = np.sqrt(np.abs(np.diag(covariance)))
+    except np.linalg.LinAlgError:
+        errors = np.full(len(params), np.nan)
+    return params, errors, converged
+
+def quadratic_peak(x, y, z, count = 9):
+    '''
+    Fits z = c0 + c1*x + c2*y + c3*x**2 + c4*x*y + c5*y**2 to the count points closest to the brightest one and returns
+    the (x, y) of its maximum, or None if there are fewer than 6 points or the surface has no maximum.
+    '''
+    brightest = np.argmax(z)
+    distance = np.hypot(x - x[brightest], y - y[brightest])
+    near = np.argsort(distance)[:count]
+    if len(near) < 6:
+        return None
+    xn, yn = x[near] - x[brightest], y[near] - y[brightest]
+    design = np.column_stack((np.ones(len(near)), xn, yn, xn**2, xn*yn, yn**2))
+    c, *_ = np.linalg.lstsq(design, z[near], rcond = None)
+    hessian = np.array([[2*c[3], c[4]], [c[4], 2*c[5]]])
+    if np.any(np.linalg.eigvalsh(hessian) >= 0):
+        return None
+    dx, dy = np.linalg.solve(hessian, -c[1:3])
+    return float(x[brightest] + dx), float(y[brightest] + dy)
+
+def fit_beam(x, y, power_db, beam_fwhm = None, power_err = None):
+    '''
+    Finds the beam peak from power samples in dB at offsets (x, y). The fit is done on linear power, weighted by the
+    1-sigma errors of the linear powers in power_err when given (points without a positive error are left out).
+    beam_fwhm is a first guess of the beam width, by default twice the median spacing of the points.
+
+    Returns a dict with 'x0', 'y0' and their errors 'x0_err', 'y0_err' (None unless the Gaussian fit was used), 'method'
+    ('gaussian', 'quadratic' or 'argmax') and, for the Gaussian fit, 'params' and 'errors' keyed by PARAMETERS.
+    '''
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    z = 10**(np.asarray(power_db, float) / 10)
+    good = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+    z_err = None
+    if power_err is not None:
+        z_err = np.asarray(power_err, float)
+        good &= np.isfinite(z_err) & (z_err > 0)
+        z_err = z_err[good]
+    x, y, z = x[good], y[good], z[good]
+    brightest = int(np.argmax(z))
+
+    if beam_fwhm is None:
+        steps = np.hypot(np.diff(x), np.diff(y))
+        steps = steps[steps > 1e-6]
+        beam_fwhm = 2*float(np.median(steps)) if len(steps) else 0.1
+    sigma = beam_fwhm / 2.3548
+
+    if len(z) > len(PARAMETERS):
+        initial = [z.max() - z.min(), x[brightest], y[brightest], sigma, sigma, 0.0, z.min()]
+        params, errors, converged = fit_gaussian_2d(x, y, z, initial, z_err = z_err)
+        amplitude, x0, y0, sigma_x, sigma_y = params[:5]
+        margin = beam_fwhm / 2
+        inside = (x.min() - margin <= x0 <= x.max() + margin) and (y.min() - margin <= y0 <= y.max() + margin)
+        if converged and amplitude > 0 and inside and np.all(np.isfinite(errors)):
+            return {"x0": float(x0), "y0": float(y0), "x0_err": float(errors[1]), "y0_err": float(errors[2]),
+                    "method": "gaussian", "params": dict(zip(PARAMETERS, map(float, params))),
+                    "errors": dict(zip(PARAMETERS, map(float, errors)))}
+
+    peak = quadratic_peak(x, y, z)
+    if peak is not None:
+        return {"x0": peak[0], "y0": peak[1], "x0_err": None, "y0_err": None, "method": "quadratic"}
+    return {"x0": float(x[brightest]), "y0": float(y[brightest]), "x0_err": None, "y0_err": None, "method": "argmax"}
+
+def five_point_solution(center, x_plus, x_minus, y_plus, y_minus, step, baseline = 0.0):
+    '''
+    Closed-form Gaussian solution of a five-point cross: linear powers at the center and at +/-step on each axis. On
+    each axis the log of the baseline-subtracted power through the three points is a parabola, which gives
+
+        x0 = step*(ln P+ - ln P-) / (2*(2 ln P0 - ln P+ - ln P-))      sigma**2 = step**2 / (2 ln P0 - ln P+ - ln P-)
+
+    Returns a dict in the form of fit_beam (method 'five-point') with 'fwhm_x', 'fwhm_y' and 'amplitude', or None when
+    the points are not on a peak (a power at or below the baseline, or no downward curve through the center).
+    '''
+    powers = np.array([center, x_plus, x_minus, y_plus, y_minus], float) - baseline
+    if np.any(powers <= 0):
+        return None
+    l0, lx_plus, lx_minus, ly_plus, ly_minus = np.log(powers)
+
+    curvature_x = 2*l0 - lx_plus - lx_minus
+    curvature_y = 2*l0 - ly_plus - ly_minus
+    if curvature_x <= 0 or curvature_y <= 0:
+        return None
+    x0 = step*(lx_plus - lx_minus) / (2*curvature_x)
+    y0 = step*(ly_plus - ly_minus) / (2*curvature_y)
+    sigma_x = step / np.sqrt(curvature_x)
+    sigma_y = step / np.sqrt(curvature_y)
+    amplitude = np.exp(l0 + x0**2 / (2*sigma_x**2) + y0**2 / (2*sigma_y**2))
+    return {"x0": float(x0), "y0": float(y0), "x0_err": None, "y0_err": None, "method": "five-point",
+            "fwhm_x": float(2.3548*sigma_x), "fwhm_y": float(2.3548*sigma_y), "amplitude": float(amplitude)}
@@ -2,13 +2,14 @@
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
-import requests
 import json
+from sdrangel_client import get_client
 
 class RadioGUI:
 
     # Constants - For Now
     IP_ADDRESS = "204.84.22.107" # IP Address of the SDRangel server on Bella's Raspeberry Pi
+    PORT = 8091
 
     def __init__(self, master):
 
@@ -20,6 +21,7 @@ class RadioGUI:
 
         # Instance variables for the state
         self.selected_frequency = None
+        self.client = get_client(self.IP_ADDRESS, self.PORT)
 
         # Build the GUI
         self.build_header()
@@ -71,7 +73,7 @@ class RadioGUI:
 
         self.channel_combo = ttk.Combobox(channel_frame, width=30)
 
-        channel_list = requests.get("http://204.84.22.107:8091/sdrangel/channels?direction=0")  # or your IP
+        channel_list = self.client.get("/channels?direction=0", kind = "devices")
 
         if channel_list.ok:
             data = channel_list.json()
@@ -94,7 +96,7 @@ class RadioGUI:
 
         self.feature_combo = ttk.Combobox(feat_frame, width=30)
 
-        feature_list = requests.get("http://204.84.22.107:8091/sdrangel/features")  # or your IP
+        feature_list = self.client.get("/features", kind = "devices")
 
         if feature_list.ok:
             data = feature_list.json()
@@ -120,7 +122,7 @@ class RadioGUI:
         
         selected = self.channel_combo.get()
 
-        url = "http://204.84.22.107:8091/sdrangel/deviceset/0/channel"
+        url = "/deviceset/0/channel"
 
 
 
@@ -224,7 +226,12 @@ class RadioGUI:
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
+        response = self.client.post(url, data=json.dumps(payload), headers=headers)
+        # A new channel changes the instance layout; the cache takes its index from the response, or refetches /sdrangel
+        # on the next lookup when there is none
+        settings = payload.get(payload["channelType"] + "Settings", {})
+        deviceset_index, channel_index = self.client.topology.record_channel(response, 0, payload["channelType"],
+                                                                             settings.get("title"))
 
 
         # Add if catch statement if status code is not 200
@@ -232,13 +239,16 @@ class RadioGUI:
         print("Response:", response.json())
 
         print(f"Frequency Goal: {selected}")
-        self.result_label.config(text=f"Frequency Goal: {selected} kHz")
+        if channel_index is None:
+            self.result_label.config(text=f"Frequency Goal: {selected} kHz")
+        else:
+            self.result_label.config(text=f"Frequency Goal: {selected} kHz (channel {deviceset_index}:{channel_index})")
 
     def set_feature(self):
         
         selected = self.feature_combo.get()
 
-        url = "http://204.84.22.107:8091/sdrangel/featureset/feature"
+        url = "/featureset/feature"
 
         print(selected)
 
@@ -348,7 +358,9 @@ class RadioGUI:
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
+        response = self.client.post(url, data=json.dumps(payload), headers=headers)
+        settings = payload.get(payload["featureType"] + "Settings", {})
+        feature_index = self.client.topology.record_feature(response, payload["featureType"], settings.get("title"))
 
 
         # Add if catch statement if status code is not 200
@@ -356,7 +368,10 @@ class RadioGUI:
         print("Response:", response.json())
 
         print(f"Feature Added: {selected}")
-        self.result_label.config(text=f"Feature Added: {selected} kHz")
+        if feature_index is None:
+            self.result_label.config(text=f"Feature Added: {selected}")
+        else:
+            self.result_label.config(text=f"Feature Added: {selected} (feature {feature_index})")
 
     def set_frequency(self):
         selected = self.freq_combo.get()
@@ -368,7 +383,7 @@ class RadioGUI:
         self.selected_frequency = int(selected)
 
 
-        url = "http://204.84.22.107:8091/sdrangel/deviceset/0/device/settings"
+        url = "/deviceset/0/device/settings"
 
         payload_2 = {
             "deviceHwType": "RTLSDR",
@@ -383,7 +398,7 @@ class RadioGUI:
             "Content-Type": "application/json"
         }
 
-        response = requests.patch(url, data=json.dumps(payload_2), headers=headers)
+        response = self.client.patch(url, data=json.dumps(payload_2), headers=headers)
 
         print("Freq Status:", response.status_code)
         print("Freq Response:", response.json())
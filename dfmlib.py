@@ -303,6 +303,15 @@ class DFM_FE(object):
                 self.stop()
                 return self.get_status()
 
+    def set_coefficients(self, me, ma, ch, nonperp, tflx, har, decr):
+        # Set pointing model coefficients, in the order of the COEFF command (nonperp is NP).  Values are sent as
+        # given: angles with 3 decimals, the HA and DEC ratios with 6.  The manual does not state the units, so no
+        # conversion is done here; pointing_model.upload_model only calls this once the caller has confirmed them.
+        dfm_command = '%s,%.3f,%.3f,%.3f,%.3f,%.3f,%.6f,%.6f%s' % (DFM_COEFF, me, ma, ch, nonperp, tflx, har, decr,
+                                                                    DFM_DELIM)
+        self.ex_sock.sendall(dfm_command.encode())
+        self.print_debug(dfm_command)
+
     def get_position(self):
         dfm_command = DFM_COORDS + DFM_DELIM
         self.ex_sock.sendall(dfm_command.encode())
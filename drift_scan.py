@@ -0,0 +1,104 @@
+# drift_scan.py
+
+'''
+drift_scan.py holds the geometry and the analysis of the drift-scan mode of RasterScanner.RotatorController. In a drift
+scan the dish does not move while data is taken: it is parked at an Az/El the source is about to cross and the rotation
+of the Earth carries the source through the beam. That takes one command per pass instead of a slew per grid point, which
+is well suited to strong calibrators such as Virgo-A and Cas A.
+
+Every pass parks the dish at the hour angle the source will have at the middle of the pass, with a different cross-drift
+offset in declination. During a pass the source moves through the beam along hour angle only, so:
+  - the time at which the power peaks gives the hour angle error of the pointing, and
+  - the peak power of each pass, against its declination offset, gives the declination error.
+
+Both are found with a Gaussian fit on the linear power (fit_gaussian), done in closed form with NumPy by fitting a
+parabola to the log of the baseline-subtracted power.
+'''
+
+# Import necessary libraries
+import numpy as np
+from excomctld import altaz2hadec, hadec2altaz
+from scan_planner import LAT, SIDEREAL_RATE
+
+def drift_park_position(targetAz, targetEl, cross_offset, elapsed, lat = LAT):
+    '''
+    Returns (az, el, ha, dec) of the park position for a pass: where the source now at (targetAz, targetEl) will be
+    elapsed seconds from now, moved cross_offset degrees in declination.
+    '''
+    ha, dec = altaz2hadec(targetEl, targetAz, lat)
+    ha_cross = float(ha) + SIDEREAL_RATE*elapsed
+    dec_park = float(dec) + cross_offset
+    el, az = hadec2altaz(np.array([ha_cross]), np.array([dec_park]), np.array([lat]))
+    return float(np.mod(az[0], 360)), float(el[0]), ha_cross, dec_park
+
+def fit_gaussian(x, y, edge = 0.25, level = 0.3):
+    '''
+    Fits y = baseline + amplitude*exp(-(x - center)**2 / (2*sigma**2)). The baseline is the median of the outer edge
+    fraction of the x range on both sides; the rest is a weighted parabola fit to log(y - baseline) over the points above
+    level times the peak. Returns a dict of amplitude, center, sigma and baseline, or None when there is no clear peak.
+    '''
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    good = np.isfinite(x) & np.isfinite(y)
+    x, y = x[good], y[good]
+    if len(x) < 5:
+        return None
+
+    low, high = np.min(x), np.max(x)
+    outer = (x <= low + edge*(high - low)) | (x >= high - edge*(high - low))
+    baseline = float(np.median(y[outer])) if np.any(outer) else float(np.min(y))
+    above = y - baseline
+    peak = np.max(above)
+    if peak <= 0:
+        return None
+
+    use = above > level*peak
+    if np.count_nonzero(use) < 3:
+        return None
+    # Weighting by the signal keeps the noisy wings from dominating the log fit
+    a, b, c = np.polyfit(x[use], np.log(above[use]), 2, w = above[use])
+    if a >= 0:
+        return None
+    center = -b / (2*a)
+    return {
+        "amplitude": float(np.exp(c - b**2 / (4*a))),
+        "center": float(center),
+        "sigma": float(np.sqrt(-1 / (2*a))),
+        "baseline": baseline
+    }
+
+def fit_drift_scan(df, dec):
+    '''
+    Fits the drift profile of every pass in df (columns 'Pass', 'Cross Offset', 'HA Off' and 'Power (dB)', as saved by
+    RotatorController.start_drift) and combines them into the pointing errors. dec is the declination of the source.
+
+    The HA error is the amplitude-weighted mean of the peak positions, in degrees of hour angle, and is also given on
+    the sky (times cos(dec)). The Dec error is minus the cross offset at which the pass amplitudes peak, which needs at
+    least three passes. Returns a dict with the per-pass fits under 'passes'.
+    '''
+    passes = []
+    for number, group in df.groupby('Pass'):
+        linear = 10**(group['Power (dB)'].to_numpy() / 10)
+        fit = fit_gaussian(group['HA Off'].to_numpy(), linear)
+        if fit is not None:
+            fit["pass"] = int(number)
+            fit["cross_offset"] = float(group['Cross Offset'].iloc[0])
+            passes.append(fit)
+
+    result = {"passes": passes, "ha_error": None, "ha_error_sky": None, "dec_error": None}
+    if not passes:
+        return result
+
+    amplitude = np.array([p["amplitude"] for p in passes])
+    center = np.array([p["center"] for p in passes])
+    result["ha_error"] = float(np.sum(amplitude*center) / np.sum(amplitude))
+    result["ha_error_sky"] = result["ha_error"] * float(np.cos(np.radians(dec)))
+
+    if len(passes) >= 3:
+        cross = np.array([p["cross_offset"] for p in passes])
+        # No baseline across passes: away from the source the fitted amplitude goes to zero
+        order = np.argsort(cross)
+        a, b, c = np.polyfit(cross[order], np.log(amplitude[order]), 2, w = amplitude[order])
+        if a < 0:
+            result["dec_error"] = float(b / (2*a))
+    return result
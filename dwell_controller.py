@@ -0,0 +1,122 @@
+# dwell_controller.py
+
+'''
+dwell_controller.py decides how long RotatorController stays on a point. Without it every point gets
+integration_time*scan seconds, which is the time the weakest point needs. With an SNRDwellController the Radio
+Astronomy channel power is read once per integration while dwelling, kept in a ring buffer of the most recent samples,
+and the scan moves on as soon as the mean power is known well enough:
+  - its SNR, (mean - baseline) / standard error of the mean, reaches target_snr, or
+  - its standard error, relative to the mean, drops to target_std_err,
+but never before min_dwell and never after max_dwell seconds. Bright points near the beam center then finish after a
+few integrations and only the faint ones use the full time.
+
+All statistics are on linear power. The baseline, unless given, is the lowest dwell mean measured so far in the scan.
+'''
+
+# Import necessary libraries
+import numpy as np
+
+class RingBuffer:
+
+    def __init__(self, capacity):
+        '''
+        Method to allocate a fixed-size buffer keeping the last capacity values.
+        '''
+        self.values = np.zeros(capacity)
+        self.capacity = capacity
+        self.count = 0
+        self.position = 0
+
+    def clear(self):
+        self.count = 0
+        self.position = 0
+
+    def append(self, value):
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def contents(self):
+        return self.values[:self.count] if self.count < self.capacity else self.values
+
+    def mean(self):
+        return float(np.mean(self.contents())) if self.count else np.nan
+
+    def std_err(self):
+        '''
+        Standard error of the mean of the buffered values, NaN with fewer than 2 values.
+        '''
+        if self.count < 2:
+            return np.nan
+        return float(np.std(self.contents(), ddof = 1) / np.sqrt(self.count))
+
+class SNRDwellController:
+
+    def __init__(self, min_dwell, max_dwell, target_snr = None, target_std_err = None, baseline = None,
+                 capacity = 256, min_samples = 3):
+        '''
+        Method to set the dwell bounds (seconds) and the thresholds; at least one of target_snr and target_std_err (a
+        fraction of the mean power) should be given, otherwise every dwell lasts max_dwell. baseline is a linear power.
+        '''
+        self.min_dwell = min_dwell
+        self.max_dwell = max_dwell
+        self.target_snr = target_snr
+        self.target_std_err = target_std_err
+        self.baseline = baseline
+        self.fixed_baseline = baseline is not None
+        self.min_samples = min_samples
+        self.buffer = RingBuffer(capacity)
+        self.sample_interval = 0.1
+        self.last = None
+
+    def set_integration_time(self, integration_time):
+        '''
+        Method to read the power once per Radio Astronomy integration, since faster reads only repeat the last value.
+        '''
+        if integration_time:
+            self.sample_interval = max(integration_time, 0.05)
+
+    def reset(self):
+        self.buffer.clear()
+
+    def add(self, power_db):
+        if power_db is not None:
+            self.buffer.append(10**(power_db / 10))
+
+    def snr(self):
+        '''
+        SNR of the dwell so far, NaN without a baseline or while the samples have no spread yet (a channel power that
+        has not updated since the last read gives identical samples).
+        '''
+        std_err = self.buffer.std_err()
+        if self.baseline is None or not std_err > 0:
+            return np.nan
+        return (self.buffer.mean() - self.baseline) / std_err
+
+    def done(self, elapsed):
+        '''
+        Method to tell whether a dwell that has lasted elapsed seconds can end.
+        '''
+        if elapsed >= self.max_dwell:
+            return True
+        if elapsed < self.min_dwell or self.buffer.count < self.min_samples:
+            return False
+        std_err = self.buffer.std_err()
+        # Identical samples say nothing about the noise, so neither test can pass on them
+        if not std_err > 0:
+            return False
+        if self.target_std_err is not None and std_err <= self.target_std_err*self.buffer.mean():
+            return True
+        return self.target_snr is not None and self.snr() >= self.target_snr
+
+    def finish(self, elapsed):
+        '''
+        Method to close a dwell: the lowest dwell mean becomes the baseline (unless one was given), and the samples,
+        mean, standard error and SNR of the dwell are returned as a dict and kept in self.last.
+        '''
+        mean = self.buffer.mean()
+        self.last = {"elapsed": elapsed, "samples": self.buffer.count, "mean": mean,
+                     "std_err": self.buffer.std_err(), "snr": self.snr()}
+        if not self.fixed_baseline and np.isfinite(mean) and (self.baseline is None or mean < self.baseline):
+            self.baseline = mean
+        return self.last
@@ -172,14 +172,14 @@ def altaz2hadec(alt, az, lat):
      (336.6828582472844, 19.182450965120406)
     """
         
-    d2r = np.math.pi / 180.0 
-    alt_r = alt*d2r
-    alt_r  = alt*d2r
-    az_r = az*d2r
-    lat_r = lat*d2r
+    # np.arctan2/np.arcsin rather than math.atan2/asin so that alt and az may also be arrays.
+    d2r = np.pi / 180.0 
+    alt_r = np.asarray(alt, float)*d2r
+    az_r = np.asarray(az, float)*d2r
+    lat_r = np.asarray(lat, float)*d2r
     
     # find local HOUR ANGLE (in degrees, from 0. to 360.)
-    ha = np.math.atan2(-np.sin(az_r)*np.cos(alt_r), -np.cos(az_r)*np.sin(lat_r)*np.cos(alt_r)+np.sin(alt_r)*np.cos(lat_r) )
+    ha = np.arctan2(-np.sin(az_r)*np.cos(alt_r), -np.cos(az_r)*np.sin(lat_r)*np.cos(alt_r)+np.sin(alt_r)*np.cos(lat_r) )
     ha = np.array((ha / d2r), float)
     #w = np.where(ha < 0.0)
     #if np.size(w) != 0: ha[w] = ha[w] + 360.0
@@ -188,7 +188,7 @@ def altaz2hadec(alt, az, lat):
     
     # Find declination (positive if north of Celestial Equator, negative if south)
     sindec = np.sin(lat_r)*np.sin(alt_r) + np.cos(lat_r)*np.cos(alt_r)*np.cos(az_r)
-    dec = np.math.asin(sindec)/d2r  # convert dec to degrees
+    dec = np.arcsin(sindec)/d2r  # convert dec to degrees
     
     return ha, dec
 
@@ -15,11 +15,11 @@ reverse API giving the address and port of this instance of the script. You have
 top left of the plugin GUI to open the channel details dialog where the reverse API can be configured.
 '''
 
-import requests
 import time
 import argparse
 from flask import Flask
 from flask import request, jsonify
+from sdrangel_client import get_client
 
 SDRANGEL_API_ADDR = None
 SDRANGEL_API_PORT = 8091
@@ -103,17 +103,17 @@ def get_device_frequency(sdrangel_ip, sdrangel_port, device_index):
         the report
     """
 # ----------------------------------------------------------------------
-    base_url = f'http://{sdrangel_ip}:{sdrangel_port}/sdrangel'
+    client = get_client(sdrangel_ip, sdrangel_port)
     device_frequency = None
     # get frequency from settings
-    r = requests.get(url=base_url + f'/deviceset/{device_index}/device/settings')
+    r = client.get(f'/deviceset/{device_index}/device/settings')
     if r.status_code // 100 == 2:
         device_content = r.json()
         for freq in gen_dict_extract('centerFrequency', device_content):
             device_frequency = freq
     # get frequency from report
     if device_frequency is None:
-        r = requests.get(url=base_url + f'/deviceset/{device_index}/device/report')
+        r = client.get(f'/deviceset/{device_index}/device/report', kind='report')
         if r.status_code // 100 != 2:
             return None
         device_content = r.json()
@@ -128,7 +128,7 @@ def adjust_channels(sdrangel_ip, sdrangel_port):
     """
 # ----------------------------------------------------------------------
     global TRACKING_DICT
-    base_url = f'http://{sdrangel_ip}:{sdrangel_port}/sdrangel'
+    client = get_client(sdrangel_ip, sdrangel_port)
     remove_keys = []
     for k in TRACKING_DICT:
         device_index = k[0]
@@ -137,7 +137,7 @@ def adjust_channels(sdrangel_ip, sdrangel_port):
         frequency_correction = TRACKER_OFFSET - tracking_item['trackerFrequency']
         frequency = tracking_item['channelFrequency'] + frequency_correction
         update_frequency_setting(tracking_item['requestContent'], 'inputFrequencyOffset', frequency)
-        r = requests.patch(url=base_url + f'/deviceset/{device_index}/channel/{channel_index}/settings', json=tracking_item['requestContent'])
+        r = client.patch(f'/deviceset/{device_index}/channel/{channel_index}/settings', json=tracking_item['requestContent'])
         if r.status_code // 100 != 2:
             remove_keys.append(k)
     for k in remove_keys:
@@ -159,7 +159,7 @@ def adjust_xvtr(sdrangel_ip, sdrangel_port, tracker_device_index, tracker_channe
     """
 # ----------------------------------------------------------------------
     global TRACKER_OFFSET
-    base_url = f'http://{sdrangel_ip}:{sdrangel_port}/sdrangel'
+    client = get_client(sdrangel_ip, sdrangel_port)
     correction = 0
     tracker_device_frequency = get_device_frequency(sdrangel_ip, sdrangel_port, tracker_device_index)
     # get correction from report
@@ -172,7 +172,7 @@ def adjust_xvtr(sdrangel_ip, sdrangel_port, tracker_device_index, tracker_channe
     if correction > -REFCORR_LIMIT and correction < REFCORR_LIMIT:
         return
     # apply correction
-    r = requests.get(url=base_url + f'/deviceset/{XVTR_DEVICE}/device/settings')
+    r = client.get(f'/deviceset/{XVTR_DEVICE}/device/settings')
     if r.status_code // 100 != 2:
         print(f'SDRangel::adjust_xvtr: {sdrangel_ip}:{SDRANGEL_API_PORT} get transverter device {XVTR_DEVICE} settings failed')
         return
@@ -180,14 +180,14 @@ def adjust_xvtr(sdrangel_ip, sdrangel_port, tracker_device_index, tracker_channe
     for xvtr_freq in gen_dict_extract('transverterDeltaFrequency', device_content):
         # device
         update_frequency_setting(device_content, 'transverterDeltaFrequency', xvtr_freq + correction)
-        r = requests.patch(url=base_url + f'/deviceset/{XVTR_DEVICE}/device/settings', json=device_content)
+        r = client.patch(f'/deviceset/{XVTR_DEVICE}/device/settings', json=device_content)
         if r.status_code // 100 != 2:
             print(f'SDRangel::adjust_xvtr: {sdrangel_ip}:{SDRANGEL_API_PORT} transverter device {XVTR_DEVICE} adjust failed')
             return
         # tracker
         TRACKER_OFFSET = tracker_offset + correction
         update_frequency_setting(tracker_content, 'inputFrequencyOffset', tracker_offset + correction)
-        r = requests.patch(url=base_url + f'/deviceset/{tracker_device_index}/channel/{tracker_channel_index}/settings', json=tracker_content)
+        r = client.patch(f'/deviceset/{tracker_device_index}/channel/{tracker_channel_index}/settings', json=tracker_content)
         if r.status_code // 100 != 2:
             print(f'SDRangel::adjust_xvtr: {sdrangel_ip}:{SDRANGEL_API_PORT} tracker [{tracker_device_index}:{tracker_channel_index}] adjust failed')
 
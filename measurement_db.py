@@ -0,0 +1,187 @@
+# measurement_db.py
+
+'''
+measurement_db.py keeps the pointing measurements (one peak per finished scan) in an SQLite database instead of the
+final CSV files (Pulsars.csv, East-SBand.csv, West-SBand.csv, ...). Each of those files held one frame with its own
+columns. Here a single table holds all frames: each row has the peak position, the target (center) position, the
+offset between them in that frame ('EL-AZ', 'X-Y' or 'HA-DEC'), and the source, telescope and measurement time.
+
+Adding a measurement is one INSERT in its own transaction, so nothing is rewritten as the table grows and an interrupted
+scan never leaves a half-written file. The table is indexed on source, telescope, frame and time, and query() returns
+each column as a NumPy array ready for fitting a pointing model.
+'''
+
+# Import necessary libraries
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["id", "source", "telescope", "frame", "measured_at", "peak_x", "peak_y", "center_x", "center_y",
+           "offset_x", "offset_y", "offset_x_err", "offset_y_err", "method", "session"]
+TEXT_COLUMNS = {"source", "telescope", "frame", "method", "session"}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    telescope TEXT,
+    frame TEXT NOT NULL,
+    measured_at REAL,
+    peak_x REAL, peak_y REAL,
+    center_x REAL, center_y REAL,
+    offset_x REAL, offset_y REAL,
+    offset_x_err REAL, offset_y_err REAL,
+    method TEXT,
+    session TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_source ON measurements (source);
+CREATE INDEX IF NOT EXISTS measurements_telescope ON measurements (telescope);
+CREATE INDEX IF NOT EXISTS measurements_frame ON measurements (frame);
+CREATE INDEX IF NOT EXISTS measurements_time ON measurements (measured_at);
+'''
+
+# Headers of the old final CSV files by frame: object name, then peak x/y, center x/y and offset x/y
+CSV_LAYOUTS = {
+    'EL-AZ': ["Object Name", "Az (Rot)", "El (Rot)", "Az", "El", "Az Off (Rot)", "El Off (Rot)"],
+    'X-Y': ["Object Name", "Peak X", "Peak Y", "Center X", "Center Y", "Offset X", "Offset Y"],
+}
+
+def to_unix(when):
+    '''
+    Seconds since 1970 (UTC) of a datetime, a pandas Timestamp, an ISO string or a number; None stays None.
+    '''
+    if when is None or isinstance(when, (int, float)):
+        return when
+    stamp = pd.Timestamp(when)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize('UTC')
+    return stamp.timestamp()
+
+def to_float(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+class MeasurementDB:
+
+    def __init__(self, path = 'pointing.db'):
+        '''
+        Method to open (or create) the database at path.
+        '''
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        # WAL lets the plotting and model scripts read while a scan is writing
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.allow_null_times()
+
+    def allow_null_times(self):
+        '''
+        Method to drop the NOT NULL of measured_at from a table made before imported rows were allowed an unknown time.
+        SQLite cannot alter a column, so the table is copied into a new one.
+        '''
+        info = self.connection.execute("PRAGMA table_info(measurements)").fetchall()
+        if not any(row[1] == "measured_at" and row[3] for row in info):
+            return
+        self.connection.execute("ALTER TABLE measurements RENAME TO measurements_old")
+        for index in ("source", "telescope", "frame", "time"):
+            self.connection.execute(f"DROP INDEX IF EXISTS measurements_{index}")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(
+            f"INSERT INTO measurements ({', '.join(COLUMNS)}) SELECT {', '.join(COLUMNS)} FROM measurements_old")
+        self.connection.execute("DROP TABLE measurements_old")
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, source, frame, peak, center, offset, telescope = None, measured_at = None, errors = None,
+            method = None, session = None):
+        '''
+        Method to append one measurement; peak, center and offset are (x, y) pairs in the frame and errors the 1-sigma
+        errors of the offset, if known. measured_at defaults to now. Returns the row id.
+        '''
+        measured_at = to_unix(measured_at) if measured_at is not None else time.time()
+        errors = errors if errors is not None else (None, None)
+        values = (source, telescope, frame, measured_at, *map(to_float, peak), *map(to_float, center),
+                  *map(to_float, offset), *map(to_float, errors), method, session)
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO measurements ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?'*len(values))})", values)
+        return cursor.lastrowid
+
+    def add_many(self, rows):
+        '''
+        Method to append many measurements in one transaction; rows are dicts keyed by COLUMNS (without id).
+        '''
+        names = COLUMNS[1:]
+        def convert(name, value):
+            if name == "measured_at":
+                return to_unix(value)
+            return value if name in TEXT_COLUMNS else to_float(value)
+        values = [tuple(convert(name, row.get(name)) for name in names) for row in rows]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO measurements ({', '.join(names)}) VALUES ({', '.join('?'*len(names))})", values)
+        return len(values)
+
+    def query(self, source = None, telescope = None, frame = None, start = None, end = None, columns = None):
+        '''
+        Returns a dict of column name to NumPy array (float for numbers, object for text) of the measurements matching
+        every filter given, in time order (rows without a time, such as imported ones, first and NaN). start and end
+        bound measured_at and take the same values as to_unix.
+        '''
+        columns = columns or COLUMNS
+        conditions = []
+        parameters = []
+        for name, value in (("source", source), ("telescope", telescope), ("frame", frame)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                parameters.append(value)
+        if start is not None:
+            conditions.append("measured_at >= ?")
+            parameters.append(to_unix(start))
+        if end is not None:
+            conditions.append("measured_at < ?")
+            parameters.append(to_unix(end))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM measurements{where} ORDER BY measured_at", parameters).fetchall()
+
+        arrays = {}
+        for number, name in enumerate(columns):
+            values = [row[number] for row in rows]
+            if name in TEXT_COLUMNS:
+                arrays[name] = np.array(values, dtype = object)
+            elif name == "id":
+                arrays[name] = np.array(values, dtype = np.int64)
+            else:
+                arrays[name] = np.array(values, dtype = float)
+        return arrays
+
+    def sources(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT source FROM measurements ORDER BY source")]
+
+    def import_csv(self, path, frame = None, telescope = None):
+        '''
+        Method to load one of the old final CSV files. The columns are taken by name for the layout of the frame
+        (CSV_LAYOUTS: 'Az (Rot)', 'El (Rot)', ... for EL-AZ, 'Peak X', 'Peak Y', ... for X-Y); without a frame it is
+        found from the header. The files have no times, so measured_at is left empty. Returns the number of rows added.
+        '''
+        data = pd.read_csv(path)
+        data.columns = [column.strip() for column in data.columns]
+        frames = [name for name, layout in CSV_LAYOUTS.items() if set(layout) <= set(data.columns)]
+        if frame is None:
+            if len(frames) != 1:
+                raise ValueError(f"{path}: the header matches none of the final CSV layouts {list(CSV_LAYOUTS)}")
+            frame = frames[0]
+        elif frame not in frames:
+            raise ValueError(f"{path}: the header does not have the {frame} columns {CSV_LAYOUTS.get(frame)}")
+
+        names = ["source", "peak_x", "peak_y", "center_x", "center_y", "offset_x", "offset_y"]
+        rows = []
+        for values in data[CSV_LAYOUTS[frame]].itertuples(index = False):
+            row = dict(zip(names, values))
+            row.update({"telescope": telescope, "frame": frame, "measured_at": None, "method": "csv import",
+                        "session": path})
+            rows.append(row)
+        return self.add_many(rows)
@@ -0,0 +1,190 @@
+# model_uncertainty.py
+
+'''
+model_uncertainty.py puts confidence intervals on the pointing_model coefficients before they are sent to the DFM. The
+covariance of the least squares fit assumes independent Gaussian errors; resampling the measurements does not, so
+poorly constrained or correlated terms show up before they reach the mount.
+
+  - bootstrap: the model is refitted to many resamples of the measurements drawn with replacement, and the intervals
+    are percentiles of the refitted coefficients.
+  - jackknife: the model is refitted with each measurement left out in turn, and the intervals come from the spread
+    of those fits.
+
+Both resample whole measurements (the dh and ddec rows together). The weighted design matrix and observations are
+placed once in shared memory (multiprocessing.shared_memory) and the resamples are split into batches over a process
+pool with one process per core, each attaching to the same arrays instead of receiving its own copy. Each refit is the
+normal equations with the resample counts as weights, so a batch only does p x p solves.
+'''
+
+# Import necessary libraries
+import os
+import numpy as np
+from statistics import NormalDist
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from pointing_model import TERMS, ANGLE_TERMS, weighted_system, measurement_offsets
+from scan_planner import LAT
+
+# Arrays of the worker process, attached once by attach_shared
+shared = {}
+
+def attach_shared(names, shapes):
+    '''
+    Pool initializer: maps the shared design and observation arrays into this process.
+    '''
+    for key, name, shape in zip(("design", "observed"), names, shapes):
+        block = shared_memory.SharedMemory(name = name)
+        shared[key + "_block"] = block
+        shared[key] = np.ndarray(shape, dtype = float, buffer = block.buf)
+
+def solve_counts(design, observed, counts):
+    '''
+    Least squares solutions for a batch of (k, n) measurement counts (how many times each measurement is in each
+    resample) against the stacked (2n, p) design. Returns a (k, p) array.
+    '''
+    row_counts = np.hstack((counts, counts))
+    normal = np.einsum('kr,ri,rj->kij', row_counts, design, design, optimize = True)
+    right = (row_counts*observed) @ design
+    # A resample with few distinct measurements can leave the normal matrix singular; the pseudo-inverse then gives the
+    # minimum-norm solution, as lstsq does in fit_pointing_model, instead of failing
+    return (np.linalg.pinv(normal, hermitian = True) @ right[:, :, None])[:, :, 0]
+
+def bootstrap_batch(args):
+    '''
+    Refits one batch of bootstrap resamples, drawn from its own seed. args is (seed, count, n).
+    '''
+    seed, count, n = args
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((count, n))
+    for number in range(count):
+        counts[number] = np.bincount(rng.integers(0, n, n), minlength = n)
+    return solve_counts(shared["design"], shared["observed"], counts)
+
+def jackknife_batch(args):
+    '''
+    Refits the model leaving out each measurement of range(start, stop) in turn. args is (start, stop, n).
+    '''
+    start, stop, n = args
+    counts = np.ones((stop - start, n))
+    counts[np.arange(stop - start), np.arange(start, stop)] = 0
+    return solve_counts(shared["design"], shared["observed"], counts)
+
+def run_shared(design, observed, function, tasks, workers):
+    '''
+    Runs function over tasks with design and observed in shared memory, in a pool of workers processes (or in this
+    process when workers is 1). Returns the stacked results.
+    '''
+    if workers == 1:
+        shared["design"], shared["observed"] = design, observed
+        return np.vstack([function(task) for task in tasks])
+
+    blocks = []
+    try:
+        for array in (design, observed):
+            block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype = float, buffer = block.buf)[...] = array
+        with ProcessPoolExecutor(max_workers = workers, initializer = attach_shared,
+                                 initargs = ([block.name for block in blocks], [design.shape, observed.shape])) as pool:
+            return np.vstack(list(pool.map(function, tasks)))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def check_rank(design, terms, name):
+    rank = np.linalg.matrix_rank(design)
+    if rank < len(terms):
+        print(f"{name}: the measurements only constrain {rank} of {len(terms)} terms, the intervals of the others are "
+              f"not meaningful")
+
+def summarize(estimate, samples, terms, low, high, std):
+    '''
+    Collects the per-term estimate, interval and standard error and the term correlation matrix from the resampled
+    coefficients.
+    '''
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        correlation = np.corrcoef(samples, rowvar = False)
+    return {"terms": list(terms), "estimate": dict(zip(terms, map(float, estimate))),
+            "low": dict(zip(terms, map(float, low))), "high": dict(zip(terms, map(float, high))),
+            "std": dict(zip(terms, map(float, std))), "correlation": correlation, "samples": samples}
+
+def bootstrap(ha, dec, dha, ddec, sigma = None, terms = TERMS, lat = LAT, resamples = 2000, confidence = 0.95,
+              workers = None, batch = 100, seed = 0):
+    '''
+    Bootstrap intervals of the pointing model terms. The arguments are those of pointing_model.fit_pointing_model;
+    workers defaults to every core. Returns a dict with 'estimate', 'low', 'high' and 'std' per term (degrees or
+    ratios), the 'correlation' matrix of the terms and the resampled coefficients in 'samples', or None.
+    '''
+    system = weighted_system(ha, dec, dha, ddec, sigma, terms, lat)
+    if system is None:
+        print(f"Bootstrap: too few measurements for {len(terms)} terms")
+        return None
+    design, observed = system[0], system[1]
+    n = len(system[4])
+    check_rank(design, terms, "Bootstrap")
+    workers = workers or os.cpu_count() or 1
+
+    # Every batch has its own seed from one SeedSequence, so the result does not depend on the number of workers
+    seeds = np.random.SeedSequence(seed).spawn((resamples + batch - 1) // batch)
+    tasks = [(seeds[number], min(batch, resamples - number*batch), n) for number in range(len(seeds))]
+    samples = run_shared(design, observed, bootstrap_batch, tasks, workers)
+
+    estimate = np.linalg.lstsq(design, observed, rcond = None)[0]
+    tail = (1 - confidence) / 2*100
+    low, high = np.percentile(samples, [tail, 100 - tail], axis = 0)
+    return summarize(estimate, samples, terms, low, high, samples.std(axis = 0, ddof = 1))
+
+def jackknife(ha, dec, dha, ddec, sigma = None, terms = TERMS, lat = LAT, confidence = 0.95, workers = None,
+              batch = 200):
+    '''
+    Jackknife (leave one measurement out) intervals of the pointing model terms, as estimate +/- z*standard error. Takes
+    the same arguments and returns the same dict as bootstrap.
+    '''
+    system = weighted_system(ha, dec, dha, ddec, sigma, terms, lat)
+    if system is None:
+        print(f"Jackknife: too few measurements for {len(terms)} terms")
+        return None
+    design, observed = system[0], system[1]
+    n = len(system[4])
+    if 2*(n - 1) <= len(terms):
+        print(f"Jackknife: too few measurements for {len(terms)} terms")
+        return None
+    check_rank(design, terms, "Jackknife")
+    workers = workers or os.cpu_count() or 1
+
+    tasks = [(start, min(start + batch, n), n) for start in range(0, n, batch)]
+    samples = run_shared(design, observed, jackknife_batch, tasks, workers)
+
+    estimate = np.linalg.lstsq(design, observed, rcond = None)[0]
+    std = np.sqrt((n - 1) / n*np.sum((samples - samples.mean(axis = 0))**2, axis = 0))
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return summarize(estimate, samples, terms, estimate - z*std, estimate + z*std, std)
+
+def uncertainty_from_db(db, telescope = None, source = None, method = 'bootstrap', terms = TERMS, lat = LAT, **kwargs):
+    '''
+    Loads the measurements of a MeasurementDB as pointing_model.fit_from_db does and runs bootstrap or jackknife.
+    '''
+    data = db.query(source = source, telescope = telescope)
+    ha, dec, dha, ddec, sigma = measurement_offsets(data, lat)
+    function = jackknife if method == 'jackknife' else bootstrap
+    return function(ha, dec, dha, ddec, sigma, terms, lat, **kwargs)
+
+def print_intervals(result, confidence = 0.95):
+    for term in result["terms"]:
+        scale = 3600 if term in ANGLE_TERMS else 1
+        print(f"{term:>5} {result['estimate'][term]*scale:12.4f}  [{result['low'][term]*scale:.4f}, "
+              f"{result['high'][term]*scale:.4f}] ({confidence:.0%})")
+    correlation = result["correlation"]
+    strong = [(result["terms"][i], result["terms"][j], correlation[i, j]) for i in range(len(result["terms"]))
+              for j in range(i + 1, len(result["terms"])) if abs(correlation[i, j]) > 0.8]
+    for first, second, value in strong:
+        print(f"{first} and {second} are strongly correlated ({value:.2f})")
+
+if __name__ == "__main__":
+    from measurement_db import MeasurementDB
+    import sys
+    db = MeasurementDB(sys.argv[1] if len(sys.argv) > 1 else 'pointing.db')
+    result = uncertainty_from_db(db, telescope = sys.argv[2] if len(sys.argv) > 2 else None)
+    if result is not None:
+        print_intervals(result)
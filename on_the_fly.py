@@ -0,0 +1,179 @@
+# on_the_fly.py
+
+'''
+on_the_fly.py holds the pieces of the on-the-fly (OTF) scanning mode of RasterScanner.RotatorController. Rather than
+stopping on every point of the grid and integrating, the rotator is sent along whole rows (or the rose curve) and the
+Radio Astronomy channel keeps integrating while it moves.
+
+OTFRecorder polls the GS232Controller report and the Radio Astronomy report from two background threads, so the rotator
+position is sampled at a much higher rate than the power. tag_samples() then places every power sample on the sky by
+interpolating the rotator track at the middle of that sample's integration.
+
+The offsets are measured from where the Star Tracker target is at the time of each sample, which is predicted along its
+sidereal track from one settings read with scan_planner.predict_trajectory, so no extra requests are needed for it.
+'''
+
+# Import necessary libraries
+import time
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from scan_planner import predict_trajectory, wrap_azimuth
+
+def otf_rows(grid_size, spacing, precision, overshoot = None):
+    '''
+    Returns the sweeps of a square OTF map as a list of [start, end] Az/El offset pairs. Rows are grid_size rows of
+    constant elevation offset run back and forth in azimuth (serpentine), each running overshoot degrees (half a spacing
+    by default) past the edge of the map so the rotator is up to speed over the map itself.
+    '''
+    if overshoot is None:
+        overshoot = spacing / 2
+    half = spacing * (grid_size // 2)
+    sweeps = []
+    for row in range(grid_size):
+        el = round(-half + row*spacing, precision)
+        start, end = round(-half - overshoot, precision), round(half + overshoot, precision)
+        if row % 2:
+            start, end = end, start
+        sweeps.append([[start, el], [end, el]])
+    return sweeps
+
+def otf_rose(coordinates):
+    '''
+    Returns a rose curve from generate_daisy_grid as a single sweep through all of its points.
+    '''
+    return [[list(coord) for coord in coordinates]]
+
+def tag_samples(track_time, track_az, track_el, sample_time, max_gap = 1.0):
+    '''
+    Interpolates the rotator track (time, azimuth, elevation arrays) at sample_time. Samples outside the track, or
+    falling in a gap of more than max_gap seconds between track points, are marked invalid. Returns (az, el, valid).
+    '''
+    track_time = np.asarray(track_time, float)
+    sample_time = np.asarray(sample_time, float)
+    if len(track_time) < 2:
+        nan = np.full(sample_time.shape, np.nan)
+        return nan, nan.copy(), np.zeros(sample_time.shape, bool)
+
+    # Unwrap so an azimuth track crossing 0/360 interpolates through the short way
+    az_unwrapped = np.degrees(np.unwrap(np.radians(track_az)))
+    az = np.mod(np.interp(sample_time, track_time, az_unwrapped), 360)
+    el = np.interp(sample_time, track_time, track_el)
+
+    after = np.clip(np.searchsorted(track_time, sample_time), 1, len(track_time) - 1)
+    gap = track_time[after] - track_time[after - 1]
+    valid = (sample_time >= track_time[0]) & (sample_time <= track_time[-1]) & (gap <= max_gap)
+    return az, el, valid
+
+class OTFRecorder:
+
+    def __init__(self, client, rotator_report_url, astronomy_report_url, rotator_rate = 10.0, power_rate = 5.0):
+        '''
+        Method to initialize the recorder with the shared SDRangelClient and the report URL's to poll. The rates are
+        polls per second; the power rate needs to be no faster than the Radio Astronomy integration to avoid repeats.
+        '''
+        self.client = client
+        self.rotator_report_url = rotator_report_url
+        self.astronomy_report_url = astronomy_report_url
+        self.rotator_rate = rotator_rate
+        self.power_rate = power_rate
+        self.sweep = -1
+        self.track = []
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def poll(self, url, rate, record):
+        while not self.stop_event.is_set():
+            started = time.time()
+            try:
+                data = self.client.get_json(url, kind = "report")
+                if data:
+                    record(started, data)
+            except Exception as e:
+                print(f"Exception while recording OTF reports: {e}")
+            self.stop_event.wait(max(1.0/rate - (time.time() - started), 0))
+
+    def record_position(self, t, data):
+        report = data.get("GS232ControllerReport")
+        if report is not None:
+            self.track.append((t, report["currentAzimuth"], report["currentElevation"],
+                               report["targetAzimuth"], report["targetElevation"], self.sweep))
+
+    def record_power(self, t, data):
+        report = data.get("RadioAstronomyReport")
+        if report is not None and "channelPowerDB" in report:
+            self.samples.append((t, report["channelPowerDB"], self.sweep))
+
+    def start(self):
+        '''
+        Method to start both polling threads.
+        '''
+        self.stop_event.clear()
+        self.threads = [
+            threading.Thread(target = self.poll, args = (self.rotator_report_url, self.rotator_rate, self.record_position), daemon = True),
+            threading.Thread(target = self.poll, args = (self.astronomy_report_url, self.power_rate, self.record_power), daemon = True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def latest(self):
+        '''
+        Method to return the most recent (time, current az, current el, target az, target el, sweep), or None.
+        '''
+        return self.track[-1] if self.track else None
+
+    def wait_for(self, since, threshold, cancel = None, timeout = None):
+        '''
+        Method to block until a position recorded after since (time.time()) is within threshold degrees of the target
+        in the same report. Returns False if cancel() returns True or the timeout (seconds) runs out first.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if cancel is not None and cancel():
+                return False
+            if deadline is not None and time.time() > deadline:
+                return False
+            latest = self.latest()
+            if latest is not None and latest[0] > since:
+                _, currentAz, currentEl, targetAz, targetEl, _ = latest
+                if (abs(wrap_azimuth(currentAz - targetAz)) <= threshold and
+                    abs(currentEl - targetEl) <= threshold):
+                    return True
+            time.sleep(1.0/self.rotator_rate)
+
+    def tagged(self, targetAz, targetEl, target_time, integration_time = 0.0, max_gap = 1.0):
+        '''
+        Method to return a DataFrame with every power sample recorded during a sweep, placed on the sky at the middle of
+        its integration. (targetAz, targetEl) is the Star Tracker target read at target_time (time.time()), which the
+        offsets are measured from.
+        '''
+        track = np.array(self.track, float).reshape(-1, 6)
+        samples = np.array(self.samples, float).reshape(-1, 3)
+        samples = samples[samples[:, 2] >= 0]
+        if len(samples) == 0:
+            return None
+
+        sample_time = samples[:, 0] - integration_time/2
+        az, el, valid = tag_samples(track[:, 0], track[:, 1], track[:, 2], sample_time, max_gap)
+        baseAz, baseEl = predict_trajectory(targetAz, targetEl, sample_time - target_time)
+
+        df = pd.DataFrame({
+            'UTC': [datetime.fromtimestamp(t, timezone.utc).isoformat() for t in sample_time],
+            'Power (dB)': samples[:, 1],
+            'Sweep': samples[:, 2].astype(int),
+            'Az (Rot)': az,
+            'El (Rot)': el,
+            'Az': baseAz,
+            'El': baseEl,
+            'Az Off (Rot)': wrap_azimuth(az - baseAz),
+            'El Off (Rot)': el - baseEl
+        })
+        return df[valid].reset_index(drop = True)
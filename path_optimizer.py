@@ -0,0 +1,137 @@
+# path_optimizer.py
+
+'''
+path_optimizer.py reorders the points of a scan so the rotator spends as little time as possible slewing between them.
+generate_offsets_grid always produces a spiral, map_offsets_grid and DFMClass.get_coordinates serpentines, and
+generate_daisy_grid follows the rose curve, none of which account for how fast each axis of the mount actually moves.
+
+MountModel holds a top speed and acceleration per axis. A move on one axis follows a trapezoidal velocity profile (or
+a triangular one when the move is too short to reach top speed), both axes move at the same time, so the slew between
+two points takes as long as the slower axis plus a settle time. order_points() builds a nearest-neighbour tour from the
+first point and improves it with 2-opt segment reversals, keeping the first point (normally the (0, 0) center) first.
+scan_duration() predicts how long a scan takes in a given order, so the order can be compared before and after.
+
+The points are taken as offsets on the two mount axes. Az/El offsets are exactly that; HA-DEC and X-Y offsets are close
+enough for the small grids used here that ordering them directly still gives a good tour.
+'''
+
+# Import necessary libraries
+import numpy as np
+
+class MountModel:
+
+    def __init__(self, az_velocity = 0.5, el_velocity = 0.5, az_acceleration = 0.2, el_acceleration = 0.2, settle = 1.0):
+        '''
+        Method to initialize the axis model of the mount. Velocities are in degrees per second, accelerations in degrees
+        per second squared and the settle time in seconds. The defaults are conservative values for the 26 m mounts and
+        should be replaced with measured ones where known.
+        '''
+        self.az_velocity = az_velocity
+        self.el_velocity = el_velocity
+        self.az_acceleration = az_acceleration
+        self.el_acceleration = el_acceleration
+        self.settle = settle
+
+    @staticmethod
+    def axis_time(distance, velocity, acceleration):
+        '''
+        Time (seconds) to move one axis by distance degrees from rest to rest. Moves shorter than velocity**2/acceleration
+        never reach top speed and take 2*sqrt(d/a); longer ones take d/v + v/a.
+        '''
+        distance = np.abs(np.asarray(distance, float))
+        ramp = velocity**2 / acceleration
+        return np.where(distance < ramp,
+                        2*np.sqrt(distance / acceleration),
+                        distance / velocity + velocity / acceleration)
+
+    def slew_time(self, az_distance, el_distance):
+        '''
+        Time (seconds) for a slew of the given Az/El distances, with both axes moving at once. Zero-length slews cost
+        nothing, not even the settle time.
+        '''
+        az_time = self.axis_time(az_distance, self.az_velocity, self.az_acceleration)
+        el_time = self.axis_time(el_distance, self.el_velocity, self.el_acceleration)
+        moving = (np.abs(az_distance) > 0) | (np.abs(el_distance) > 0)
+        return np.where(moving, np.maximum(az_time, el_time) + self.settle, 0.0)
+
+    def cost_matrix(self, points):
+        '''
+        Returns the (N, N) matrix of slew times between every pair of points.
+        '''
+        points = np.asarray(points, float).reshape(-1, 2)
+        delta = points[:, None, :] - points[None, :, :]
+        return self.slew_time(delta[..., 0], delta[..., 1])
+
+def scan_duration(points, model, dwell = 0.0, start = None):
+    '''
+    Predicted time (seconds) to visit points in the given order: the slews between them plus dwell seconds on each.
+    start is where the rotator is beforehand, by default the first point.
+    '''
+    points = np.asarray(points, float).reshape(-1, 2)
+    if len(points) == 0:
+        return 0.0
+    path = points if start is None else np.vstack(([start], points))
+    steps = np.diff(path, axis = 0)
+    return float(np.sum(model.slew_time(steps[:, 0], steps[:, 1])) + dwell*len(points))
+
+def nearest_neighbour(cost):
+    '''
+    Returns a visiting order that starts at index 0 and always goes to the closest unvisited point.
+    '''
+    count = len(cost)
+    order = [0]
+    visited = np.zeros(count, bool)
+    visited[0] = True
+    for _ in range(count - 1):
+        row = np.where(visited, np.inf, cost[order[-1]])
+        following = int(np.argmin(row))
+        order.append(following)
+        visited[following] = True
+    return np.array(order)
+
+def two_opt(order, cost, max_passes = 50):
+    '''
+    Improves an open tour (fixed first point, free last point) by reversing segments order[i:j+1] whenever that
+    shortens the total slew time, until a full pass finds nothing or max_passes is reached.
+    '''
+    order = np.array(order)
+    count = len(order)
+    if count < 4:
+        return order
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, count - 1):
+            j = np.arange(i + 1, count)
+            before = order[i - 1]
+            after = np.append(order[j[:-1] + 1], -1)
+            removed = cost[before, order[i]] + np.where(after >= 0, cost[order[j], after], 0.0)
+            added = cost[before, order[j]] + np.where(after >= 0, cost[order[i], after], 0.0)
+            gain = removed - added
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                order[i:j[best] + 1] = order[i:j[best] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+def order_points(points, model = None, dwell = 0.0):
+    '''
+    Reorders points (a list of [az, el] offsets, as returned by the grid generators) to cut the total slew time.
+    Returns (ordered points as a list of lists, predicted duration before, predicted duration after) in seconds.
+    '''
+    if model is None:
+        model = MountModel()
+    array = np.asarray(points, float).reshape(-1, 2)
+    before = scan_duration(array, model, dwell)
+    if len(array) < 3:
+        return [list(p) for p in points], before, before
+
+    cost = model.cost_matrix(array)
+    order = two_opt(nearest_neighbour(cost), cost)
+    ordered = [list(points[i]) for i in order]
+    after = scan_duration(array[order], model, dwell)
+    if after > before:
+        # Never hand back something slower than what was given
+        return [list(p) for p in points], before, before
+    return ordered, before, after
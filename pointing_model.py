@@ -0,0 +1,194 @@
+# pointing_model.py
+
+'''
+pointing_model.py turns the stored peak offsets (measurement_db) into a pointing model for the equatorial (HA-Dec)
+mount, in the coefficients the DFM takes with its COEFF command (#18, see dfmlib). Each measurement gives where the
+source really was relative to where the mount pointed, converted to an hour angle error dh and a declination error
+ddec at the target position (h, dec). The model is the usual sum of mount terms:
+
+    term   dh                                  ddec
+    IH     -1                                  0                                  index error in HA
+    ID     0                                   -1                                 index error in Dec
+    CH     -sec(dec)                           0                                  collimation
+    NP     -tan(dec)                           0                                  HA/Dec axis non-perpendicularity
+    MA     -cos(h) tan(dec)                    sin(h)                             polar axis azimuth error
+    ME     sin(h) tan(dec)                     cos(h)                             polar axis elevation error
+    TF     cos(lat) sin(h) sec(dec)            cos(lat) cos(h) sin(dec) - sin(lat) cos(dec)    tube flexure
+    HAR    h                                   0                                  HA scale (ratio) error
+    DECR   0                                   dec                                Dec scale (ratio) error
+
+All rows of the design matrix are built at once from the measurement arrays and solved by weighted least squares, each
+measurement weighted by its offset error when the fit that found it gave one. Angles are in degrees throughout, except
+the residual RMS (arcseconds on the sky) and the DFM coefficients (arcseconds, the ratios unitless).
+'''
+
+# Import necessary libraries
+import numpy as np
+from excomctld import altaz2hadec
+from xymount import xy2hadec
+from scan_planner import LAT
+
+TERMS = ["IH", "ID", "CH", "NP", "MA", "ME", "TF", "HAR", "DECR"]
+# Order of the DFM COEFF command; TFLX is the tube flexure TF. IH and ID are not in it (they are the zero point, #2)
+DFM_TERMS = ["ME", "MA", "CH", "NP", "TF", "HAR", "DECR"]
+ANGLE_TERMS = {"IH", "ID", "CH", "NP", "MA", "ME", "TF"}
+# Angle unit of the COEFF arguments: arcseconds (the unit of the EXCOMM offset command, #4). The DFM manual does not
+# say which unit COEFF takes, so this is an assumption until it is checked on the mount; see upload_model.
+DFM_ANGLE_UNIT = 'arcsec'
+DFM_ANGLE_SCALE = {'arcsec': 3600, 'arcmin': 60, 'deg': 1}
+
+def wrap_degrees(angle):
+    return (np.asarray(angle, float) + 180) % 360 - 180
+
+def design_matrix(ha, dec, terms = TERMS, lat = LAT):
+    '''
+    Returns the (n, p) design matrices of dh and ddec for the terms (in that column order) at hour angles ha and
+    declinations dec in degrees.
+    '''
+    h = np.radians(wrap_degrees(ha))
+    d = np.radians(np.asarray(dec, float))
+    phi = np.radians(lat)
+    zero = np.zeros_like(h)
+    one = np.ones_like(h)
+    columns = {
+        "IH": (-one, zero),
+        "ID": (zero, -one),
+        "CH": (-1 / np.cos(d), zero),
+        "NP": (-np.tan(d), zero),
+        "MA": (-np.cos(h)*np.tan(d), np.sin(h)),
+        "ME": (np.sin(h)*np.tan(d), np.cos(h)),
+        "TF": (np.cos(phi)*np.sin(h) / np.cos(d), np.cos(phi)*np.cos(h)*np.sin(d) - np.sin(phi)*np.cos(d)),
+        "HAR": (np.degrees(h), zero),
+        "DECR": (zero, np.degrees(d)),
+    }
+    design_ha = np.column_stack([columns[term][0] for term in terms])
+    design_dec = np.column_stack([columns[term][1] for term in terms])
+    return design_ha, design_dec
+
+def measurement_offsets(data, lat = LAT):
+    '''
+    Converts measurement arrays (as returned by MeasurementDB.query) of any frame to HA-Dec. Returns (ha, dec, dha,
+    ddec, sigma): the target position, the peak minus the target, and the offset error per point (NaN if unknown).
+    '''
+    frame = data["frame"]
+    n = len(frame)
+    ha, dec = np.full(n, np.nan), np.full(n, np.nan)
+    ha_peak, dec_peak = np.full(n, np.nan), np.full(n, np.nan)
+
+    # Each frame is converted for all of its rows in one call
+    rows = frame == 'HA-DEC'
+    ha[rows], dec[rows] = data["center_x"][rows], data["center_y"][rows]
+    ha_peak[rows], dec_peak[rows] = data["peak_x"][rows], data["peak_y"][rows]
+    rows = frame == 'EL-AZ'
+    if rows.any():
+        ha[rows], dec[rows] = altaz2hadec(data["center_y"][rows], data["center_x"][rows], lat)
+        ha_peak[rows], dec_peak[rows] = altaz2hadec(data["peak_y"][rows], data["peak_x"][rows], lat)
+    rows = frame == 'X-Y'
+    if rows.any():
+        ha[rows], dec[rows] = xy2hadec(data["center_x"][rows], data["center_y"][rows], lat)
+        ha_peak[rows], dec_peak[rows] = xy2hadec(data["peak_x"][rows], data["peak_y"][rows], lat)
+
+    errors = np.column_stack((data["offset_x_err"], data["offset_y_err"]))
+    known = np.isfinite(errors)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        sigma = np.where(known, errors, 0).sum(axis = 1) / known.sum(axis = 1)
+    return wrap_degrees(ha), dec, wrap_degrees(ha_peak - ha), dec_peak - dec, sigma
+
+def weighted_system(ha, dec, dha, ddec, sigma = None, terms = TERMS, lat = LAT):
+    '''
+    Builds the weighted least squares problem of fit_pointing_model from the measurements with no missing values. Returns
+    (design, observed, design_ha, design_dec, dha, ddec, cos_dec, weight): the stacked (2n, p) weighted design with the
+    dh rows of all n measurements first and then their ddec rows, the matching observations, and the unweighted parts.
+    Returns None when there are not more rows than terms.
+    '''
+    ha, dec, dha, ddec = (np.asarray(values, float) for values in (ha, dec, dha, ddec))
+    good = np.isfinite(ha) & np.isfinite(dec) & np.isfinite(dha) & np.isfinite(ddec)
+    ha, dec, dha, ddec = ha[good], dec[good], dha[good], ddec[good]
+    n = len(ha)
+    if 2*n <= len(terms):
+        return None
+
+    weight = np.ones(n)
+    if sigma is not None:
+        sigma = np.asarray(sigma, float)[good]
+        known = np.isfinite(sigma) & (sigma > 0)
+        if known.any():
+            sigma = np.where(known, sigma, np.median(sigma[known]))
+            weight = 1 / sigma**2
+
+    design_ha, design_dec = design_matrix(ha, dec, terms, lat)
+    cos_dec = np.cos(np.radians(dec))
+    root = np.sqrt(weight)
+    design = np.vstack((design_ha*(cos_dec*root)[:, None], design_dec*root[:, None]))
+    observed = np.concatenate((dha*cos_dec*root, ddec*root))
+    return design, observed, design_ha, design_dec, dha, ddec, cos_dec, weight
+
+def fit_pointing_model(ha, dec, dha, ddec, sigma = None, terms = TERMS, lat = LAT):
+    '''
+    Weighted least squares fit of the terms to the HA and Dec errors (degrees). The dh rows are weighted on the sky
+    (times cos(dec)), and every point by 1/sigma**2 when sigma is given; points with unknown sigma get the median of the
+    known ones.
+
+    Returns a dict with 'coefficients' and 'errors' (dicts by term, degrees or ratios), 'residual_ha' and 'residual_dec'
+    (degrees, dh on the sky), 'rms' (arcsec on the sky), 'chi2' (reduced), 'n' and 'terms', or None with too few points.
+    '''
+    system = weighted_system(ha, dec, dha, ddec, sigma, terms, lat)
+    if system is None:
+        print(f"Pointing model: too few measurements for {len(terms)} terms")
+        return None
+    design, observed, design_ha, design_dec, dha, ddec, cos_dec, weight = system
+    n = len(dha)
+
+    solution, _, rank, _ = np.linalg.lstsq(design, observed, rcond = None)
+    if rank < len(terms):
+        print(f"Pointing model: the measurements only constrain {rank} of {len(terms)} terms")
+
+    residual_ha = (dha - design_ha @ solution)*cos_dec
+    residual_dec = ddec - design_dec @ solution
+    dof = max(2*n - len(terms), 1)
+    chi2 = float((np.sum(weight*residual_ha**2) + np.sum(weight*residual_dec**2)) / dof)
+    covariance = np.linalg.pinv(design.T @ design)*chi2
+    errors = np.sqrt(np.abs(np.diag(covariance)))
+    rms = float(np.sqrt(np.mean(np.concatenate((residual_ha, residual_dec))**2))*3600)
+
+    return {"terms": list(terms), "coefficients": dict(zip(terms, map(float, solution))),
+            "errors": dict(zip(terms, map(float, errors))), "covariance": covariance,
+            "residual_ha": residual_ha, "residual_dec": residual_dec, "rms": rms, "chi2": chi2, "n": n}
+
+def fit_from_db(db, telescope = None, source = None, start = None, end = None, terms = TERMS, lat = LAT):
+    '''
+    Loads the measurements of a MeasurementDB (filtered as in MeasurementDB.query) and fits the model to them.
+    '''
+    data = db.query(source = source, telescope = telescope, start = start, end = end)
+    ha, dec, dha, ddec, sigma = measurement_offsets(data, lat)
+    return fit_pointing_model(ha, dec, dha, ddec, sigma, terms, lat)
+
+def print_model(model):
+    for term in model["terms"]:
+        scale = 3600 if term in ANGLE_TERMS else 1
+        unit = '"' if term in ANGLE_TERMS else ''
+        print(f"{term:>5} {model['coefficients'][term]*scale:12.4f}{unit} +/- {model['errors'][term]*scale:.4f}{unit}")
+    print(f"{model['n']} measurements, RMS {model['rms']:.1f}\", reduced chi2 {model['chi2']:.3g}")
+
+def dfm_coefficients(model, unit = DFM_ANGLE_UNIT):
+    '''
+    Returns the (ME, MA, CH, NP, TFLX, HAR, DECR) arguments of the DFM COEFF command from a fitted model, the angles in
+    unit ('arcsec', 'arcmin' or 'deg'); terms that were not fitted are 0.
+    '''
+    coefficients = model["coefficients"]
+    scale = DFM_ANGLE_SCALE[unit]
+    return tuple(coefficients.get(term, 0.0)*(scale if term in ANGLE_TERMS else 1) for term in DFM_TERMS)
+
+def upload_model(model, dfm, unit = DFM_ANGLE_UNIT, units_checked = False):
+    '''
+    Method to send a fitted model to the DFM with dfmlib.DFM_FE.set_coefficients. The unit the DFM expects for the
+    angles has not been confirmed, so unless units_checked is True (after checking unit against the manual or the
+    mount) nothing is sent: the coefficients that would be sent are printed and False is returned. Returns True once sent.
+    '''
+    coefficients = dfm_coefficients(model, unit)
+    if not units_checked:
+        print(f"Not uploading: confirm the COEFF units ({unit}) and call again with units_checked = True")
+        print("ME, MA, CH, NP, TFLX, HAR, DECR = " + ", ".join(f"{value:.6g}" for value in coefficients))
+        return False
+    dfm.set_coefficients(*coefficients)
+    return True
@@ -5,11 +5,13 @@ import astropy.units as u
 from astropy.coordinates import AltAz, EarthLocation, SkyCoord
 from astropy.time import Time
 from xymount import altaz2xy
+from session_store import read_session
 
 # Load the CSV file
 #file_path = '/Users/isabe/Downloads/2025-06-27-observations/2025-06-27-26East-Cass-A-10x10-18-4.csv' 
 file_path = '/Users/isabe/Downloads/2025-06-27-observations/2025-06-27-26East-Cass-A-4.csv'
-data = pd.read_csv(file_path)
+# Memory-mapped from the session store when the file has been ingested (see session_store.py)
+data = read_session(file_path)
 
 last_row = None
 last_rows = []
@@ -8,56 +8,194 @@ import matplotlib.pyplot as plt
 import math
 
 from excomctld import altaz2hadec
+from beam_fit import fit_beam, five_point_solution
+from time_alignment import align_chunks, read_time_chunks, POSITION_COLUMNS
+from session_store import read_session, STORE_DIR
+from measurement_db import MeasurementDB
+from recursive_model import load_model, model_path
+
+# Offset columns of each frame the scanner can work in: (first offset, second offset)
+OFFSET_COLUMNS = {
+    'EL-AZ': ('Az Off (Rot)', 'El Off (Rot)'),
+    'X-Y': ('X_offset', 'Y_offset'),
+    'HA-DEC': ('HA_offset', 'DEC_offset')
+}
+
+def grid_offsets(x, y, values, spacing = None, max_cells = 1000000):
+    '''
+    Bins values into a regular 2-D grid by their (x, y) offsets. Every offset is snapped to the nearest multiple of
+    spacing; when spacing is not given it is taken as the median step between consecutive points, which is the grid
+    spacing for spiral and serpentine scans. Cells hit more than once get the mean of their values.
+
+    Returns (grid, counts, x_axis, y_axis) with grid[i, j] at (x_axis[j], y_axis[i]) and NaN where counts is 0, or None
+    if there are no points or the grid would be larger than max_cells.
+    '''
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    values = np.asarray(values, float)
+    good = np.isfinite(x) & np.isfinite(y) & np.isfinite(values)
+    x, y, values = x[good], y[good], values[good]
+    if len(x) == 0:
+        print("No points to grid")
+        return None
+
+    if spacing is None:
+        steps = np.maximum(np.abs(np.diff(x)), np.abs(np.diff(y)))
+        steps = steps[steps > 1e-6]
+        spacing = float(np.median(steps)) if len(steps) else 1.0
+
+    ix = np.rint(x / spacing).astype(int)
+    iy = np.rint(y / spacing).astype(int)
+    nx = ix.max() - ix.min() + 1
+    ny = iy.max() - iy.min() + 1
+    if nx*ny > max_cells:
+        print(f"Error gridding offsets: a {ny}x{nx} grid at spacing {spacing} is too large, the points may not be on a grid")
+        return None
+
+    cell = (iy - iy.min())*nx + (ix - ix.min())
+    counts = np.bincount(cell, minlength = nx*ny).reshape(ny, nx)
+    sums = np.bincount(cell, weights = values, minlength = nx*ny).reshape(ny, nx)
+    with np.errstate(invalid = 'ignore'):
+        grid = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    x_axis = np.round(np.arange(ix.min(), ix.max() + 1) * spacing, 10)
+    y_axis = np.round(np.arange(iy.min(), iy.max() + 1) * spacing, 10)
+    return grid, counts, x_axis, y_axis
 
 class CSV_Analysis:
 
-    def __init__(self, raw_data_path):
+    def __init__(self, raw_data_path, columns = None, store_dir = STORE_DIR):
         '''
-        Initialize and store the raw_data
+        Initialize and store the raw_data. raw_data_path is either a Radio Astronomy CSV or the name of a session ingested
+        with session_store; ingested sessions (also when given by their CSV) are memory-mapped instead of parsed. columns
+        limits what is loaded (all by default). Raises FileNotFoundError for a session that is not in the store.
         '''
-        raw_data = pd.read_csv(raw_data_path)
-        self.raw_data = raw_data
+        self.raw_data = read_session(raw_data_path, columns, store_dir)
 
     def extract_rows(self, raw_data):
         '''
         Return a dataframe (preferably not editing the self.raw_data file) that will only keep the key datapoints for a good scan at each point.
         After reaching the correct offset, it will handle and average the power from the three prior rows before moving on. 
-        
-        '''
-        last_row = None
-        last_rows = []
-
-        for _,row in raw_data[:3].iterrows():
-            last_rows.append(row)
-
-        my_list = []
 
+        The offset changes are found with array differences and the three-row averages taken for all of them at once, rather
+        than walking the rows, so it gives the same frame as the row-by-row version (the window of the first two changes
+        still wraps around to the start of the file, and the scan ends once it is back at (0.0, 0.0)).
+        '''
         # Round for offset values that are near zero
-        raw_data['Az Off (Rot)'] = raw_data['Az Off (Rot)'].apply(lambda x: 0.0 if abs(x) < 1e-10 else x)
-        raw_data['El Off (Rot)'] = raw_data['El Off (Rot)'].apply(lambda x: 0.0 if abs(x) < 1e-10 else x)
-
-
-        for _, row in raw_data.iterrows():
-
-            # Break out if it is returning to (0.0, 0.0) after other offsets done
-            if last_row is not None:
-                if (row['Az Off (Rot)'] != last_rows[-1]['Az Off (Rot)']) or (row['El Off (Rot)'] != last_rows[-1]['El Off (Rot)']):
-                    row_copy = last_rows[-1].copy()
-                    total_power = sum(entry["Power (dBFS)"] for entry in last_rows)
-                    average_power = total_power/len(last_rows)
-                    row_copy["Power (dBFS)"] = average_power
-                    my_list.append(row_copy)
-            if len(last_rows) > 0:     
-                last_rows.pop(0)
-            last_rows.append(row)
-            last_row = row
-            if (row['Az Off (Rot)'] == 0.0) and (row['El Off (Rot)'] == 0.0) and len(my_list) > 0:
-                break
+        for column in ['Az Off (Rot)', 'El Off (Rot)']:
+            near_zero = raw_data[column].abs() < 1e-10
+            if near_zero.any():
+                raw_data[column] = raw_data[column].astype(float).where(~near_zero, 0.0)
+
+        az = raw_data['Az Off (Rot)'].to_numpy()
+        el = raw_data['El Off (Rot)'].to_numpy()
+        power = raw_data['Power (dBFS)'].to_numpy()
+
+        # A row whose offsets differ from the row before closes the dwell of that previous row
+        changed = np.zeros(len(raw_data), bool)
+        changed[1:] = (az[1:] != az[:-1]) | (el[1:] != el[:-1])
+
+        # Stop after the first row back at (0.0, 0.0) once something has been kept
+        at_center = (az == 0.0) & (el == 0.0) & (np.cumsum(changed) > 0)
+        if at_center.any():
+            changed[np.argmax(at_center) + 1:] = False
+
+        change_points = np.flatnonzero(changed)
+        if len(change_points) == 0:
+            return pd.DataFrame([])
+
+        # The window before change i holds the rows i-3..i-1, except near the start where it is still made up of the
+        # first rows of the file: position k of the window is row k, or row k-width once k is past the first rows
+        width = min(3, len(raw_data))
+        window = change_points[:, None] + np.arange(width)
+        window = np.where(window < width, window, window - width)
+        total_power = 0
+        for k in range(width):
+            total_power = total_power + power[window[:, k]]
+
+        rows = raw_data.iloc[change_points - 1].copy()
+        rows['Power (dBFS)'] = total_power / width
 
         # Save in another dataframe
-        return pd.DataFrame(my_list)
+        return rows
     
+    def dwell_statistics(self, raw_data, baseline = None, tolerance = None, settle_samples = 0):
+        '''
+        Return a dataframe with one row per dwell, i.e. per run of rows at the same offsets, covering the same dwells as
+        extract_rows (same index and columns, taken from the last row of each dwell). Instead of a three-row average it
+        adds statistics over the settled samples of the dwell, computed on the linear power in a single grouped
+        reduction (the pandas grouped variance is Welford's running algorithm):
+            'Samples', 'Power Mean (linear)', 'Power Var (linear)', 'Power Std Err (linear)', 'Power Mean (dBFS)' and
+            'SNR', the mean above the baseline divided by the standard error of the mean.
+        The rotator is still slewing for the first samples after the offsets change, so those are left out: the first
+        settle_samples of every dwell, and with a tolerance (degrees) every sample where 'Az (Rot)'/'El (Rot)' is further
+        than that from the target plus the offsets. A dwell with no settled sample gets NaN statistics.
+
+        The baseline (linear power) defaults to the 25th percentile of the dwell means, which for a map centered on a
+        compact source is off-source sky. A dwell with a high SNR could have been shorter, so these numbers show how far
+        the scan multiplier of RasterScanner.continue_raster can be brought down.
+        '''
+        az = raw_data['Az Off (Rot)'].to_numpy(float)
+        el = raw_data['El Off (Rot)'].to_numpy(float)
+        az = np.where(np.abs(az) < 1e-10, 0.0, az)
+        el = np.where(np.abs(el) < 1e-10, 0.0, el)
+
+        changed = np.zeros(len(raw_data), bool)
+        changed[1:] = (az[1:] != az[:-1]) | (el[1:] != el[:-1])
+        at_center = (az == 0.0) & (el == 0.0) & (np.cumsum(changed) > 0)
+        if at_center.any():
+            changed[np.argmax(at_center) + 1:] = False
+
+        change_points = np.flatnonzero(changed)
+        if len(change_points) == 0:
+            return pd.DataFrame([])
+
+        # Only dwells closed by an offset change are kept, as in extract_rows
+        dwell = np.cumsum(changed)
+        closed = dwell < len(change_points)
+
+        # Samples taken before the rotator settled on the new offsets
+        settled = np.ones(len(raw_data), bool)
+        if settle_samples:
+            starts = np.concatenate(([0], change_points))
+            settled &= np.arange(len(raw_data)) - starts[dwell] >= settle_samples
+        if tolerance is not None:
+            az_error = (raw_data['Az (Rot)'].to_numpy(float) - raw_data['Az'].to_numpy(float) - az + 180) % 360 - 180
+            el_error = raw_data['El (Rot)'].to_numpy(float) - raw_data['El'].to_numpy(float) - el
+            settled &= (np.abs(az_error) <= tolerance) & (np.abs(el_error) <= tolerance)
+
+        used = closed & settled
+        linear = pd.Series(10**(raw_data['Power (dBFS)'].to_numpy(float) / 10))
+        stats = linear[used].groupby(dwell[used]).agg(['count', 'mean', 'var'])
+        stats = stats.reindex(np.arange(len(change_points)))
+
+        rows = raw_data.iloc[change_points - 1].copy()
+        count = stats['count'].fillna(0).to_numpy(int)
+        mean = stats['mean'].to_numpy(float)
+        variance = stats['var'].to_numpy(float)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            std_err = np.sqrt(variance / count)
+        left_out = int(closed.sum() - count.sum())
+        if left_out:
+            print(f"Dwell statistics: {left_out} samples taken while slewing left out")
+        if baseline is None:
+            baseline = np.nanpercentile(mean, 25)
+
+        rows['Samples'] = count
+        rows['Power Mean (linear)'] = mean
+        rows['Power Var (linear)'] = variance
+        rows['Power Std Err (linear)'] = std_err
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            rows['Power Mean (dBFS)'] = 10*np.log10(mean)
+            rows['SNR'] = (mean - baseline) / std_err
+        return rows
+
     def add_HA_columns(self, df, spacing):
+        '''
+        Returns the dataframe with the hour angle and declination of the target and the rotator, converted with
+        excomctld.altaz2hadec for the whole columns at once, and their offsets quantized to the grid spacing and rounded to
+        2 decimals. The columns written are the same as in the earlier row-by-row version, including the ones it left empty.
+        '''
         df['HA (target)'] = np.nan
         df['HA (Rot)'] = np.nan
         df['Dec (Target)'] = np.nan
@@ -66,40 +204,23 @@ class CSV_Analysis:
         df['HA_offset'] = np.nan
         df['DEC_offset'] = np.nan
         lat = 35.19909314527451
-        
-        for index, row in df.iterrows():
-            '''
-            # Convert to XY Coordinates using Lamar's xymount.py code
-            x_rot, y_rot = altaz2xy(round(row["El (Rot)"], 2), round(row["Az (Rot)"], 2))
-            ha_rot, dec_rot = xy2hadec(x_rot, y_rot, lat)
-
-            x_target, y_target = altaz2xy(round(row["El"], 2), round(row["Az"], 2))
-            ha_target, dec_target = xy2hadec(x_target, y_target, lat)
 
-            ha_offset = (ha_rot - ha_target)
+        ha_target, dec_target = altaz2hadec(df["El"].to_numpy(float), df["Az"].to_numpy(float), lat)
+        ha_rot, dec_rot = altaz2hadec(df["El (Rot)"].to_numpy(float), df["Az (Rot)"].to_numpy(float), lat)
 
-            dec_offset = dec_rot - dec_target
+        ha_offset = (ha_rot - ha_target)
 
-            '''
-            lat = 35.19909314527451
-            ha_target, dec_target = altaz2hadec(row["El"], row["Az"], lat)
-            ha_rot, dec_rot = altaz2hadec(row["El (Rot)"], row["Az (Rot)"], lat)
-            
-            ha_offset = (ha_rot - ha_target)
+        dec_offset = dec_rot - dec_target
 
-            dec_offset = dec_rot - dec_target
+        # Quantize the offsets to the grid spacing
+        df['HA_offset'] = np.round(np.round(ha_offset / spacing) * spacing, 2)
+        df['DEC_offset'] = np.round(np.round(dec_offset / spacing) * spacing, 2)
 
-            # Calculate XY Offsets
-            #df.loc[index, 'HA_offset'] = round(ha_offset, 2)
-            #f.loc[index, 'DEC_offset'] = round(dec_offset, 2)
-            df.loc[index, 'HA_offset'] = round(round(ha_offset / spacing) * spacing, 2)
-            df.loc[index, 'DEC_offset'] = round(round(dec_offset / spacing) * spacing, 2)
-            
-            # Add to dataframe
-            df.loc[index, 'HA (Rot)'] = ha_rot
-            df.loc[index, 'DEC (Rot)'] = dec_rot
-            df.loc[index, 'HA (Target)'] = ha_target
-            df.loc[index, 'DEC (Target)'] = dec_target
+        # Add to dataframe
+        df['HA (Rot)'] = ha_rot
+        df['DEC (Rot)'] = dec_rot
+        df['HA (Target)'] = ha_target
+        df['DEC (Target)'] = dec_target
 
         return df
         
@@ -108,7 +229,8 @@ class CSV_Analysis:
     def add_XY_columns(self, df):
         '''
         Returns a dataframe including the information for the XY coordinates of the target, rotator, and offsets. Conversions are done
-        using the xymount.py code created and shared by Lamar Owen Revision 2023-03-28.
+        using the xymount.py code created and shared by Lamar Owen Revision 2023-03-28, on whole columns at once. Az/El are
+        rounded to 2 decimals before converting and X/Y and their offsets after, as before.
         '''
         # Create space to add extra information
         df['X (Rot)'] = np.nan
@@ -119,31 +241,40 @@ class CSV_Analysis:
         df['X_offset'] = np.nan
         df['Y_offset'] = np.nan
 
-        for index, row in df.iterrows():
-
-            # Convert to XY Coordinates using Lamar's xymount.py code
-            x_2_raw, y_2_raw = altaz2xy(round(row["El (Rot)"], 2), round(row["Az (Rot)"], 2))
-            x_2 = round(x_2_raw, 2)
-            y_2 = round(y_2_raw, 2)
-
+        # Convert to XY Coordinates using Lamar's xymount.py code
+        x_2_raw, y_2_raw = altaz2xy(np.round(df["El (Rot)"].to_numpy(float), 2), np.round(df["Az (Rot)"].to_numpy(float), 2))
+        x_2 = np.round(x_2_raw, 2)
+        y_2 = np.round(y_2_raw, 2)
 
-            x_t_2_raw, y_t_2_raw = altaz2xy(round(row["El"], 2), round(row["Az"], 2))
-            x_t_2 = round(x_t_2_raw, 2)
-            y_t_2 = round(y_t_2_raw, 2)
+        x_t_2_raw, y_t_2_raw = altaz2xy(np.round(df["El"].to_numpy(float), 2), np.round(df["Az"].to_numpy(float), 2))
+        x_t_2 = np.round(x_t_2_raw, 2)
+        y_t_2 = np.round(y_t_2_raw, 2)
 
+        # Calculate XY Offsets
+        df['X_offset'] = np.round(x_2 - x_t_2, 2)
+        df['Y_offset'] = np.round(y_2 - y_t_2, 2)
 
-            # Calculate XY Offsets
-            df.loc[index, 'X_offset'] = round((x_2 - x_t_2), 2)
-            df.loc[index, 'Y_offset'] = round((y_2 - y_t_2), 2)
-
-            # Add to dataframe
-            df.loc[index, 'X (Rot)'] = x_2
-            df.loc[index, 'Y (Rot)'] = y_2
-            df.loc[index, 'X (Target)'] = x_t_2
-            df.loc[index, 'Y (Target)'] = y_t_2
+        # Add to dataframe
+        df['X (Rot)'] = x_2
+        df['Y (Rot)'] = y_2
+        df['X (Target)'] = x_t_2
+        df['Y (Target)'] = y_t_2
 
         return df
     
+    def add_positions(self, raw_data, position_path, columns = POSITION_COLUMNS, max_gap = '5s', chunksize = 100000):
+        '''
+        Returns raw_data with the columns of a DFM_Data position log interpolated to the 'UTC' time of every row, using
+        time_alignment. The position log is read in chunks, so a whole night of positions is never loaded at once; rows
+        with no position sample within max_gap on either side get NaN.
+        '''
+        signal = raw_data.copy()
+        signal['_utc'] = pd.to_datetime(signal['UTC'], utc = True)
+        signal = signal.sort_values('_utc')
+        positions = read_time_chunks(position_path, 'Time', columns, chunksize)
+        aligned = pd.concat(align_chunks([signal], positions, '_utc', 'Time', columns, max_gap))
+        return aligned.drop(columns = '_utc').loc[raw_data.index]
+
     def find_grid_size(self, clean_data):
         return int(math.sqrt(clean_data.shape[0]))
 
@@ -156,71 +287,63 @@ class CSV_Analysis:
 
 class FinalData:
      
-    def __init__(self, data, final_data_path, grid_size, object_name):
+    def __init__(self, data, final_data_path, grid_size, object_name, telescope = None):
         '''
         Initialize and store the clean data as well as loading in the file that stores all officially completed and correct offset data
-        for further analysis to build the pointing model
+        for further analysis to build the pointing model. A final_data_path ending in .db is a measurement_db.MeasurementDB,
+        where each peak is added as one row when it is found; any other path is a final CSV as before.
         '''
         #data = pd.read_csv(data_path)
         self.data = data
         self.final_data_path = final_data_path
-        final_data = pd.read_csv(final_data_path)
-        self.final_data = final_data
+        self.db = None
+        self.live_model = None
+        self.final_data = None
+        if final_data_path.endswith('.db'):
+            self.db = MeasurementDB(final_data_path)
+            self.live_model = load_model(model_path(final_data_path, telescope))
+        else:
+            final_data = pd.read_csv(final_data_path)
+            self.final_data = final_data
         self.grid_size = grid_size
         self.object_name = object_name
+        self.telescope = telescope
 
     
-    def raster_grid(self):
-        
-        #grid_size = 7  # Define the size of the grid so it knows how big to make it
-        power_values = []
-        power_grid = [[None for _ in range(self.grid_size)] for _ in range(self.grid_size)]  # Create a square grid
-
-        coordinates = []
-        x = 0
-        y = 0
-        coordinates.append([0, 0]) 
-        t = 1 #current side length
-
-        directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        dir_idx = 0 # Cue for when to change directions
-
-        while len(coordinates) < self.grid_size**2: # Square shaped grid
-            dx, dy = directions[dir_idx % 4] 
-
-            for z in range(0, t):
-                x = int(x + (dx))
-                y = int(y + (dy))
-                coordinates.append([x, y])
-                if len(coordinates) == self.grid_size**2: 
-                    break
-            
-            dir_idx += 1
-            if(dir_idx % 2) == 0: # Every other increase change directions
-                t += 1
-
-        coordinate_index = 0
-        center_offset = (self.grid_size-1)//2
-
-        # Iterate through the rows one at a time
-        for index, row in self.data.iterrows():
-            # Add the power value along with Az Off and El Off
-            power_values.append(row['Power (dBFS)'])
-            
-            el_index = coordinates[coordinate_index][0] + center_offset
-            az_index = coordinates[coordinate_index][1] + center_offset
-            
-            power_grid[el_index][az_index] = row['Power (dBFS)']
-            coordinate_index += 1
+    def raster_grid(self, selected = 'EL-AZ', spacing = None):
+        '''
+        Returns (power_values_grid, power_values): the power of every dwell placed on a 2-D grid by its measured offsets in
+        the frame the scan was taken in ('EL-AZ', 'X-Y' or 'HA-DEC', see OFFSET_COLUMNS), and the powers in data order.
+        Rows of the grid are the second (El, Y or Dec) offset and columns the first, both increasing from index 0 (plot
+        with origin = 'lower', see Graphical.raster_plot); empty cells are NaN.
+
+        Since the points are placed by where they were measured rather than by their position in the file, spiral,
+        serpentine and rose-ordered scans all work and a dropped dwell leaves a hole instead of shifting every later
+        point. Holes and cells measured more than once (averaged) are printed and kept in self.grid_report.
+        '''
+        x_column, y_column = OFFSET_COLUMNS[selected]
+        power_values = list(self.data['Power (dBFS)'])
+        result = grid_offsets(self.data[x_column], self.data[y_column], self.data['Power (dBFS)'], spacing)
+        if result is None:
+            self.grid_report = None
+            return [], power_values
+
+        grid, counts, x_axis, y_axis = result
+        duplicates = [(float(x_axis[j]), float(y_axis[i]), int(counts[i, j])) for i, j in np.argwhere(counts > 1)]
+        holes = [(float(x_axis[j]), float(y_axis[i])) for i, j in np.argwhere(counts == 0)]
+        self.grid_report = {"x": x_axis, "y": y_axis, "counts": counts, "duplicates": duplicates, "holes": holes}
+        if duplicates:
+            print(f"{len(duplicates)} grid cells measured more than once, see grid_report['duplicates']")
+        if holes:
+            print(f"{len(holes)} grid cells with no measurement, see grid_report['holes']")
 
         # Convert the grid for plotting
-        power_values_grid = [[0 if value is None else value for value in row] for row in power_grid]
+        power_values_grid = np.where(counts > 0, grid, np.nan).tolist()
         return power_values_grid, power_values
 
-
     def find_peak(self):
 
-        _, power_values = self.raster_grid()
+        power_values = list(self.data['Power (dBFS)'])
 
         peak_power = power_values[0]
         peak_index = 0
@@ -232,11 +355,101 @@ class FinalData:
 
         return peak_power, peak_index
     
-    def add_XY_to_final(self, peak_index):
+    def find_significant_peak(self, min_snr = 5):
+        '''
+        Returns (peak power, peak index, standard error of the peak power) using the per-dwell statistics of
+        CSV_Analysis.dwell_statistics: only points with an SNR of at least min_snr can be the peak, so a single noisy
+        point cannot win. The power is the mean linear power of the dwell. Returns (None, None, None) if no point passes.
+        '''
+        snr = self.data['SNR'].to_numpy(float)
+        mean = self.data['Power Mean (linear)'].to_numpy(float)
+        significant = np.flatnonzero(snr >= min_snr)
+        if len(significant) == 0:
+            return None, None, None
+        peak_index = int(significant[np.argmax(mean[significant])])
+        return float(mean[peak_index]), peak_index, float(self.data['Power Std Err (linear)'].iloc[peak_index])
+    
+    def fit_peak(self, selected = 'EL-AZ', beam_fwhm = None):
+        '''
+        Fits a 2-D Gaussian beam to the dwell powers at their measured offsets in the given frame (see beam_fit.fit_beam),
+        falling back to a quadratic around the brightest point. With the columns of CSV_Analysis.dwell_statistics the
+        settled dwell means are fitted, each weighted by its standard error, so the offset errors written by the
+        add_*_to_final methods (and to the measurement database) follow from the measured noise. Returns the fit, which is
+        also kept in self.peak_fit and can be passed to add_fit_to_final (or the add_*_to_final writer of its frame) to
+        record the sub-grid peak instead of the brightest grid node.
+        '''
+        x_column, y_column = OFFSET_COLUMNS[selected]
+        if 'Power Std Err (linear)' in self.data.columns:
+            # Dwells from CSV_Analysis.dwell_statistics are weighted by the standard error of their mean power
+            fit = fit_beam(self.data[x_column], self.data[y_column], self.data['Power Mean (dBFS)'], beam_fwhm,
+                           self.data['Power Std Err (linear)'])
+        else:
+            fit = fit_beam(self.data[x_column], self.data[y_column], self.data['Power (dBFS)'], beam_fwhm)
+        fit["frame"] = selected
+        self.peak_fit = fit
+        if fit["x0_err"] is not None:
+            print(f"Peak ({fit['method']} fit): {round(fit['x0'], 4)} +/- {round(fit['x0_err'], 4)}, "
+                  f"{round(fit['y0'], 4)} +/- {round(fit['y0_err'], 4)}")
+        else:
+            print(f"Peak ({fit['method']}): {round(fit['x0'], 4)}, {round(fit['y0'], 4)}")
+        return fit
+
+    def five_point_fit(self, selected, beam, baseline_offset = None):
+        '''
+        Solves a five-point cross taken by RotatorController.start_five_point. The dwell closest to each expected offset
+        in the selected frame (center, +/-beam on each axis and, if used, the baseline point) supplies its power; the
+        offsets, beam widths and amplitude then follow in closed form. Returns (fit, center index) for add_fit_to_final
+        (or the writer of the frame), or (None, None) if a point is missing or the solution has no peak.
+        '''
+        x_column, y_column = OFFSET_COLUMNS[selected]
+        x = self.data[x_column].to_numpy(float)
+        y = self.data[y_column].to_numpy(float)
+        linear = 10**(self.data['Power (dBFS)'].to_numpy(float) / 10)
+
+        expected = [(0, 0), (beam, 0), (-beam, 0), (0, beam), (0, -beam)]
+        if baseline_offset is not None:
+            expected.append((baseline_offset, 0))
+        indices = []
+        for ex, ey in expected:
+            distance = np.hypot(x - ex, y - ey)
+            nearest = int(np.argmin(distance))
+            if distance[nearest] > beam / 2:
+                print(f"Five-point fit: no dwell near offset ({ex}, {ey})")
+                return None, None
+            indices.append(nearest)
+
+        baseline = linear[indices[5]] if baseline_offset is not None else 0.0
+        fit = five_point_solution(*linear[indices[:5]], beam, baseline)
+        if fit is None:
+            print("Five-point fit: the powers do not describe a peak")
+            return None, None
+        fit["frame"] = selected
+        self.peak_fit = fit
+        print(f"Peak (five-point): {round(fit['x0'], 4)}, {round(fit['y0'], 4)}, "
+              f"FWHM {round(fit['fwhm_x'], 4)} x {round(fit['fwhm_y'], 4)}")
+        return fit, indices[0]
+
+    def add_XY_to_final(self, peak_index, fit = None):
+        '''
+        Adds the X/Y peak to the final data. With a fit from fit_peak('X-Y') the fitted offsets are written, with the
+        rotator position being the target of the peak_index row moved by those offsets.
+        '''
 
         #self.final_data.loc[len(self.final_data)] = [self.object_name, self.data.loc[peak_index,"X (Rot)"], self.data.loc[peak_index,"Y (Rot)"], self.data.loc[peak_index,"X (Target)"], self.data.loc[peak_index,"Y (Target)"], self.data.loc[peak_index,"X_offset"], self.data.loc[peak_index,"Y_offset"]]
         row = self.data.iloc[peak_index]  # ✅ get row by position
-        self.final_data.loc[len(self.final_data)] = [
+        if fit is not None:
+            self.check_fit_frame(fit, 'X-Y')
+            self.add_to_final('X-Y', row, [
+                self.object_name,
+                row["X (Target)"] + fit["x0"],
+                row["Y (Target)"] + fit["y0"],
+                row["X (Target)"],
+                row["Y (Target)"],
+                fit["x0"],
+                fit["y0"]
+            ], fit)
+            return
+        self.add_to_final('X-Y', row, [
             self.object_name,
             row["X (Rot)"],
             row["Y (Rot)"],
@@ -244,12 +457,29 @@ class FinalData:
             row["Y (Target)"],
             row["X_offset"],
             row["Y_offset"]
-        ]
+        ])
 
-    def add_HADEC_to_final(self, peak_index):
+    def add_HADEC_to_final(self, peak_index, fit = None):
+        '''
+        Adds the Az/El peak to the final data (despite its name this is the EL-AZ writer, HA/Dec offsets are written by
+        add_hadec_offsets_to_final). With a fit from fit_peak('EL-AZ') the fitted offsets are written, with the
+        rotator position being the target of the peak_index row moved by those offsets.
+        '''
 
         row = self.data.iloc[peak_index]
-        self.final_data.loc[len(self.final_data)] = [
+        if fit is not None:
+            self.check_fit_frame(fit, 'EL-AZ')
+            self.add_to_final('EL-AZ', row, [
+                self.object_name,
+                row["Az"] + fit["x0"],
+                row["El"] + fit["y0"],
+                row["Az"],
+                row["El"],
+                fit["x0"],
+                fit["y0"]
+            ], fit)
+            return
+        self.add_to_final('EL-AZ', row, [
             self.object_name,
             row["Az (Rot)"],
             row["El (Rot)"],
@@ -257,10 +487,77 @@ class FinalData:
             row["El"],
             row["Az Off (Rot)"],
             row["El Off (Rot)"]
-        ]
+        ])
+
+    def add_hadec_offsets_to_final(self, peak_index, fit = None):
+        '''
+        Adds the HA/Dec peak (columns of CSV_Analysis.add_HA_columns) to the final data, in the HA-DEC frame. With a fit
+        from fit_peak('HA-DEC') or five_point_fit('HA-DEC', ...) the fitted offsets are written, with the rotator
+        position being the target of the peak_index row moved by those offsets.
+        '''
+
+        row = self.data.iloc[peak_index]
+        if fit is not None:
+            self.check_fit_frame(fit, 'HA-DEC')
+            self.add_to_final('HA-DEC', row, [
+                self.object_name,
+                row["HA (Target)"] + fit["x0"],
+                row["DEC (Target)"] + fit["y0"],
+                row["HA (Target)"],
+                row["DEC (Target)"],
+                fit["x0"],
+                fit["y0"]
+            ], fit)
+            return
+        self.add_to_final('HA-DEC', row, [
+            self.object_name,
+            row["HA (Rot)"],
+            row["DEC (Rot)"],
+            row["HA (Target)"],
+            row["DEC (Target)"],
+            row["HA_offset"],
+            row["DEC_offset"]
+        ])
+
+    def add_fit_to_final(self, peak_index, fit):
+        '''
+        Adds a peak fit to the final data with the writer of the frame it was made in ('EL-AZ', 'X-Y' or 'HA-DEC').
+        '''
+        writers = {'EL-AZ': self.add_HADEC_to_final, 'X-Y': self.add_XY_to_final, 'HA-DEC': self.add_hadec_offsets_to_final}
+        writers[fit["frame"]](peak_index, fit)
+
+    def check_fit_frame(self, fit, frame):
+        '''
+        Raises ValueError when a peak fit was made in another frame than the one being written, since its offsets would
+        otherwise be added to the targets of the wrong frame.
+        '''
+        if fit.get("frame", frame) != frame:
+            raise ValueError(f"The peak fit is in the {fit['frame']} frame but is being written as {frame}")
+
+    def add_to_final(self, frame, row, values, fit = None):
+        '''
+        Appends [object name, peak x, peak y, center x, center y, offset x, offset y] to the final CSV data, or inserts it
+        into the measurement database with the frame, the time of the peak row and, with a fit, its errors and method,
+        and adds it to the live pointing model.
+        '''
+        if self.db is None:
+            self.final_data.loc[len(self.final_data)] = values
+            return
+        errors = (fit["x0_err"], fit["y0_err"]) if fit is not None else None
+        self.db.add(values[0], frame, values[1:3], values[3:5], values[5:7], telescope = self.telescope,
+                    measured_at = row["UTC"] if "UTC" in row.index else None, errors = errors,
+                    method = fit["method"] if fit is not None else "grid")
+
+        # The live pointing model (recursive_model) is updated with every peak and saved next to the database
+        self.live_model.update_measurement(frame, values[1:3], values[3:5], errors)
+        self.live_model.save(model_path(self.final_data_path, self.telescope))
 
     def save_final(self):
-        self.final_data.to_csv(self.final_data_path, index = False)
+        '''
+        Saves the final CSV data; measurements in the database are already committed when added.
+        '''
+        if self.db is None:
+            self.final_data.to_csv(self.final_data_path, index = False)
 
 class Graphical:
     
@@ -281,15 +578,24 @@ class Graphical:
         plt.title('2D Plot of Power vs Time')
         plt.show()
     
-    def raster_plot(self, power_values_grid):
-
-        
-        plt.imshow(power_values_grid, cmap='viridis', origin='upper', extent=[0, grid_size, 0, grid_size])
+    def raster_plot(self, power_values_grid, grid_report = None, selected = 'EL-AZ'):
+        '''
+        Plots the grid of FinalData.raster_grid, whose first row is the lowest second offset. With the grid_report of
+        that call the axes are the offsets of the cell centers in the selected frame; empty (NaN) cells stay blank.
+        '''
+        extent = [0, self.grid_size, 0, self.grid_size]
+        if grid_report is not None:
+            x_axis, y_axis = grid_report["x"], grid_report["y"]
+            dx = x_axis[1] - x_axis[0] if len(x_axis) > 1 else 1.0
+            dy = y_axis[1] - y_axis[0] if len(y_axis) > 1 else 1.0
+            extent = [x_axis[0] - dx/2, x_axis[-1] + dx/2, y_axis[0] - dy/2, y_axis[-1] + dy/2]
+
+        x_column, y_column = OFFSET_COLUMNS[selected]
+        plt.imshow(power_values_grid, cmap='viridis', origin='lower', extent=extent)
         plt.colorbar(label='Power (dBFS)')
-        plt.xlabel('Az Off (Rot)')
-        plt.ylabel('El Off (Rot)')
+        plt.xlabel(x_column)
+        plt.ylabel(y_column)
         plt.title('2D Plot of Power Values in Grid')
-        # FIXME: Create the ticks correctly
         plt.show()
 
     
@@ -319,7 +625,7 @@ if __name__ == "__main__":
 
     graphical = Graphical(analysis.raw_data, grid_size)
     graphical.time_plot()
-    graphical.raster_plot(power_values_grid)
+    graphical.raster_plot(power_values_grid, final.grid_report)
 
 
 
@@ -0,0 +1,140 @@
+# recursive_model.py
+
+'''
+recursive_model.py keeps a live pointing model that is updated with every new measurement instead of refitting the
+whole history (pointing_model.fit_from_db). It is recursive least squares on the same terms and design rows as
+pointing_model: each measurement adds its dh (on the sky) and ddec rows, which changes the coefficients and their
+covariance in O(p**2) for p terms, whatever the number of measurements before it.
+
+A forgetting factor below 1 lets old measurements count less and less, with an effective memory of about
+1 / (1 - forgetting) measurements, so the model follows slow changes of the mount (a re-levelled base, a seasonal
+flexure) without being refitted.
+
+The state is saved to a .npz file next to the measurement database (model_path), where FinalData updates it after each
+peak. The scanner, excomctld or anything else can load it and call correction() with no refit.
+'''
+
+# Import necessary libraries
+import os
+import numpy as np
+from pointing_model import TERMS, ANGLE_TERMS, design_matrix, measurement_offsets
+from scan_planner import LAT
+
+def model_path(db_path, telescope = None):
+    '''
+    Path of the live model saved next to a measurement database: pointing.db -> pointing_model.npz, or
+    pointing_26West_model.npz for one telescope.
+    '''
+    base = os.path.splitext(db_path)[0]
+    return f"{base}_{telescope}_model.npz" if telescope else f"{base}_model.npz"
+
+class RecursivePointingModel:
+
+    def __init__(self, terms = TERMS, forgetting = 0.999, lat = LAT, prior = 1.0, default_sigma = 0.01):
+        '''
+        Method to start an empty model. prior is the initial variance of every coefficient (degrees**2, or the square of
+        a ratio), and default_sigma (degrees) the error given to a measurement that comes without one.
+        '''
+        self.terms = list(terms)
+        self.forgetting = forgetting
+        self.lat = lat
+        self.default_sigma = default_sigma
+        self.theta = np.zeros(len(self.terms))
+        self.P = np.eye(len(self.terms))*prior
+        self.count = 0
+
+    def seed(self, model):
+        '''
+        Method to start from a batch fit of pointing_model.fit_pointing_model, taking its coefficients and covariance.
+        '''
+        self.theta = np.array([model["coefficients"][term] for term in self.terms])
+        self.P = np.array(model["covariance"], float)
+        self.count = model["n"]
+
+    def update(self, ha, dec, dha, ddec, sigma = None):
+        '''
+        Method to add one measurement: the target at (ha, dec) was found dha, ddec degrees away. Both rows are added in
+        one step, with a single 2x2 inverse, and the forgetting factor applied once.
+        '''
+        if not np.all(np.isfinite([ha, dec, dha, ddec])):
+            print("Live pointing model: skipping a measurement with missing values")
+            return
+        if sigma is None or not np.isfinite(sigma) or sigma <= 0:
+            sigma = self.default_sigma
+        design_ha, design_dec = design_matrix(np.array([ha]), np.array([dec]), self.terms, self.lat)
+        cos_dec = np.cos(np.radians(dec))
+        X = np.vstack((design_ha[0]*cos_dec, design_dec[0]))
+        y = np.array([dha*cos_dec, ddec])
+
+        PX = self.P @ X.T
+        S = X @ PX + np.eye(2)*self.forgetting*sigma**2
+        K = PX @ np.linalg.inv(S)
+        self.theta = self.theta + K @ (y - X @ self.theta)
+        self.P = (self.P - K @ PX.T) / self.forgetting
+        # Keep P symmetric against rounding over many updates
+        self.P = (self.P + self.P.T) / 2
+        self.count += 1
+
+    def update_measurement(self, frame, peak, center, errors = None):
+        '''
+        Method to add a measurement as stored by measurement_db (a frame and its peak and center (x, y) pairs).
+        '''
+        errors = errors if errors is not None else (np.nan, np.nan)
+        data = {"frame": np.array([frame], dtype = object),
+                "peak_x": np.array([peak[0]], float), "peak_y": np.array([peak[1]], float),
+                "center_x": np.array([center[0]], float), "center_y": np.array([center[1]], float),
+                "offset_x_err": np.array([errors[0]], float), "offset_y_err": np.array([errors[1]], float)}
+        ha, dec, dha, ddec, sigma = measurement_offsets(data, self.lat)
+        self.update(ha[0], dec[0], dha[0], ddec[0], sigma[0])
+
+    def correction(self, ha, dec):
+        '''
+        Returns the (dh, ddec) in degrees the model expects at hour angles ha and declinations dec (scalars or arrays).
+        '''
+        design_ha, design_dec = design_matrix(np.atleast_1d(ha), np.atleast_1d(dec), self.terms, self.lat)
+        dh = design_ha @ self.theta
+        ddec = design_dec @ self.theta
+        if np.ndim(ha) == 0 and np.ndim(dec) == 0:
+            return float(dh[0]), float(ddec[0])
+        return dh, ddec
+
+    def coefficients(self):
+        '''
+        Returns the model in the form of pointing_model.fit_pointing_model ('terms', 'coefficients', 'errors',
+        'covariance', 'n'), so it can be printed or sent to the DFM the same way.
+        '''
+        errors = np.sqrt(np.abs(np.diag(self.P)))
+        return {"terms": list(self.terms), "coefficients": dict(zip(self.terms, map(float, self.theta))),
+                "errors": dict(zip(self.terms, map(float, errors))), "covariance": self.P.copy(), "n": self.count}
+
+    def print_model(self):
+        errors = np.sqrt(np.abs(np.diag(self.P)))
+        for term, value, error in zip(self.terms, self.theta, errors):
+            scale = 3600 if term in ANGLE_TERMS else 1
+            unit = '"' if term in ANGLE_TERMS else ''
+            print(f"{term:>5} {value*scale:12.4f}{unit} +/- {error*scale:.4f}{unit}")
+        print(f"{self.count} measurements, forgetting factor {self.forgetting}")
+
+    def save(self, path):
+        '''
+        Method to write the state to path (.npz). It is written aside and renamed, so a reader never sees half a file.
+        '''
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, terms = np.array(self.terms), theta = self.theta, P = self.P, count = self.count,
+                     forgetting = self.forgetting, lat = self.lat, default_sigma = self.default_sigma)
+        os.replace(temporary, path)
+
+def load_model(path, **kwargs):
+    '''
+    Returns the RecursivePointingModel saved at path, or a new one (made with kwargs) if there is none yet.
+    '''
+    if not os.path.exists(path):
+        return RecursivePointingModel(**kwargs)
+    with np.load(path) as state:
+        model = RecursivePointingModel([str(term) for term in state["terms"]], float(state["forgetting"]),
+                                       float(state["lat"]), default_sigma = float(state["default_sigma"]))
+        model.theta = state["theta"].copy()
+        model.P = state["P"].copy()
+        model.count = int(state["count"])
+    return model
@@ -0,0 +1,112 @@
+# regrid.py
+
+'''
+regrid.py resamples scattered power samples, such as the points of a rose scan from generate_daisy_grid or the tagged
+samples of an on-the-fly scan, onto a regular map by convolutional gridding. FinalData.raster_grid can only place
+samples that already sit on a grid; here every sample is spread over the map pixels around it with a tapered kernel,
+and each pixel is the weighted mean of the samples that reach it.
+
+The map itself is the spatial index: a sample is hashed straight to the pixel it falls in, and only the pixels within
+the kernel support around it are touched, so the cost grows with the number of samples and not with samples x pixels.
+Samples are processed in chunks to bound the memory used, and the chunks can be spread over a process pool.
+
+The kernel is a Gaussian, by default a third of the beam FWHM wide, tapered smoothly to zero at the support radius so
+the truncation does not ring in the map.
+'''
+
+# Import necessary libraries
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+def tapered_gaussian(r, sigma, support):
+    '''
+    Kernel weight at distance r: a Gaussian of width sigma multiplied by a cos^2 taper reaching zero at support.
+    '''
+    r = np.asarray(r, float)
+    taper = np.cos(np.pi * np.minimum(r / support, 1) / 2)**2
+    return np.exp(-r**2 / (2*sigma**2)) * taper
+
+def grid_chunk(args):
+    '''
+    Grids one chunk of samples. args is (x, y, values, x0, y0, spacing, nx, ny, sigma, support) and the return value is
+    the (weighted value sum, weight sum) pair of (ny, nx) arrays, which add up across chunks.
+    '''
+    x, y, values, x0, y0, spacing, nx, ny, sigma, support = args
+    value_sum = np.zeros(ny*nx)
+    weight_sum = np.zeros(ny*nx)
+    reach = int(np.ceil(support / spacing))
+
+    # Pixel each sample falls in, then the square of pixels within the support around it
+    ix = np.rint((x - x0) / spacing).astype(int)
+    iy = np.rint((y - y0) / spacing).astype(int)
+    offsets = np.arange(-reach, reach + 1)
+    px = ix[:, None, None] + offsets[None, None, :]
+    py = iy[:, None, None] + offsets[None, :, None]
+    r2 = (x0 + px*spacing - x[:, None, None])**2 + (y0 + py*spacing - y[:, None, None])**2
+
+    # The kernel is only evaluated where it is non-zero and on the map
+    inside = (r2 < support**2) & (px >= 0) & (px < nx) & (py >= 0) & (py < ny)
+    weight = tapered_gaussian(np.sqrt(r2[inside]), sigma, support)
+    pixel = (np.broadcast_to(py, r2.shape)*nx + np.broadcast_to(px, r2.shape))[inside]
+    sample_values = np.broadcast_to(values[:, None, None], r2.shape)[inside]
+
+    weight_sum += np.bincount(pixel, weights = weight, minlength = ny*nx)
+    value_sum += np.bincount(pixel, weights = weight*sample_values, minlength = ny*nx)
+    return value_sum.reshape(ny, nx), weight_sum.reshape(ny, nx)
+
+def regrid(x, y, values, spacing, beam_fwhm, extent = None, sigma = None, support = None, chunk_size = 20000,
+           workers = None, min_weight = 1e-3):
+    '''
+    Resamples scattered (x, y, values) onto a regular map with pixels spacing apart.
+
+    extent is (x_min, x_max, y_min, y_max) and defaults to the range of the samples. The kernel defaults to a Gaussian
+    with a FWHM of beam_fwhm/3 (sigma = FWHM/2.3548) and a support radius of 3*sigma. With workers set, the chunks
+    are gridded in a process pool of that many processes. Pixels whose summed weight is below min_weight are NaN.
+
+    Returns (map, weights, x_axis, y_axis) with map[i, j] at (x_axis[j], y_axis[i]).
+    '''
+    x = np.asarray(x, float)
+    y = np.asarray(y, float)
+    values = np.asarray(values, float)
+    good = np.isfinite(x) & np.isfinite(y) & np.isfinite(values)
+    x, y, values = x[good], y[good], values[good]
+
+    if sigma is None:
+        sigma = beam_fwhm / 3 / 2.3548
+    if support is None:
+        support = 3*sigma
+    if extent is None:
+        extent = (x.min(), x.max(), y.min(), y.max())
+    x_min, x_max, y_min, y_max = extent
+    x_axis = np.arange(np.floor(x_min / spacing), np.ceil(x_max / spacing) + 1) * spacing
+    y_axis = np.arange(np.floor(y_min / spacing), np.ceil(y_max / spacing) + 1) * spacing
+    nx, ny = len(x_axis), len(y_axis)
+
+    chunks = [(x[i:i + chunk_size], y[i:i + chunk_size], values[i:i + chunk_size],
+               x_axis[0], y_axis[0], spacing, nx, ny, sigma, support)
+              for i in range(0, len(x), chunk_size)]
+
+    value_sum = np.zeros((ny, nx))
+    weight_sum = np.zeros((ny, nx))
+    if workers and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            results = list(pool.map(grid_chunk, chunks))
+    else:
+        results = map(grid_chunk, chunks)
+    for chunk_values, chunk_weights in results:
+        value_sum += chunk_values
+        weight_sum += chunk_weights
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        gridded = np.where(weight_sum >= min_weight, value_sum / weight_sum, np.nan)
+    return gridded, weight_sum, x_axis, y_axis
+
+def regrid_power(df, x_column, y_column, spacing, beam_fwhm, power_column = 'Power (dBFS)', **kwargs):
+    '''
+    Regrids a power column in dB from a dataframe (for example the output of RotatorController.start_otf or the rows of a
+    rose scan). The averaging is done on linear power and the map is returned in dB, with the rest as in regrid().
+    '''
+    linear = 10**(df[power_column].to_numpy(float) / 10)
+    gridded, weights, x_axis, y_axis = regrid(df[x_column], df[y_column], linear, spacing, beam_fwhm, **kwargs)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return 10*np.log10(gridded), weights, x_axis, y_axis
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+'''
+Reverse API receiver for the Rotator Controller:
+
+Listens on a TCP port for SDRangel reverse API requests, in the same way as listener.py and freqtracking.py.
+  - GS232ControllerReport pushes (current and target azimuth/elevation) are stored in a RotatorState and any thread
+waiting on the rotator is woken up as soon as the current and target positions agree within the tolerance.
+  - GS232ControllerSettings pushes are stored as well and passed on to any listener (such as the
+sdrangel_client.GS232SettingsMirror), so the latest settings are known without a GET.
+
+RasterScanner.RotatorController uses this to stop sleeping a full integration period between on-target checks. In the
+SDRangel instance the reverse API of the Rotator Controller must point at the address and port of this receiver.
+'''
+
+import time
+import threading
+import argparse
+import datetime
+from flask import Flask
+from flask import request, jsonify
+from werkzeug.serving import make_server
+
+class RotatorState:
+
+    def __init__(self):
+        '''
+        Method to initialize an empty rotator state. Every update notifies the condition so waiting threads re-check.
+        '''
+        self.condition = threading.Condition()
+        self.report = None
+        self.report_time = None
+        self.settings = None
+        self.settings_time = None
+        self.settings_listeners = []
+
+    def add_settings_listener(self, listener):
+        '''
+        Method to register a function called with every settings push, e.g. GS232SettingsMirror.apply_settings.
+        '''
+        self.settings_listeners.append(listener)
+
+    def update_report(self, report):
+        with self.condition:
+            self.report = dict(report)
+            self.report_time = time.monotonic()
+            self.condition.notify_all()
+
+    def update_settings(self, settings):
+        with self.condition:
+            if self.settings is None:
+                self.settings = {}
+            self.settings.update(settings)
+            self.settings_time = time.monotonic()
+            self.condition.notify_all()
+        for listener in self.settings_listeners:
+            listener(settings)
+
+    def notify(self):
+        '''
+        Method to wake every waiting thread without new data, used when a scan is cancelled.
+        '''
+        with self.condition:
+            self.condition.notify_all()
+
+    def is_on_target(self, tolerance, since = None):
+        '''
+        Method to check the latest pushed report against the tolerance. Reports older than since (a time.monotonic()
+        value, normally taken just before the offsets were patched) are ignored since they describe the old target.
+        '''
+        report = self.report
+        if report is None:
+            return False
+        if since is not None and self.report_time < since:
+            return False
+        try:
+            # Azimuths are compared the short way round, so a target near 0/360 degrees can be on target
+            return (abs((report["currentAzimuth"] - report["targetAzimuth"] + 180) % 360 - 180) <= tolerance and
+                    abs(report["currentElevation"] - report["targetElevation"]) <= tolerance)
+        except (KeyError, TypeError):
+            return False
+
+    def wait_on_target(self, tolerance, timeout, since = None, cancel = None):
+        '''
+        Method to block until a pushed report shows the rotator on target, the timeout (in seconds) runs out, or
+        cancel() returns True. Returns True only when the rotator is on target.
+        '''
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not self.is_on_target(tolerance, since):
+                if cancel is not None and cancel():
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+class ReverseAPIReceiver:
+
+    def __init__(self, address = "0.0.0.0", port = 8888, verbose = False):
+        '''
+        Method to initialize the Flask application that accepts the Rotator Controller reverse API requests.
+        '''
+        self.address = address
+        self.port = port
+        self.verbose = verbose
+        self.state = RotatorState()
+        self.server = None
+        self.thread = None
+
+        # SDRangel posts feature reverse API messages to /sdrangel/featureset/<featureSetIndex>/feature/<featureIndex>/...;
+        # the form without the feature set index is kept for older senders
+        self.app = Flask(__name__)
+        for prefix, name in (('/sdrangel/featureset/<int:feature_set_index>/feature/<int:feature_index>', 'feature'),
+                             ('/sdrangel/featureset/feature/<int:feature_index>', 'feature_default_set')):
+            self.app.add_url_rule(prefix + '/report', name + '_report', self.handle_report,
+                                  methods = ['POST', 'PUT', 'PATCH'])
+            self.app.add_url_rule(prefix + '/settings', name + '_settings', self.handle_settings,
+                                  methods = ['POST', 'PUT', 'PATCH'])
+
+    def handle_report(self, feature_index, feature_set_index = 0):
+        """ Receiving a GS232Controller report from the reverse API """
+        content = request.get_json(silent = True) or {}
+        report = content.get("GS232ControllerReport")
+        if report is None:
+            return jsonify({"status": "ignored"})
+        self.state.update_report(report)
+        if self.verbose:
+            print(f"[{datetime.datetime.now()}] Rotator report [{feature_set_index}:{feature_index}]: {report}")
+        return jsonify({"status": "ok"})
+
+    def handle_settings(self, feature_index, feature_set_index = 0):
+        """ Receiving GS232Controller settings from the reverse API """
+        content = request.get_json(silent = True) or {}
+        settings = content.get("GS232ControllerSettings")
+        if settings is None:
+            return jsonify({"status": "ignored"})
+        self.state.update_settings(settings)
+        if self.verbose:
+            print(f"[{datetime.datetime.now()}] Rotator settings [{feature_set_index}:{feature_index}]: {settings}")
+        return jsonify({"status": "ok"})
+
+    def start(self):
+        '''
+        Method to serve the application from a background thread so it can run next to the scan thread.
+        '''
+        if self.thread is not None:
+            return
+        self.server = make_server(self.address, self.port, self.app, threaded = True)
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.thread.join()
+        self.server = None
+        self.thread = None
+
+# ======================================================================
+def main():
+    """ Run the receiver on its own and print everything it gets """
+# ----------------------------------------------------------------------
+    parser = argparse.ArgumentParser(description="Receives Rotator Controller reverse API requests from SDRangel")
+    parser.add_argument("-A", "--address", dest="addr", default="0.0.0.0", help="listening address (default 0.0.0.0)", metavar="IP", type=str)
+    parser.add_argument("-P", "--port", dest="port", default=8888, help="listening port (default 8888)", metavar="PORT", type=int)
+    options = parser.parse_args()
+
+    receiver = ReverseAPIReceiver(options.addr, options.port, verbose = True)
+    print(f'main: starting at: {options.addr}:{options.port}')
+    receiver.app.run(host=options.addr, port=options.port)
+
+
+# ======================================================================
+if __name__ == "__main__":
+    """ When called from command line... """
+# ----------------------------------------------------------------------
+    main()
@@ -0,0 +1,154 @@
+# scan_planner.py
+
+'''
+scan_planner.py converts a whole scan's worth of offsets into the Az/El offsets patched to the Rotator Controller in one
+NumPy pass, instead of calling RotatorController.HA_DEC_offsets or XY_offset once per point inside the scan loop.
+
+The offsets come from generate_offsets_grid or generate_daisy_grid in the frame selected in the GUI ('HA-DEC', 'X-Y' or
+Az/El), and the target trajectory is either one Az/El position or one per point. plan_offsets() returns an (N, 2) array
+of [azimuth offset, elevation offset] which the scan loop simply indexes, and OffsetPlan wraps that with the predicted
+trajectory so the loop can tell when the real target has drifted away from the plan.
+
+While the dish integrates on one point the source keeps moving, so a fixed Az/El offset slowly stops matching the
+requested HA-DEC or X-Y offset. DwellOffsetTable tabulates the offset over the dwell so it can be re-patched by lookup.
+'''
+
+# Import necessary libraries
+import numpy as np
+from xymount import altaz2xy, xy2altaz
+from excomctld import altaz2hadec, hadec2altaz
+
+# Latitude of the 26 m telescopes, as used in RasterScanner.HA_DEC_offsets
+LAT = 35.19909314527451
+
+# Sidereal rate of hour angle in degrees per second
+SIDEREAL_RATE = 360.0 / 86164.0905
+
+def wrap_azimuth(az_offset):
+    '''
+    Wrap azimuth differences into (-180, 180] the same way RotatorController does for a single point.
+    '''
+    az_offset = np.mod(az_offset, 360)
+    return np.where(az_offset > 180, az_offset - 360, az_offset)
+
+def hadec_offsets(targetAz, targetEl, HAOff, DECOff, lat = LAT):
+    '''
+    Array version of RotatorController.HA_DEC_offsets: offsets in hour angle and declination around each target become
+    Az/El offsets, rounded to 3 decimals.
+    '''
+    targetAz, targetEl, HAOff, DECOff = np.broadcast_arrays(*(np.asarray(v, float) for v in (targetAz, targetEl, HAOff, DECOff)))
+    ha_target, dec_target = altaz2hadec(targetEl, targetAz, lat)
+    alt_new, az_new = hadec2altaz(np.ravel(ha_target + HAOff), np.ravel(dec_target + DECOff),
+                                  np.full(targetAz.size, lat))
+    az_offset = wrap_azimuth(np.reshape(az_new, targetAz.shape) - targetAz)
+    el_offset = np.reshape(alt_new, targetEl.shape) - targetEl
+    return np.round(az_offset, 3), np.round(el_offset, 3)
+
+def xy_offsets(targetAz, targetEl, xOff, yOff):
+    '''
+    Array version of RotatorController.XY_offset, with the same rounding of the X/Y target and the new Az/El to 2
+    decimals.
+    '''
+    targetAz, targetEl, xOff, yOff = np.broadcast_arrays(*(np.asarray(v, float) for v in (targetAz, targetEl, xOff, yOff)))
+    x_target, y_target = altaz2xy(targetEl, targetAz)
+    newEl, newAz = xy2altaz(np.round(x_target, 2) + xOff, np.round(y_target, 2) + yOff)
+    az_offset = wrap_azimuth(np.round(newAz, 2) - targetAz)
+    el_offset = np.round(newEl, 2) - targetEl
+    return np.round(az_offset, 2), np.round(el_offset, 2)
+
+def plan_offsets(coordinates, selected, targetAz, targetEl, lat = LAT):
+    '''
+    Returns an (N, 2) float array of the Az/El offsets for every point of coordinates. targetAz/targetEl are either the
+    single target position or one position per point (the target trajectory).
+    '''
+    coordinates = np.asarray(coordinates, float).reshape(-1, 2)
+    if selected == 'HA-DEC':
+        az_offset, el_offset = hadec_offsets(targetAz, targetEl, coordinates[:, 0], coordinates[:, 1], lat)
+    elif selected == 'X-Y':
+        az_offset, el_offset = xy_offsets(targetAz, targetEl, coordinates[:, 0], coordinates[:, 1])
+    else:
+        return coordinates.copy()
+    return np.column_stack((az_offset, el_offset))
+
+def predict_trajectory(targetAz, targetEl, elapsed, lat = LAT):
+    '''
+    Predicts where a sidereal target now at (targetAz, targetEl) will be after each of the elapsed times (seconds). Its
+    hour angle advances at the sidereal rate and its declination stays fixed. Returns (az, el) arrays.
+    '''
+    elapsed = np.asarray(elapsed, float)
+    ha, dec = altaz2hadec(targetEl, targetAz, lat)
+    ha_future = np.ravel(ha + SIDEREAL_RATE*elapsed)
+    dec_future = np.full(ha_future.size, float(dec))
+    el, az = hadec2altaz(ha_future, dec_future, np.full(ha_future.size, lat))
+    return np.reshape(az, elapsed.shape), np.reshape(el, elapsed.shape)
+
+class OffsetPlan:
+
+    def __init__(self, coordinates, selected, targetAz, targetEl, seconds_per_point, start = 0, lat = LAT,
+                 read_at = None):
+        '''
+        Method to plan the offsets of coordinates[start:] for a target now at (targetAz, targetEl), assuming each point
+        takes seconds_per_point. The predicted target position of every point is kept to check the plan against later.
+        read_at is the time.monotonic() value when the target was read, so the real time per point can be measured.
+        '''
+        self.coordinates = np.asarray(coordinates, float).reshape(-1, 2)
+        self.selected = selected
+        self.start = start
+        self.lat = lat
+        self.seconds_per_point = seconds_per_point
+        self.read_at = read_at
+
+        count = len(self.coordinates) - start
+        elapsed = np.arange(count) * seconds_per_point
+        if selected in ('HA-DEC', 'X-Y'):
+            self.targetAz, self.targetEl = predict_trajectory(targetAz, targetEl, elapsed, lat)
+        else:
+            self.targetAz = np.full(count, float(targetAz))
+            self.targetEl = np.full(count, float(targetEl))
+        self.offsets = plan_offsets(self.coordinates[start:], selected, self.targetAz, self.targetEl, lat)
+
+    def covers(self, index, targetAz, targetEl, tolerance = 0.02):
+        '''
+        Method to check that point index was planned for a target within tolerance (degrees) of where it really is.
+        Az/El scans never need replanning since their offsets do not depend on the target.
+        '''
+        if index < self.start or index >= len(self.coordinates):
+            return False
+        if self.selected not in ('HA-DEC', 'X-Y'):
+            return True
+        i = index - self.start
+        return (abs(wrap_azimuth(self.targetAz[i] - targetAz)) <= tolerance and
+                abs(self.targetEl[i] - targetEl) <= tolerance)
+
+    def pace(self, index, read_at):
+        '''
+        Method to return the measured seconds per point, slewing and settling included, from the plan start to point
+        index read at read_at, or None when it cannot be measured yet.
+        '''
+        if self.read_at is None or read_at is None or index <= self.start:
+            return None
+        return (read_at - self.read_at) / (index - self.start)
+
+    def __getitem__(self, index):
+        az_offset, el_offset = self.offsets[index - self.start]
+        return float(az_offset), float(el_offset)
+
+class DwellOffsetTable:
+
+    def __init__(self, coord, selected, targetAz, targetEl, start, duration, cadence, lat = LAT):
+        '''
+        Method to tabulate the Az/El offsets of one HA-DEC or X-Y point over a dwell. (targetAz, targetEl) is where the
+        target was when it was read; the table covers start to start + duration seconds after that read, every cadence
+        seconds, with the target moved along its sidereal track. All of the trig happens here, before the dwell.
+        '''
+        steps = max(int(np.ceil(duration / cadence)), 1)
+        self.times = start + np.arange(steps + 1) * cadence
+        az, el = predict_trajectory(targetAz, targetEl, self.times, lat)
+        self.offsets = plan_offsets(np.repeat([coord], len(self.times), axis = 0), selected, az, el, lat)
+
+    def offset_at(self, elapsed):
+        '''
+        Method to interpolate the Az/El offset elapsed seconds after the target read.
+        '''
+        return (float(np.interp(elapsed, self.times, self.offsets[:, 0])),
+                float(np.interp(elapsed, self.times, self.offsets[:, 1])))
@@ -0,0 +1,418 @@
+# sdrangel_client.py
+
+'''
+sdrangel_client.py holds one pooled, keep-alive HTTP client for the SDRangel REST API. Instead of every module calling
+requests.get/patch/post directly (and opening a new TCP connection for each call), the RasterScanner.py, BlankSlate.py,
+class_GUI.py and freqtracking.py code all go through an SDRangelClient, which keeps its connections open in a
+requests.Session and applies a timeout for each kind of endpoint.
+
+Use get_client(host, port) to obtain the client shared by everything talking to the same SDRangel instance. The client
+also carries an SDRangelTopology, a cache of where the channels and features live, so that back-to-back scans do not
+have to fetch and walk the whole /sdrangel document again.
+'''
+
+# Import necessary libraries
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds for each kind of endpoint. The report is polled inside the scan loop so it is
+# kept short, the full instance document can be large so it is given longer.
+DEFAULT_TIMEOUTS = {
+    "instance": (3.05, 10),
+    "devices": (3.05, 10),
+    "settings": (3.05, 5),
+    "report": (3.05, 2),
+    "actions": (3.05, 5),
+}
+
+# Status codes that mean the cached channel/feature indices no longer match the running instance
+TOPOLOGY_STALE_CODES = (404, 409)
+
+class SDRangelTopology:
+
+    def __init__(self, client):
+        '''
+        Method to initialize an empty topology cache for the SDRangel instance behind the client. Nothing is fetched
+        until the first lookup.
+        '''
+        self.client = client
+        self.lock = threading.Lock()
+        self.valid = False
+        self.channels_by_title = {}
+        self.channels_by_type = {}
+        self.features_by_title = {}
+        self.features_by_type = {}
+
+    def invalidate(self):
+        '''
+        Method to mark the cache stale, so the next lookup fetches /sdrangel again. Called after a 404 or 409 from the
+        REST API, or by code that has just added or removed a channel or feature.
+        '''
+        self.valid = False
+
+    def refresh(self):
+        '''
+        Method to fetch the /sdrangel instance document once and index every channel by title and by type, and every
+        feature the same way. Channels are stored as (deviceset index, channel index) pairs. Returns True on success.
+        '''
+        data = self.client.get_instance()
+        if data is None:
+            return False
+
+        channels_by_title = {}
+        channels_by_type = {}
+        features_by_title = {}
+        features_by_type = {}
+
+        devices = data.get("devicesetlist", {}).get("deviceSets", [])
+        for deviceset_index, device in enumerate(devices):
+            for channel in device.get("channels", []):
+                location = (deviceset_index, channel.get("index"))
+                channels_by_title[channel.get("title")] = location
+                channels_by_type[channel.get("id")] = location
+
+        for feature in data.get("featureset", {}).get("features", []):
+            features_by_title[feature.get("title")] = feature.get("index")
+            features_by_type[feature.get("id")] = feature.get("index")
+
+        with self.lock:
+            self.channels_by_title = channels_by_title
+            self.channels_by_type = channels_by_type
+            self.features_by_title = features_by_title
+            self.features_by_type = features_by_type
+            self.valid = True
+        return True
+
+    def added_index(self, response):
+        '''
+        Method to read the index of a newly added channel or feature from the response to its POST, if SDRangel sent one.
+        '''
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        return data.get("index") if isinstance(data, dict) else None
+
+    def record_channel(self, response, deviceset_index, channel_type, title = None):
+        '''
+        Method to update the cache after a channel was added with a POST, without fetching /sdrangel again. When the
+        response carries the new channel index it is recorded, otherwise the cache is marked stale and refetched on the
+        next lookup. Returns the (deviceset index, channel index) pair, or (None, None) when it is not known yet.
+        '''
+        index = self.added_index(response) if response.ok else None
+        if index is None:
+            self.invalidate()
+            return None, None
+        location = (deviceset_index, index)
+        with self.lock:
+            self.channels_by_type[channel_type] = location
+            if title is not None:
+                self.channels_by_title[title] = location
+        return location
+
+    def record_feature(self, response, feature_type, title = None):
+        '''
+        Method to update the cache after a feature was added with a POST, as record_channel does for channels. Returns
+        the feature index, or None when it is not known yet.
+        '''
+        index = self.added_index(response) if response.ok else None
+        if index is None:
+            self.invalidate()
+            return None
+        with self.lock:
+            self.features_by_type[feature_type] = index
+            if title is not None:
+                self.features_by_title[title] = index
+        return index
+
+    def ensure(self):
+        if not self.valid:
+            self.refresh()
+
+    def find_channel(self, title = None, channel_type = None):
+        '''
+        Method to look up a channel by title, falling back to its type (e.g. "RadioAstronomy"). Returns a
+        (deviceset index, channel index) pair, or (None, None) when it is not present.
+        '''
+        self.ensure()
+        with self.lock:
+            location = self.channels_by_title.get(title) or self.channels_by_type.get(channel_type)
+        return location if location else (None, None)
+
+    def find_feature(self, title = None, feature_type = None):
+        '''
+        Method to look up a feature index by title, falling back to its type (e.g. "GS232Controller"). Returns None
+        when it is not present.
+        '''
+        self.ensure()
+        with self.lock:
+            index = self.features_by_title.get(title)
+            if index is None:
+                index = self.features_by_type.get(feature_type)
+        return index
+
+class SDRangelClient:
+
+    def __init__(self, host, port, pool_size = 4, timeouts = None):
+        '''
+        Method to initialize the client with the host and port of the machine running SDRangel. The session keeps up
+        to pool_size connections alive so the scanner and GUI threads can share it.
+        '''
+        self.host = host
+        self.port = port
+        self.base_url = f"http://{host}:{port}"
+        self.api_url = f"{self.base_url}/sdrangel"
+
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size)
+        self.session.mount("http://", adapter)
+
+        self.topology = SDRangelTopology(self)
+
+    def request(self, method, path, kind = "settings", **kwargs):
+        '''
+        Method to send one request through the pooled session. The path may be a full URL or a path relative to
+        /sdrangel, and the timeout is chosen by the kind of endpoint unless one is given.
+        '''
+        url = path if path.startswith("http") else f"{self.api_url}{path}"
+        kwargs.setdefault("timeout", self.timeouts.get(kind, self.timeouts["settings"]))
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code in TOPOLOGY_STALE_CODES and kind != "instance":
+            self.topology.invalidate()
+        return response
+
+    def get(self, path, kind = "settings", **kwargs):
+        return self.request("GET", path, kind, **kwargs)
+
+    def patch(self, path, kind = "settings", **kwargs):
+        return self.request("PATCH", path, kind, **kwargs)
+
+    def post(self, path, kind = "settings", **kwargs):
+        return self.request("POST", path, kind, **kwargs)
+
+    def put(self, path, kind = "settings", **kwargs):
+        return self.request("PUT", path, kind, **kwargs)
+
+    def get_json(self, path, kind = "settings"):
+        '''
+        Method to GET a resource and return its decoded JSON, or None (with a printed message) when the request fails.
+        '''
+        try:
+            response = self.get(path, kind)
+            if response.status_code == 200:
+                return response.json()
+            print(f"Error fetching {path}: {response.status_code}")
+        except Exception as e:
+            print(f"Exception while fetching {path}: {e}")
+        return None
+
+    def close(self):
+        self.session.close()
+
+    '''
+    Instance and device accessors
+    '''
+
+    def get_instance(self):
+        '''
+        Method to obtain the full /sdrangel instance document, including the device sets and feature set.
+        '''
+        return self.get_json("", kind = "instance")
+
+    def get_devices(self, direction = 0):
+        data = self.get_json(f"/devices?direction={direction}", kind = "devices")
+        return data.get("devices", []) if data else []
+
+    def get_channels(self, direction = 0):
+        data = self.get_json(f"/channels?direction={direction}", kind = "devices")
+        return data.get("channels", []) if data else []
+
+    def get_features(self):
+        data = self.get_json("/features", kind = "devices")
+        return data.get("features", []) if data else []
+
+    '''
+    GS232Controller (Rotator Controller) accessors
+    '''
+
+    def rotator_settings_path(self, feature_index):
+        return f"/featureset/feature/{feature_index}/settings"
+
+    def rotator_report_path(self, feature_index):
+        return f"/featureset/feature/{feature_index}/report"
+
+    def get_rotator_settings(self, feature_index):
+        '''
+        Method to return the full GS232Controller settings document of the Rotator Controller feature, or None.
+        '''
+        return self.get_json(self.rotator_settings_path(feature_index))
+
+    def patch_rotator_settings(self, feature_index, settings, data = None):
+        '''
+        Method to PATCH GS232ControllerSettings to the Rotator Controller feature. The originator indices are taken
+        from a previously fetched settings document when one is given.
+        '''
+        data = data or {}
+        payload = {
+            "featureType": "GS232Controller",
+            "originatorFeatureSetIndex": data.get("originatorFeatureSetIndex", 0),
+            "originatorFeatureIndex": data.get("originatorFeatureIndex", 0),
+            "GS232ControllerSettings": settings
+        }
+        return self.patch(self.rotator_settings_path(feature_index), json = payload)
+
+    def get_rotator_report(self, feature_index):
+        '''
+        Method to return the GS232ControllerReport (current and target azimuth and elevation), or None.
+        '''
+        data = self.get_json(self.rotator_report_path(feature_index), kind = "report")
+        return data.get("GS232ControllerReport") if data else None
+
+    '''
+    RadioAstronomy channel accessors
+    '''
+
+    def astronomy_settings_path(self, channel_index, deviceset_index = 0):
+        return f"/deviceset/{deviceset_index}/channel/{channel_index}/settings"
+
+    def astronomy_actions_path(self, channel_index, deviceset_index = 0):
+        return f"/deviceset/{deviceset_index}/channel/{channel_index}/actions"
+
+    def astronomy_report_path(self, channel_index, deviceset_index = 0):
+        return f"/deviceset/{deviceset_index}/channel/{channel_index}/report"
+
+    def get_astronomy_settings(self, channel_index, deviceset_index = 0):
+        '''
+        Method to return the RadioAstronomySettings of the Radio Astronomy channel, or None.
+        '''
+        data = self.get_json(self.astronomy_settings_path(channel_index, deviceset_index))
+        return data.get("RadioAstronomySettings") if data else None
+
+    def get_astronomy_report(self, channel_index, deviceset_index = 0):
+        '''
+        Method to return the RadioAstronomyReport of the Radio Astronomy channel, or None.
+        '''
+        data = self.get_json(self.astronomy_report_path(channel_index, deviceset_index), kind = "report")
+        return data.get("RadioAstronomyReport") if data else None
+
+    def post_astronomy_action(self, channel_index, actions, deviceset_index = 0):
+        '''
+        Method to POST RadioAstronomyActions (for example {"start": {"sampleRate": 2000000}}) to the channel.
+        '''
+        payload = {"channelType": "RadioAstronomy", "direction": 0, "RadioAstronomyActions": actions}
+        return self.post(self.astronomy_actions_path(channel_index, deviceset_index), kind = "actions", json = payload)
+
+
+class GS232SettingsMirror:
+
+    def __init__(self, client, settings_url):
+        '''
+        Method to initialize a local copy of the Rotator Controller GS232ControllerSettings. The mirror is filled by one
+        full GET (refresh), then kept current by our own PATCHes and, when follow() has been called, by the settings the
+        Rotator Controller pushes through the reverse API. synced only becomes True once such a push has arrived, so
+        until SDRangel is seen to send them the settings keep being read with GETs.
+        '''
+        self.client = client
+        self.url = settings_url
+        self.lock = threading.Lock()
+        self.settings = {}
+        self.data = {"originatorFeatureSetIndex": 0, "originatorFeatureIndex": 0}
+        self.loaded = False
+        self.following = False
+        self.synced = False
+
+    def load(self, data):
+        '''
+        Method to replace the mirror with a full settings document, as returned by a GET of the settings URL.
+        '''
+        with self.lock:
+            self.settings = dict(data["GS232ControllerSettings"])
+            self.data = {
+                "originatorFeatureSetIndex": data.get("originatorFeatureSetIndex", 0),
+                "originatorFeatureIndex": data.get("originatorFeatureIndex", 0)
+            }
+            self.loaded = True
+
+    def refresh(self):
+        data = self.client.get_json(self.url)
+        if data is not None:
+            self.load(data)
+        return data
+
+    def apply_settings(self, settings):
+        '''
+        Method to merge settings pushed by the reverse API into the mirror.
+        '''
+        with self.lock:
+            self.settings.update(settings)
+            if self.following:
+                self.synced = True
+
+    def follow(self, state):
+        '''
+        Method to keep the mirror in sync with a reverse_api.RotatorState. From then on the azimuth and elevation
+        tracked by the Star Tracker are known locally and do not have to be read back before every point, as soon as
+        the first settings push has been received.
+        '''
+        self.following = True
+        state.add_settings_listener(self.apply_settings)
+        if state.settings:
+            self.apply_settings(state.settings)
+
+    def get(self, key, default = None):
+        with self.lock:
+            return self.settings.get(key, default)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.settings)
+
+    def delta(self, changes):
+        '''
+        Method to return only the keys of changes whose value differs from the mirror.
+        '''
+        with self.lock:
+            return {key: value for key, value in changes.items() if self.settings.get(key) != value}
+
+    def patch(self, changes, force = False):
+        '''
+        Method to PATCH only the changed keys to the Rotator Controller and record them in the mirror once SDRangel has
+        accepted them. Returns the response, or None when there was nothing to send.
+        '''
+        delta = dict(changes) if force else self.delta(changes)
+        if not delta:
+            return None
+        payload = {
+            "featureType": "GS232Controller",
+            "originatorFeatureSetIndex": self.data["originatorFeatureSetIndex"],
+            "originatorFeatureIndex": self.data["originatorFeatureIndex"],
+            "GS232ControllerSettings": delta
+        }
+        response = self.client.patch(self.url, json = payload)
+        if response.status_code == 200:
+            with self.lock:
+                self.settings.update(delta)
+        return response
+
+
+# One client per SDRangel instance so that every module shares the same connection pool
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(host, port):
+    '''
+    Returns the SDRangelClient shared by everything talking to the SDRangel instance at host:port, creating it on
+    first use.
+    '''
+    key = (host, int(port))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = SDRangelClient(host, port)
+            _clients[key] = client
+        return client
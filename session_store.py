@@ -0,0 +1,175 @@
+# session_store.py
+
+'''
+session_store.py keeps Radio Astronomy session logs in a columnar form so analysis does not have to parse the full
+SDRangel CSV export each time. ingest() converts a session CSV once into a directory of .npy files, one per column:
+  - numeric columns as float32 (SDRangel writes single precision powers anyway), except the positions and offsets
+    (POSITION_COLUMNS), which stay float64 since float32 would round them by about 1e-5 degrees,
+  - the 'UTC' column as parsed datetime64[ns] timestamps,
+  - text columns (such as 'Date') as categorical codes with their categories,
+and drops the columns that are empty for the whole session (Tsys0, Sν, ΩA, ... on most of ours).
+
+Every ingested session is listed in catalog.json in the store directory with its source, telescope, date, row count
+and columns. load_columns() memory-maps only the columns asked for, so reloading part of a night's data costs a file
+open per column instead of a CSV parse, and load_frame() wraps them in a DataFrame without copying them.
+read_session() loads a session from the store when it has been ingested and parses the CSV otherwise.
+
+Run as a script to ingest files: python session_store.py 2025-07-24-26West-Virgo-A-5x5-0.09-1.csv ...
+'''
+
+# Import necessary libraries
+import os
+import re
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+STORE_DIR = 'sessions'
+TIME_COLUMN = 'UTC'
+# Sky and rotator positions, kept in double precision
+POSITION_COLUMNS = {'RA', 'Dec', 'l', 'b', 'Az', 'El', 'Az (Rot)', 'El (Rot)', 'Az Off (Rot)', 'El Off (Rot)'}
+
+# 2025-07-24-26West-Virgo-A-5x5-0.09-1.csv -> date, telescope, source (the grid and run number are left out)
+SESSION_NAME = re.compile(r'^(\d{4}-\d{2}-\d{2})-(\d+(?:East|West))-(.+?)(?:-\d+x\d+.*)?(?:-\d+)?$')
+
+def parse_session_name(name):
+    '''
+    Returns (source, telescope, date) read from a session file name, with None for the parts that are not found.
+    '''
+    match = SESSION_NAME.match(name)
+    if match is None:
+        return None, None, None
+    date, telescope, source = match.groups()
+    return source, telescope, date
+
+def catalog_path(store_dir = STORE_DIR):
+    return os.path.join(store_dir, 'catalog.json')
+
+def read_catalog(store_dir = STORE_DIR):
+    '''
+    Returns the catalog as a dict of session name to entry, empty if nothing was ingested yet.
+    '''
+    path = catalog_path(store_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def write_catalog(catalog, store_dir = STORE_DIR):
+    # Written aside and renamed so an interrupted write never leaves a broken catalog
+    path = catalog_path(store_dir)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(catalog, file, indent = 1, ensure_ascii = False)
+    os.replace(path + '.tmp', path)
+
+def ingest(csv_path, store_dir = STORE_DIR, source = None, telescope = None, date = None):
+    '''
+    Method to convert one session CSV into the store. source, telescope and date default to the parts of the file name
+    (see parse_session_name). Ingesting the same file again replaces the session. Returns its catalog entry.
+    '''
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    parsed = parse_session_name(name)
+    source = source or parsed[0]
+    telescope = telescope or parsed[1]
+    date = date or parsed[2]
+
+    data = pd.read_csv(csv_path)
+    data = data.dropna(axis = 1, how = 'all')
+    session_dir = os.path.join(store_dir, name)
+    os.makedirs(session_dir, exist_ok = True)
+
+    columns = {}
+    for number, column in enumerate(data.columns):
+        values = data[column]
+        # Column names have spaces and Greek letters, so the files are numbered and named in the catalog
+        file = f"col_{number:03d}.npy"
+        entry = {"file": file}
+        if column == TIME_COLUMN:
+            array = pd.to_datetime(values, utc = True).dt.tz_localize(None).to_numpy('datetime64[ns]')
+            entry["kind"] = "time"
+        elif pd.api.types.is_numeric_dtype(values):
+            array = values.to_numpy(np.float64 if column in POSITION_COLUMNS else np.float32)
+            entry["kind"] = "float"
+        else:
+            categorical = values.astype('category')
+            array = categorical.cat.codes.to_numpy(np.int32)
+            entry["kind"] = "category"
+            entry["categories"] = [str(category) for category in categorical.cat.categories]
+        np.save(os.path.join(session_dir, file), array)
+        columns[column] = entry
+
+    if not date and TIME_COLUMN in data.columns and len(data):
+        date = str(pd.to_datetime(data[TIME_COLUMN].iloc[0], utc = True).date())
+
+    entry = {"source": source, "telescope": telescope, "date": date, "rows": len(data), "path": name,
+             "csv": os.path.abspath(csv_path), "columns": columns}
+    catalog = read_catalog(store_dir)
+    catalog[name] = entry
+    write_catalog(catalog, store_dir)
+    return entry
+
+def find_sessions(source = None, telescope = None, date = None, store_dir = STORE_DIR):
+    '''
+    Returns the names of the catalogued sessions matching every filter given, in date order.
+    '''
+    catalog = read_catalog(store_dir)
+    names = [name for name, entry in catalog.items()
+             if (source is None or entry["source"] == source) and (telescope is None or entry["telescope"] == telescope)
+             and (date is None or entry["date"] == date)]
+    return sorted(names, key = lambda name: (catalog[name]["date"] or "", name))
+
+def load_columns(session, columns = None, store_dir = STORE_DIR, catalog = None):
+    '''
+    Method to memory-map columns of a session (all stored ones by default). Returns a dict of column name to array:
+    float and datetime64 columns are read-only memory maps, categorical ones are decoded to an array of strings.
+    Raises FileNotFoundError if the session was never ingested.
+    '''
+    catalog = catalog if catalog is not None else read_catalog(store_dir)
+    if session not in catalog:
+        raise FileNotFoundError(f"Session {session} is not in the catalog of {store_dir}")
+    entry = catalog[session]
+    if columns is None:
+        columns = list(entry["columns"])
+
+    arrays = {}
+    for column in columns:
+        if column not in entry["columns"]:
+            print(f"Column {column} is not stored for session {session}")
+            continue
+        info = entry["columns"][column]
+        array = np.load(os.path.join(store_dir, entry["path"], info["file"]), mmap_mode = 'r')
+        if info["kind"] == "category":
+            array = np.asarray(info["categories"], dtype = object)[array]
+        arrays[column] = array
+    return arrays
+
+def load_frame(session, columns = None, store_dir = STORE_DIR):
+    '''
+    Returns a DataFrame of the given columns of a session, with 'UTC' as tz-aware timestamps. The columns are the memory
+    maps themselves (read-only), not copies; only 'UTC' is rebuilt. Raises FileNotFoundError for an unknown session.
+    '''
+    arrays = load_columns(session, columns, store_dir)
+    frame = pd.DataFrame(arrays, copy = False)
+    if TIME_COLUMN in frame.columns:
+        frame[TIME_COLUMN] = frame[TIME_COLUMN].dt.tz_localize('UTC')
+    return frame
+
+def read_session(path, columns = None, store_dir = STORE_DIR):
+    '''
+    Returns a session as a DataFrame: memory-mapped from the store when path is the name of an ingested session or a
+    CSV that was ingested, otherwise parsed from the CSV. Raises FileNotFoundError when it is neither.
+    '''
+    name = os.path.splitext(os.path.basename(path))[0]
+    catalog = read_catalog(store_dir)
+    if not path.endswith('.csv'):
+        return load_frame(path, columns, store_dir)
+    if name in catalog and catalog[name]["csv"] == os.path.abspath(path):
+        return load_frame(name, columns, store_dir)
+    return pd.read_csv(path, usecols = columns)
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        entry = ingest(path)
+        print(f"{path}: {entry['rows']} rows, {len(entry['columns'])} columns ({entry['source']}, "
+              f"{entry['telescope']}, {entry['date']})")
@@ -0,0 +1,122 @@
+# time_alignment.py
+
+'''
+time_alignment.py puts two time-stamped logs on the same time base, for example the DFM_Data-*.csv positions and the
+Radio Astronomy CSV saved by SDRangel. Every row of the left log gets the chosen columns of the right log interpolated
+linearly in time to its timestamp. The two right-log samples around each left time are found with ordered as-of joins
+(pandas.merge_asof backward and forward), so nothing is reindexed onto the union of both logs.
+
+Only the listed columns are interpolated, and only when the right-log samples around the left time are at most max_gap
+apart; across a longer gap (a dropped log, a pause between scans), or outside the right log, the value is NaN rather
+than a straight line through missing data.
+
+align_chunks does the same for logs too long to load at once: both logs are read in chunks and only the right-log rows
+still needed for the next left chunk are kept, so an all-night session is merged with a bounded amount of memory.
+'''
+
+# Import necessary libraries
+import numpy as np
+import pandas as pd
+
+# Every numeric Radio Astronomy column the analysis uses: the powers, the target position (Az/El are needed by
+# CSV_Analysis.add_XY_columns/add_HA_columns) and the rotator position and offsets
+SIGNAL_COLUMNS = ['Power (FFT)', 'Power (dBFS)', 'Power (dBm)', 'Tsky (K)', 'RA', 'Dec', 'l', 'b', 'Az', 'El',
+                  'Vbcrs', 'Vlsr', 'Az (Rot)', 'El (Rot)', 'Az Off (Rot)', 'El Off (Rot)']
+# Azimuths are interpolated the short way round through 0/360
+WRAPPED_COLUMNS = {'Az', 'Az (Rot)'}
+POSITION_COLUMNS = ['ha_current', 'ra_current', 'dec_current', 'lst_current']
+
+def align_frames(left, right, left_time, right_time, columns, max_gap = '5s'):
+    '''
+    Returns a copy of left with the given columns of right interpolated to the left_time of each row. Both frames must
+    be sorted by their time columns, which must be tz-aware or naive alike. max_gap is a pandas Timedelta (or string).
+    '''
+    max_gap = pd.Timedelta(max_gap)
+    aligned = left.copy()
+    times = left[[left_time]].rename(columns = {left_time: '_time'}).reset_index(drop = True)
+
+    for column in columns:
+        # Each column has its own samples, so gaps in one column do not blank the others
+        samples = right[[right_time, column]].dropna().rename(columns = {right_time: '_time'})
+        if samples.empty:
+            aligned[column] = np.nan
+            continue
+        # merge_asof needs the same timestamp resolution on both sides
+        samples['_time'] = samples['_time'].astype(times['_time'].dtype)
+        samples['_at'] = samples['_time']
+        before = pd.merge_asof(times, samples, on = '_time', direction = 'backward')
+        after = pd.merge_asof(times, samples, on = '_time', direction = 'forward')
+
+        span = (after['_at'] - before['_at']).to_numpy()
+        elapsed = (times['_time'] - before['_at']).to_numpy()
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            weight = np.where(span > pd.Timedelta(0), elapsed / span, 0.0)
+        value0 = before[column].to_numpy(float)
+        value1 = after[column].to_numpy(float)
+        if column in WRAPPED_COLUMNS:
+            value = (value0 + weight*((value1 - value0 + 180) % 360 - 180)) % 360
+        else:
+            value = value0 + weight*(value1 - value0)
+        aligned[column] = np.where(span <= max_gap.to_timedelta64(), value, np.nan)
+    return aligned
+
+def read_time_chunks(path, time_column, columns = None, chunksize = 100000):
+    '''
+    Yields chunks of a CSV with time_column parsed to UTC timestamps, reading only time_column and columns.
+    '''
+    usecols = None if columns is None else [time_column] + [c for c in columns if c != time_column]
+    for chunk in pd.read_csv(path, usecols = usecols, chunksize = chunksize, skipinitialspace = True):
+        chunk[time_column] = pd.to_datetime(chunk[time_column], utc = True)
+        yield chunk
+
+def align_chunks(left_chunks, right_chunks, left_time, right_time, columns, max_gap = '5s'):
+    '''
+    Generator version of align_frames over two iterables of chunks, both in time order. For every left chunk it reads
+    right chunks until they reach past the chunk, aligns, and keeps only the right rows from the last one at or before
+    the end of the chunk onwards. Yields the aligned left chunks.
+    '''
+    right_chunks = iter(right_chunks)
+    buffer = None
+    exhausted = False
+
+    for chunk in left_chunks:
+        if chunk.empty:
+            continue
+        chunk = chunk.sort_values(left_time)
+        end = chunk[left_time].iloc[-1]
+        while not exhausted and (buffer is None or buffer.empty or buffer[right_time].iloc[-1] < end):
+            try:
+                new = next(right_chunks).sort_values(right_time)
+            except StopIteration:
+                exhausted = True
+                break
+            buffer = new if buffer is None else pd.concat([buffer, new], ignore_index = True)
+
+        if buffer is None:
+            yield align_frames(chunk, pd.DataFrame(columns = [right_time] + list(columns)), left_time, right_time, columns,
+                               max_gap)
+            continue
+        yield align_frames(chunk, buffer, left_time, right_time, columns, max_gap)
+
+        # Keep every column's last sample at or before the end, as the next chunk may start before its next sample
+        keep = int(np.count_nonzero((buffer[right_time] <= end).to_numpy()))
+        for column in columns:
+            valid = np.flatnonzero(buffer[column].notna().to_numpy() & (buffer[right_time] <= end).to_numpy())
+            if len(valid):
+                keep = min(keep, valid[-1])
+        buffer = buffer.iloc[keep:].reset_index(drop = True)
+
+def align_csv(left_path, right_path, output_path, left_time = 'Time', right_time = 'UTC', columns = SIGNAL_COLUMNS,
+              max_gap = '5s', chunksize = 100000):
+    '''
+    Aligns two CSV logs chunk by chunk and appends the result to output_path. The defaults put the Radio Astronomy power
+    and rotator columns (right, time in 'UTC') on the DFM_Data positions (left, time in 'Time'). Returns the number of
+    rows written.
+    '''
+    left_chunks = read_time_chunks(left_path, left_time, chunksize = chunksize)
+    right_chunks = read_time_chunks(right_path, right_time, columns, chunksize)
+    rows = 0
+    for chunk in align_chunks(left_chunks, right_chunks, left_time, right_time, columns, max_gap):
+        chunk.to_csv(output_path, mode = 'w' if rows == 0 else 'a', header = rows == 0, index = False)
+        rows += len(chunk)
+    return rows